@@ -0,0 +1,85 @@
+""" pool.py measures what the pooled connections of Database.py save over opening a connection per call, as every
+handler method did before. Both sides run the same point queries and single-row pushes, each on its own scratch
+database: the pooled side's is switched to WAL by its pragmas, the fresh side's keeps sqlite's defaults, as before.
+Run as a module: 'python -m builder.benchmarks.pool --calls 2000'. """
+
+import builder.handlers.Database as db
+
+import os
+import time
+import tempfile
+import argparse
+import sqlite3 as sq
+
+
+# --- globals ---
+ROWS = 10000
+QUERY = "SELECT id, value FROM bench WHERE id = ?"
+PUSH = "INSERT OR REPLACE INTO bench VALUES (?, ?)"
+
+
+# --- functions ---
+def fresh_query(path: str, command: tuple) -> list:
+    """ a query on its own connection. """
+    connection = sq.connect(path)
+    result = connection.execute(*command).fetchall()
+    connection.close()
+    return result
+
+
+def fresh_push(path: str, command: tuple) -> None:
+    """ a one statement transaction on its own connection. """
+    connection = sq.connect(path)
+    connection.execute(*command)
+    connection.commit()
+    connection.close()
+
+
+def create(path: str) -> None:
+    """ creates and fills the scratch table on a plain connection, with sqlite's default pragmas. """
+    connection = sq.connect(path)
+    connection.execute("CREATE TABLE IF NOT EXISTS bench (id INTEGER PRIMARY KEY, value TEXT)")
+    connection.executemany(PUSH, [(i, f'value {i}') for i in range(ROWS)])
+    connection.commit()
+    connection.close()
+
+
+def measure(calls: int, call) -> float:
+    """ :return: microseconds per call of call(i), over calls calls. """
+    start = time.perf_counter()
+    for i in range(calls):
+        call(i)
+    return (time.perf_counter() - start) / calls * 10 ** 6
+
+
+def run(folder: str, calls: int) -> dict:
+    """ times queries and pushes, fresh versus pooled, each on its own database in folder.
+    :return: microseconds per call, by (operation, mode).
+    """
+    fresh, pooled = os.path.join(folder, 'fresh.db'), os.path.join(folder, 'pooled.db')
+    create(fresh)
+    create(pooled)
+    handler = db.Database(pooled)
+    results = {
+        ('query', 'fresh'): measure(calls, lambda i: fresh_query(fresh, (QUERY, (i % ROWS,)))),
+        ('query', 'pooled'): measure(calls, lambda i: handler.query((QUERY, (i % ROWS,)))),
+        ('push', 'fresh'): measure(calls, lambda i: fresh_push(fresh, (PUSH, (i % ROWS, f'fresh {i}')))),
+        ('push', 'pooled'): measure(calls, lambda i: handler.push([(PUSH, (i % ROWS, f'pooled {i}'))])),
+    }
+    db.POOL.close_all()
+    return results
+
+
+def report(results: dict) -> None:
+    for operation in ('query', 'push'):
+        fresh, pooled = results[(operation, 'fresh')], results[(operation, 'pooled')]
+        print(f"{operation:>6}: fresh {fresh:9.1f} us/call  pooled {pooled:9.1f} us/call  x{fresh / pooled:.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="times query() and push() with a connection per call vs the pool.")
+    parser.add_argument('--calls', type=int, default=2000, help="calls per measure. Default = 2000.")
+    parser.add_argument('--dir', default=None, help="where to create the scratch databases. Default: a temp folder.")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(dir=args.dir) as folder:
+        report(run(folder, args.calls))
@@ -0,0 +1,65 @@
+""" throughput.py measures how many artists per second SpotifyAPI.GET.all() gets through its thread pool. Requests are
+answered offline by a SpotifyStub with a fixed latency, so the numbers reflect the client's concurrency and the shared
+scheduler's pacing, not spotify's servers. The scheduler's rates can be raised to measure the pool alone.
+Run as a module: 'python -m builder.benchmarks.throughput --artists 20 --workers 1 4 8'. """
+
+import builder.handlers.SpotifyAPI as api
+import builder.handlers.SpotifyStub as stub
+import builder.utils.Scheduler as scheduler
+
+import time
+import argparse
+
+
+# --- functions ---
+def measure(artist_ids: list, workers: int, client: stub.SpotifyStub) -> dict:
+    """ crawls every artist with GET.all(), one after the other.
+    :param artist_ids: the artists to crawl.
+    :param workers: the GET instance's max_workers.
+    :param client: the stub answering the requests.
+    :return: the elapsed seconds, artists and requests per second, and the requests answered by endpoint.
+    """
+    getter = api.GET(spotify=client, scraper=client.html, cache_path=None, max_workers=workers)
+    client.reset_stats()
+    start = time.perf_counter()
+    for artist_id in artist_ids:
+        getter.all(artist_id)
+    elapsed = time.perf_counter() - start
+    getter.pool.shutdown()
+    requests = client.stats()
+    return {
+        'workers': workers,
+        'artists': len(artist_ids),
+        'seconds': elapsed,
+        'artists/s': len(artist_ids) / elapsed,
+        'requests/s': sum(requests.values()) / elapsed,
+        'requests': requests,
+    }
+
+
+def report(results: list) -> None:
+    """ prints one line per measure, with its speedup over the first one. """
+    base = results[0]['seconds']
+    for result in results:
+        print(f"workers={result['workers']:>3}  {result['seconds']:8.2f}s  {result['artists/s']:8.2f} artists/s  "
+              f"{result['requests/s']:8.1f} requests/s  x{base / result['seconds']:.2f}")
+    first = results[0]
+    print(f"requests per artist: { {k: v / first['artists'] for (k, v) in first['requests'].items()} }")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="measures GET.all() throughput against an offline spotify stub.")
+    parser.add_argument('--artists', type=int, default=20, help="artists to crawl per measure. Default = 20.")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, api.MAX_CONCURRENT_REQUESTS],
+                        help="max_workers values to compare.")
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per stub request. Default = 0.05.")
+    parser.add_argument('--albums', type=int, default=30, help="albums per artist. Default = 30.")
+    parser.add_argument('--tracks', type=int, default=12, help="tracks per album. Default = 12.")
+    parser.add_argument('--unpaced', action='store_true',
+                        help="lift the scheduler's rate limits, to measure the thread pool alone.")
+    args = parser.parse_args()
+    if args.unpaced:
+        scheduler.SCHEDULER = scheduler.Scheduler(rate=10 ** 6, burst=10 ** 6, endpoint_rates={})
+    client = stub.SpotifyStub(latency=args.latency, albums=args.albums, tracks=args.tracks)
+    ids = [f'ar{i:06d}' for i in range(args.artists)]
+    report([measure(ids, workers, client) for workers in args.workers])
@@ -1,14 +1,25 @@
 """ DatasetBuilder.py is a module for generating 'dataset' json files.
 The interface 'Dataset' is defined in types.d.ts """
 
+import os
 import glob
+import json
+import time
+import hashlib
 import warnings
+import argparse
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 
+import builder.handlers.Database as db
 import builder.handlers.AnalisisDB as dbAN
 import builder.handlers.ArtistasDB as dbAR
 import builder.utils.Helper as helper
+import builder.utils.Columnar as columnar
 import builder.paths as paths
 
+import numpy as np
+
 
 # --- globals ---
 ARTISTAS_DB = dbAR.ArtistasDB()
@@ -17,13 +28,68 @@ PATH = paths.artistas_dataset
 
 
 # --- functions ---
-def batch_build(path: str = PATH) -> None:
-    """ builds a dataset json for each artist in artistas db.
+def batch_build(path: str = PATH, workers: int = 1, index_path: str = paths.generated,
+                compact: bool = False, precision: int = None, compress: tuple = (), bundle: bool = False,
+                incremental: bool = False) -> None:
+    """ builds a dataset json for each artist in artistas db, loading all of them with a few set-based queries.
+    Every run records, for each generated file, the newest source 'last_updated' and a content hash in a manifest
+    file next to path.
     :param path: the relative path for the generated json files.
+    :param workers: how many processes to shard the artists across. Each one opens its own read-only database
+        handles and writes its own files. Default = 1 (no pool).
+    :param index_path: where to save the 'artist_id: artist_name' index of the built files.
+    :param compact: if true, files are minified. See helper.save_json().
+    :param precision: if given, floats are rounded to this many decimals.
+    :param compress: precompressed siblings to write next to each file. Possible: 'gz', 'br'.
+    :param bundle: if true, writes a columnar '.bin' bundle per artist instead of a json. See build_bundle().
+    :param incremental: if true, only rebuilds artists whose rows changed since the last run, and deletes the files
+        of removed artists. A change of output options or a new PCA fit rebuilds everything.
     """
-    artists = [x[0] for x in ARTISTAS_DB.query(f"SELECT {dbAR.KEYS['ARTISTS']} FROM {dbAR.TABLES['ARTISTS']};")]
-    for artist_id in artists:
-        build(artist_id, path)
+    options = {'compact': compact, 'precision': precision, 'compress': list(compress), 'bundle': bundle}
+    start = time.perf_counter()
+    stamps, pca_stamp = _source_timestamps()
+    manifest = _load_manifest(path) if incremental else {}
+    previous = {}
+    if manifest.get('options') == options and manifest.get('pca') == pca_stamp:
+        previous = manifest['artists']
+    elif incremental:
+        print(f"output options or pca changed since the last build: rebuilding everything.")
+    pending = sorted(x for x in stamps if previous.get(x, {}).get('updated') != stamps[x])
+    removed = sorted(x for x in previous if x not in stamps)
+
+    hashes = {x: previous[x]['hash'] for x in pending if x in previous}
+    if workers > 1 and pending:
+        size = -(-len(pending) // (workers * 4))  # a few shards per worker, for load balancing.
+        shards = [pending[i:i + size] for i in range(0, len(pending), size)]
+        with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+            results = list(pool.map(_build_shard, shards, repeat(path), repeat(options), repeat(hashes)))
+    elif pending:
+        full = len(pending) == len(stamps)  # an unrestricted load is cheaper than filtering by every id.
+        results = [_build_shard(None if full else pending, path, options, hashes)]
+    else:
+        results = []
+
+    artists = {x: previous[x] for x in stamps if x in previous and x not in pending}
+    sizes, written = {}, 0
+    for shard_built, shard_sizes in results:
+        for artist_id, (artist_name, content_hash) in shard_built.items():
+            written += previous.get(artist_id, {}).get('hash') != content_hash
+            artists[artist_id] = {'name': artist_name, 'updated': stamps[artist_id], 'hash': content_hash}
+        for extension, size in shard_sizes.items():
+            sizes[extension] = sizes.get(extension, 0) + size
+    for artist_id in removed:
+        for file in glob.glob(f"{path}/{artist_id}.*"):
+            os.remove(file)
+    total = ARTISTAS_DB.query(f"SELECT count({dbAR.KEYS['ARTISTS']}) FROM {dbAR.TABLES['ARTISTS']};")[0][0]
+    if len(artists) < total:
+        warnings.warn(f'skipped {total - len(artists)} artists: artist summary not in database.')
+
+    _save_manifest(path, {'options': options, 'pca': pca_stamp, 'artists': dict(sorted(artists.items()))})
+    _save_index({x: artists[x]['name'] for x in artists}, index_path)
+    print(f"built {len(pending)} datasets ({written} changed, {len(artists) - len(pending)} up to date, "
+          f"{len(removed)} removed) in {time.perf_counter() - start:.2f}s.")
+    for extension, size in sizes.items():
+        print(f"    {extension}: {size / 2**20:.1f} MB written, {size / max(written, 1) / 2**10:.1f} KB per artist.")
 
 
 def build_index(generated_path: str = PATH, path: str = paths.generated) -> None:
@@ -35,72 +101,181 @@ def build_index(generated_path: str = PATH, path: str = paths.generated) -> None
     files = glob.glob(f"{generated_path}/*.json")
     data = {}
     for file in files:
-        json = helper.load_json(file)
-        data[file[28:-5]] = json['artist_name']
-    helper.save_json(data, path, "artistas2")
+        dataset = helper.load_json(file)
+        data[file[28:-5]] = dataset['artist_name']
+    _save_index(data, path)
 
 
-def build(artist_id: str, path: str = PATH) -> None:
+def build(artist_id: str, path: str = PATH, compact: bool = False, precision: int = None, compress: tuple = ()) -> None:
     """ builds a 'dataset' json.
     :param artist_id: the artist's spotify id.
     :param path: the relative path for the generated json file.
+    :param compact: if true, the file is minified. See helper.save_json().
+    :param precision: if given, floats are rounded to this many decimals.
+    :param compress: precompressed siblings to write next to the file. Possible: 'gz', 'br'.
     """
-    artist_name = ARTISTAS_DB.query(
-        f"SELECT artist_name FROM {dbAR.TABLES['ARTISTS']} WHERE {dbAR.KEYS['ARTISTS']}  = '{artist_id}';"
-    )[0][0]
-    analisis_row = ANALISIS_DB.query(
-        f"SELECT * FROM {dbAN.TABLES['ARTISTS']} WHERE {dbAN.KEYS['ARTISTS']}  = '{artist_id}';"
-    )
-    if len(analisis_row) == 0:
+    datasets = list(_generate_data([artist_id]))
+    if len(datasets) == 0:
         warnings.warn(f'skipping {artist_id}: artist summary not in database.')
     else:
-        analisis_row = analisis_row[0]
-        data = {
+        helper.save_json(datasets[0], path, artist_id, compact, precision, compress)
+
+
+def build_bundle(path: str = paths.generated, filename: str = 'datasets', artist_ids: list = None) -> int:
+    """ builds a columnar 'DatasetBundle' (see types.d.ts and utils/Columnar.py) holding the datasets of many artists,
+    so that they can be loaded as typed arrays instead of parsed from json.
+    :param path: the relative path for the generated file.
+    :param filename: the name for the generated file, without extension.
+    :param artist_ids: optional restriction on the artists to bundle. Default: the whole corpus.
+    :return: the size in bytes of the written file.
+    """
+    columns, strings = _to_columns(_generate_data(artist_ids))
+    return columnar.write_bundle(path, filename, columns, strings, {"interface": "DatasetBundle"})
+
+
+def _init_worker() -> None:
+    global ARTISTAS_DB, ANALISIS_DB
+    ARTISTAS_DB = db.Database(paths.artistas_db, read_only=True)
+    ANALISIS_DB = db.Database(paths.analisis_db, read_only=True)
+
+
+def _build_shard(artist_ids: list or None, path: str, options: dict, hashes: dict) -> (dict, dict):
+    built, sizes = {}, {}
+    options = dict(options)
+    as_bundle = options.pop('bundle', False)
+    for data in _generate_data(artist_ids):
+        artist_id = data['artist_id']
+        content_hash = hashlib.sha1(json.dumps(data, separators=(',', ':')).encode('utf-8')).hexdigest()
+        built[artist_id] = (data['artist_name'], content_hash)
+        if hashes.get(artist_id) == content_hash:  # rows were touched, but the dataset did not change.
+            continue
+        if as_bundle:
+            columns, strings = _to_columns([data])
+            written = {'.bin': columnar.write_bundle(path, artist_id, columns, strings)}
+        else:
+            written = helper.save_json(data, path, artist_id, **options)
+        for extension, size in written.items():
+            sizes[extension] = sizes.get(extension, 0) + size
+    return built, sizes
+
+
+def _source_timestamps() -> (dict, str):
+    """ :return: the newest 'last_updated' among the rows that make up each artist's dataset, for every artist with
+    a summary, and the 'last_updated' of the current pca fit. """
+    ARTISTAS_DB.attach(ANALISIS_DB.db, 'analisis')
+    stamps = dict(ARTISTAS_DB.query(f"""
+        SELECT sources.{dbAR.KEYS['ARTISTS']}, MAX(sources.last_updated)
+        FROM (
+            SELECT {dbAR.KEYS['ARTISTS']}, last_updated FROM main.{dbAR.TABLES['ARTISTS']}
+            UNION ALL SELECT {dbAR.KEYS['ARTISTS']}, last_updated FROM main.{dbAR.TABLES['ALBUMS']}
+            UNION ALL SELECT {dbAR.KEYS['ARTISTS']}, last_updated FROM main.{dbAR.TABLES['TRACKS']}
+            UNION ALL SELECT {dbAN.KEYS['ARTISTS']}, last_updated FROM analisis.{dbAN.TABLES['ARTISTS']}
+            UNION ALL SELECT {dbAN.KEYS['ARTISTS']}, last_updated FROM analisis.{dbAN.TABLES['ALBUMS']}
+            UNION ALL SELECT {dbAN.KEYS['ARTISTS']}, last_updated FROM analisis.{dbAN.TABLES['TRACKS']}
+        ) AS sources
+        WHERE sources.{dbAR.KEYS['ARTISTS']} IN (
+            SELECT an.{dbAN.KEYS['ARTISTS']}
+            FROM analisis.{dbAN.TABLES['ARTISTS']} AS an
+            INNER JOIN main.{dbAR.TABLES['ARTISTS']} AS ar ON ar.{dbAR.KEYS['ARTISTS']} = an.{dbAN.KEYS['ARTISTS']}
+        )
+        GROUP BY sources.{dbAR.KEYS['ARTISTS']};
+    """))
+    pca_stamp = ARTISTAS_DB.query(f"SELECT MAX(last_updated) FROM analisis.{dbAN.TABLES['PCA_METADATA']};")[0][0]
+    return stamps, pca_stamp
+
+
+def _load_manifest(path: str) -> dict:
+    file = f"{os.path.dirname(path)}/{os.path.basename(path)}.manifest.json"
+    return helper.load_json(file) if os.path.exists(file) else {}
+
+
+def _save_manifest(path: str, manifest: dict) -> None:
+    helper.save_json(manifest, os.path.dirname(path), f"{os.path.basename(path)}.manifest", compact=True)
+
+
+def _save_index(index: dict, path: str) -> None:
+    helper.save_json(dict(sorted(index.items())), path, "artistas2")
+
+
+def _generate_data(artist_ids: list = None):
+    """ loads artists, albums and tracks (with their PCA coordinates) in one joined query each, attaching analisis db
+    to artistas db, and yields a 'dataset' dict for each artist that has a summary.
+    :param artist_ids: optional restriction on the artists to load. Default: all of them.
+    """
+    ARTISTAS_DB.attach(ANALISIS_DB.db, 'analisis')
+    restrict, params = "", ()
+    if artist_ids is not None:
+        restrict = f"WHERE an.{dbAN.KEYS['ARTISTS']} IN (SELECT value FROM json_each(?))"
+        params = (json.dumps(list(artist_ids)),)
+
+    artists_rows = ARTISTAS_DB.query((f"""
+        SELECT ar.artist_name, an.*
+        FROM analisis.{dbAN.TABLES['ARTISTS']} AS an
+        INNER JOIN main.{dbAR.TABLES['ARTISTS']} AS ar ON ar.{dbAR.KEYS['ARTISTS']} = an.{dbAN.KEYS['ARTISTS']}
+        {restrict};
+    """, params))
+
+    albums = {}
+    for row in ARTISTAS_DB.query((f"""
+        SELECT ar.album_name, an.*
+        FROM analisis.{dbAN.TABLES['ALBUMS']} AS an
+        INNER JOIN main.{dbAR.TABLES['ALBUMS']} AS ar ON ar.{dbAR.KEYS['ALBUMS']} = an.{dbAN.KEYS['ALBUMS']}
+        {restrict}
+        ORDER BY an.rowid;
+    """, params)):
+        albums.setdefault(row[1 + dbAN.ALBUMS['ARTIST_ID']], []).append(row)
+
+    tracks = {}
+    for row in ARTISTAS_DB.query((f"""
+        SELECT pca.{dbAN.KEYS['ALBUMS']}, pca.global_primary_component_x, pca.global_primary_component_y, ar.*
+        FROM analisis.{dbAN.TABLES['TRACKS']} AS pca
+        INNER JOIN main.{dbAR.TABLES['TRACKS']} AS ar ON ar.{dbAR.KEYS['TRACKS']} = pca.{dbAN.KEYS['TRACKS']}
+        WHERE pca.{dbAN.KEYS['ALBUMS']} IN (
+            SELECT an.{dbAN.KEYS['ALBUMS']} FROM analisis.{dbAN.TABLES['ALBUMS']} AS an {restrict}
+        )
+        ORDER BY ar.disc_number, ar.track_number, ar.rowid;
+    """, params)):
+        tracks.setdefault(row[0], []).append(row)
+
+    for row in artists_rows:
+        artist_name, analisis_row = row[0], row[1:]
+        artist_id = analisis_row[dbAN.ARTISTS['ARTIST_ID']]
+        yield {
             'artist_id': artist_id,
             'artist_name': artist_name,
             'features_summary': _build_features(analisis_row),
             'measures_summary': _build_measures(analisis_row),
             'key_counts': _build_key_counts(analisis_row),
-            'albums': _build_albums(artist_id)
+            'albums': _build_albums(albums.get(artist_id, []), tracks)
         }
-        helper.save_json(data, path, artist_id)
 
 
-def _build_albums(artist_id) -> list:
+def _build_albums(rows: list, tracks: dict) -> list:
     albums = []
-    rows = ANALISIS_DB.query(f"SELECT * FROM {dbAN.TABLES['ALBUMS']} WHERE {dbAN.KEYS['ARTISTS']}  = '{artist_id}';")
-    for i, row in enumerate(rows):
+    for row in rows:
+        album_name, row = row[0], row[1:]
         album_id = row[dbAN.ALBUMS["ALBUM_ID"]]
-        album_name = ARTISTAS_DB.query(f"""
-            SELECT album_name 
-            FROM {dbAR.TABLES["ALBUMS"]} 
-            WHERE {dbAR.KEYS["ALBUMS"]}  = '{album_id}';
-        """)[0][0]
         data = {
             'album_id': album_id,
             'album_name': album_name,
             'features_summary': _build_features(row, False),
             'measures_summary': _build_measures(row, False),
             'key_counts': _build_key_counts(row, False),
-            'tracks': _build_tracks(album_id)
+            'tracks': _build_tracks(tracks.get(album_id, []))
         }
         albums.append(data)
     return albums
 
 
-def _build_tracks(album_id: str) -> list:
+def _build_tracks(rows: list) -> list:
     tracks = []
-    rows = ANALISIS_DB.query(f"SELECT * FROM {dbAN.TABLES['TRACKS']} WHERE {dbAN.KEYS['ALBUMS']}  = '{album_id}';")
-    for track_row in rows:
-        track_id = track_row[dbAN.TRACKS["TRACK_ID"]]
-        track_artist_row = ARTISTAS_DB.query(
-            f"SELECT * FROM {dbAR.TABLES['TRACKS']} WHERE {dbAR.KEYS['TRACKS']}  = '{track_id}';"
-        )[0]
+    for row in rows:
+        x, y, track_artist_row = row[1], row[2], row[3:]
         data = {
-            'track_id': track_id,
+            'track_id': track_artist_row[dbAR.TRACKS['TRACK_ID']],
             'track_name': track_artist_row[dbAR.TRACKS['TRACK_NAME']],
-            'x': track_row[dbAN.TRACKS["GPC_X"]],
-            'y': track_row[dbAN.TRACKS["GPC_Y"]],
+            'x': x,
+            'y': y,
             'features': [
                 track_artist_row[dbAR.TRACKS['DANCEABILITY']],
                 track_artist_row[dbAR.TRACKS['ENERGY']],
@@ -122,6 +297,60 @@ def _build_tracks(album_id: str) -> list:
     return tracks
 
 
+def _to_columns(datasets) -> (dict, list):
+    """ flattens 'dataset' dicts into columns. Artists own a contiguous [album_start, album_stop) range of albums,
+    and albums a [track_start, track_stop) range of tracks. Missing values are NaN for floats and -1 for ints.
+    """
+    strings, string_ids = [], {}
+
+    def intern(text: str) -> int:
+        if text not in string_ids:
+            string_ids[text] = len(strings)
+            strings.append(text)
+        return string_ids[text]
+
+    artists, albums, tracks = [], [], []
+    for data in datasets:
+        album_start = len(albums)
+        for album in data['albums']:
+            track_start = len(tracks)
+            tracks.extend(album['tracks'])
+            albums.append((album, track_start, len(tracks)))
+        artists.append((data, album_start, len(albums)))
+
+    def floats(values) -> np.ndarray:
+        return np.array(values, dtype='float64').astype('float32')  # None -> NaN
+
+    def ints(values) -> np.ndarray:
+        return np.array([-1 if x is None else x for x in values], dtype='int8')
+
+    columns = {
+        'artist_id': np.array([intern(x[0]['artist_id']) for x in artists], dtype='int32'),
+        'artist_name': np.array([intern(x[0]['artist_name']) for x in artists], dtype='int32'),
+        'artist_album_start': np.array([x[1] for x in artists], dtype='int32'),
+        'artist_album_stop': np.array([x[2] for x in artists], dtype='int32'),
+        'artist_features_summary': floats([x[0]['features_summary'] for x in artists]).reshape(-1, 7, 8),
+        'artist_measures_summary': floats([x[0]['measures_summary'] for x in artists]).reshape(-1, 3, 8),
+        'artist_key_counts': floats([x[0]['key_counts'] for x in artists]).reshape(-1, 2, 12),
+        'album_id': np.array([intern(x[0]['album_id']) for x in albums], dtype='int32'),
+        'album_name': np.array([intern(x[0]['album_name']) for x in albums], dtype='int32'),
+        'album_track_start': np.array([x[1] for x in albums], dtype='int32'),
+        'album_track_stop': np.array([x[2] for x in albums], dtype='int32'),
+        'album_features_summary': floats([x[0]['features_summary'] for x in albums]).reshape(-1, 7, 8),
+        'album_measures_summary': floats([x[0]['measures_summary'] for x in albums]).reshape(-1, 3, 8),
+        'album_key_counts': floats([x[0]['key_counts'] for x in albums]).reshape(-1, 2, 12),
+        'track_id': np.array([intern(x['track_id']) for x in tracks], dtype='int32'),
+        'track_name': np.array([intern(x['track_name']) for x in tracks], dtype='int32'),
+        'track_x': floats([x['x'] for x in tracks]),
+        'track_y': floats([x['y'] for x in tracks]),
+        'track_features': floats([x['features'] for x in tracks]).reshape(-1, 7),
+        'track_measures': floats([x['measures'] for x in tracks]).reshape(-1, 3),
+        'track_key': ints([x['key'] for x in tracks]),
+        'track_mode': ints([x['mode'] for x in tracks])
+    }
+    return columns, strings
+
+
 def _build_features(row: tuple, from_artists: bool = True) -> list:
     table = dbAN.ARTISTS if from_artists else dbAN.ALBUMS
     return [
@@ -266,3 +495,20 @@ def _build_key_counts(row: tuple, from_artists: bool = True) -> list:
             row[table["KEY_COUNT_BB_MAYOR"]]
         ]
     ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="builds a 'dataset' json file for every artist.")
+    parser.add_argument('--workers', type=int, default=1, help="number of worker processes. Default = 1.")
+    parser.add_argument('--path', default=PATH, help="where to write the dataset files.")
+    parser.add_argument('--compact', action='store_true', help="write minified json.")
+    parser.add_argument('--precision', type=int, default=None, help="round floats to this many decimals.")
+    parser.add_argument('--compress', nargs='*', default=(), choices=['gz', 'br'], help="precompressed siblings.")
+    parser.add_argument('--bundle', action='store_true', help="write a '.bin' bundle per artist instead of json.")
+    parser.add_argument('--corpus', action='store_true', help="also write a single bundle for the whole corpus.")
+    parser.add_argument('--incremental', action='store_true', help="only rebuild artists that changed.")
+    args = parser.parse_args()
+    batch_build(args.path, args.workers, compact=args.compact, precision=args.precision, compress=tuple(args.compress),
+                bundle=args.bundle, incremental=args.incremental)
+    if args.corpus:
+        build_bundle()
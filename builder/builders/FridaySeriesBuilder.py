@@ -1,6 +1,5 @@
 """ FridaySeriesBuilder.py is a module for generating a friday release frecuency series json file.
 The interface 'FridaySeries' is defined in types.d.ts """
-import datetime
 
 import builder.handlers.ArtistasDB as dbAR
 import builder.utils.Stats as stats
@@ -22,19 +21,14 @@ def build(path: str = PATH, start='2013-01-01', stop='2021-12-31', grouping='1M'
 
 def _generate_data(start='2013-01-01', stop='2021-12-31', grouping='1M', precision='day'):
     command = f"""
-        SELECT release_date FROM {dbAR.TABLES['ALBUMS']}
+        SELECT epoch_day, weekday FROM {dbAR.TABLES['FACTS']}
         WHERE
-            release_date >= '{start}' AND
-            release_date <  '{stop}'  AND
-            release_date_precision = '{precision}';
+            epoch_day >= {stats.epoch_day(start)} AND
+            epoch_day <  {stats.epoch_day(stop)}  AND
+            release_date_precision = '{precision}' AND
+            track_id IS NULL;
     """
-    df = DBAR.to_dataframe(command)
-    stats.to_datetime(df)
-    series = stats.groupby_date(df, grouping=grouping)['release_date']
-    friday_series = []
-    for group in series:
-        fridays = 0
-        for date in group[1]:
-            fridays += date.weekday() == 4
-        friday_series.append(fridays / len(group[1]))
-    return friday_series
+    df = DBAR.to_dataframe(command, dtypes=dbAR.DTYPES['INTS'])
+    stats.from_epoch_days(df)
+    df['friday'] = (df['weekday'] == 5).fillna(False).astype(bool)  # ISO weekday. Nullable ints compare to NA.
+    return stats.date_series(df, {'friday': ('friday', 'ratio')}, grouping=grouping)['friday']
@@ -291,6 +291,12 @@ GENRES = {
 }  # clasificación de generos manual (27/01/22)
 
 
+SUBGENRES = {}  # inverted index: subgenre -> parent genre. A subgenre listed twice belongs to its first genre.
+for _genre, _subgenres in GENRES.items():
+    for _subgenre in _subgenres:
+        SUBGENRES.setdefault(_subgenre, _genre)
+
+
 def build(path: str = paths.generated):
     genres = _generate_data()
     represented = DBAR.query(f"SELECT count(DISTINCT {dbAR.KEYS['ARTISTS']}) FROM {dbAR.TABLES['TRACKS']}")[0][0]
@@ -304,24 +310,22 @@ def build(path: str = paths.generated):
 
 
 def _generate_data() -> dict:
-    df = DBAR.to_dataframe(f"""
-        SELECT * 
-        FROM {dbAR.TABLES['TRACKS']}
-    """)
-    res = {k: {"subgenres": v, "total": 0} for (k, v) in GENRES.items()}
-    artists = df.groupby('artist_id')
-    for name, artist in artists:  # RIP
-        set_genres = []
-        for subgenre in artist['genre']:
-            for _genre in res:
-                done = False
-                for _subgenre in res[_genre]["subgenres"]:
-                    if subgenre == _subgenre:
-                        if _genre not in set_genres:
-                            res[_genre]["total"] += 1
-                            set_genres.append(_genre)
-                        done = True
-                        break
-                if done:
-                    break
-    return res
+    """ counts, for each genre, the distinct artists (among those with tracks) with at least one of its subgenres. """
+    _store_taxonomy()
+    counts = dict(DBAR.query(f"""
+        SELECT t.genre, count(DISTINCT g.{dbAR.KEYS['GENRES']})
+        FROM {dbAR.TABLES['GENRES']} g
+        INNER JOIN {dbAR.TABLES['TAXONOMY']} t ON t.{dbAR.KEYS['TAXONOMY']} = g.genre
+        WHERE g.{dbAR.KEYS['GENRES']} IN (SELECT {dbAR.KEYS['ARTISTS']} FROM {dbAR.TABLES['TRACKS']})
+        GROUP BY t.genre
+    """))
+    return {k: {"subgenres": v, "total": counts.get(k, 0)} for (k, v) in GENRES.items()}
+
+
+def _store_taxonomy() -> None:
+    """ replaces the stored taxonomy with SUBGENRES, if they differ. """
+    stored = dict(DBAR.query(f"SELECT {dbAR.KEYS['TAXONOMY']}, genre FROM {dbAR.TABLES['TAXONOMY']}"))
+    if stored != SUBGENRES:
+        DBAR.push_many([f"DELETE FROM {dbAR.TABLES['TAXONOMY']}"] + [
+            (f"INSERT INTO {dbAR.TABLES['TAXONOMY']} VALUES (?, ?)", x) for x in SUBGENRES.items()
+        ])
@@ -1,6 +1,8 @@
 """ HistogramBuilder.py is a module for generating 'histogram' json files.
 The interface 'AttributeHistogram' is defined in types.d.ts """
 
+import numpy as np
+
 import builder.handlers.ArtistasDB as dbAR
 import builder.handlers.AnalisisDB as dbAN
 import builder.utils.Helper as helper
@@ -10,94 +12,111 @@ import builder.paths as paths
 DBAR = dbAR.ArtistasDB()
 DBAN = dbAN.AnalisisDB()
 PATH = paths.artistas_histograms
+CHUNK_SIZE = 100000  # tracks loaded at once.
+
+FEATURE_BINS = [x / 20 for x in range(21)]
+LOUDNESS_BINS = [x for x in range(-36, 7)]
+DURATION_BINS = [x for x in range(0, 605000, 5000)]
+TEMPO_BINS = [x for x in range(40, 221, 5)]
+KEY_BINS = [x for x in range(13)]
+MODE_BINS = [0, 1, 2]
 
 
 def batch_build(path: str = PATH):
     """builds 2018 - 2021 features, measures, and tonality density histogram datasets"""
-    batch_build_features(path)
-    batch_build_measures(path)
-    build_tonality(path)
+    histograms = _generate_data({
+        **{x: FEATURE_BINS for x in dbAN.FEATURES},
+        'loudness': LOUDNESS_BINS, 'duration_ms': DURATION_BINS, 'tempo': TEMPO_BINS, 'key': KEY_BINS
+    }, 2018, 2022)
+    batch_build_features(path, histograms)
+    batch_build_measures(path, histograms)
+    build_tonality(path, histograms)
 
 
-def batch_build_features(path: str = PATH):
+def batch_build_features(path: str = PATH, histograms: dict = None):
     """builds 2018 - 2021 'feature' density histogram datasets for all features."""
+    if histograms is None:
+        histograms = _generate_data({x: FEATURE_BINS for x in dbAN.FEATURES}, 2018, 2022)
     for feature in dbAN.FEATURES:
-        build_features(feature, path)
+        build_features(feature, path, histograms)
 
 
-def batch_build_measures(path: str = PATH):
+def batch_build_measures(path: str = PATH, histograms: dict = None):
     """builds 2018 - 2021 'measure' density histogram datasets for all measures."""
-    build_loudness(path)
-    build_duration(path)
-    build_tempo(path)
+    if histograms is None:
+        histograms = _generate_data({
+            'loudness': LOUDNESS_BINS, 'duration_ms': DURATION_BINS, 'tempo': TEMPO_BINS
+        }, 2018, 2022)
+    build_loudness(path, histograms)
+    build_duration(path, histograms)
+    build_tempo(path, histograms)
 
 
-def build_tonality(path: str = PATH):
+def build_tonality(path: str = PATH, histograms: dict = None):
     """builds 2018 - 2021 key density histogram datasets"""
     def order(x: list) -> list:
         return [x[(5 + 7 * i) % 12] for i in range(12)]
 
     build('key',
           start_y=2018, stop_y=2022,
-          bins=[x for x in range(13)],
+          bins=KEY_BINS,
           labels=order(dbAN.TONALITY),
           colors=["#0000ff", "#ff00ff", "#ffff00", "#ff0000"],
           hidden=[False, True, True, False],
           order_fn=lambda x: order(x),
-          path=path)
+          path=path, histograms=histograms)
 
 
-def build_mode(path: str = PATH):
+def build_mode(path: str = PATH, histograms: dict = None):
     """builds 2018 - 2021 mode density histogram datasets"""
     build("mode",
           start_y=2018, stop_y=2022,
-          bins=[0, 1, 2],
+          bins=MODE_BINS,
           labels=['menor', 'mayor'],
           colors=["#0000ff", "#ff00ff", "#ffff00", "#ff0000"],
           hidden=[False, True, True, False],
-          path=path)
+          path=path, histograms=histograms)
 
 
-def build_features(feature: str, path: str = PATH):
+def build_features(feature: str, path: str = PATH, histograms: dict = None):
     """builds 2018 - 2021 'feature' density histogram datasets"""
     build(feature,
           start_y=2018, stop_y=2022,
-          bins=[x / 20 for x in range(21)],
+          bins=FEATURE_BINS,
           colors=["#0000ff", "#ff00ff", "#ffff00", "#ff0000"],
           hidden=[False, True, True, False],
-          path=path)
+          path=path, histograms=histograms)
 
 
-def build_loudness(path: str = PATH):
+def build_loudness(path: str = PATH, histograms: dict = None):
     """builds 2018 - 2021 loudness density histogram datasets"""
     build('loudness',
           start_y=2018, stop_y=2022,
-          bins=[x for x in range(-36, 7)],
+          bins=LOUDNESS_BINS,
           colors=["#0000ff", "#ff00ff", "#ffff00", "#ff0000"],
           hidden=[False, True, True, False],
-          path=path)
+          path=path, histograms=histograms)
 
 
-def build_duration(path: str = PATH):
+def build_duration(path: str = PATH, histograms: dict = None):
     """builds 2018 - 2021 duration_ms density histogram datasets"""
-    bins = [x for x in range(0, 605000, 5000)]
     build('duration_ms',
-          bins=bins,
+          bins=DURATION_BINS,
           start_y=2018, stop_y=2022,
-          labels=[str(round(x/1000)) + 's' for x in bins],
+          labels=[str(round(x/1000)) + 's' for x in DURATION_BINS],
           colors=["#0000ff", "#ff00ff", "#ffff00", "#ff0000"],
           hidden=[False, True, True, False],
-          path=path)
+          path=path, histograms=histograms)
 
 
-def build_tempo(path: str = PATH):
+def build_tempo(path: str = PATH, histograms: dict = None):
     """builds 2018 - 2021 tempo density histogram datasets"""
     build('tempo',
-          bins=[x for x in range(40, 221, 5)],
+          bins=TEMPO_BINS,
           start_y=2018, stop_y=2022,
           colors=["#0000ff", "#ff00ff", "#ffff00", "#ff0000"],
           hidden=[False, True, True, False],
-          path=path)
+          path=path, histograms=histograms)
 
 
 def build(track_attribute: str,
@@ -105,7 +124,8 @@ def build(track_attribute: str,
           bins: list or int or str = 'auto',
           labels: list = None, colors: list = None, hidden: list = None,
           order_fn=None,
-          path: str = PATH
+          path: str = PATH,
+          histograms: dict = None
           ):
     """ builds a multi-year 'histograms' json. Ie. a set of yearly density histogram datasets.
 
@@ -119,16 +139,18 @@ def build(track_attribute: str,
     :param hidden: optional setting for chart js on-load visibility. A bool value for each year.
     :param order_fn: optional reordering function for categorical histograms.
     :param path: relative path where to store the json file.
+    :param histograms: optional _generate_data() result that includes track_attribute, with the same bins and years.
+        Default: calculated here.
     """
     print(f"building {track_attribute}.json")
+    if histograms is None or track_attribute not in histograms:
+        histograms = _generate_data({track_attribute: bins}, start_y, stop_y)
     data = {
         "labels": labels if labels else bins if isinstance(bins, list) else None,
         "data": {}
     }
     used_bins = []
-    for year in range(start_y, stop_y):
-        hist, used_bins = _generate_data(track_attribute, bins, str(year), str(year + 1), density=False)
-        hist_density = _generate_data(track_attribute, bins, str(year), str(year + 1))[0]
+    for year, (hist, hist_density, used_bins) in histograms[track_attribute].items():
         data['data'][year] = {
             "hist": order_fn(hist) if order_fn else hist,
             "hist_density": order_fn(hist_density) if order_fn else hist_density,
@@ -141,19 +163,66 @@ def build(track_attribute: str,
     helper.save_json(data, path, track_attribute)
 
 
-def _generate_data(track_attribute: str, bins: list or str or int,
-                   start: str, stop: str,
-                   density: bool = True) -> tuple:
-    df = DBAR.to_dataframe(
-        f"""
-            SELECT * 
-            FROM {dbAR.TABLES['TRACKS']} LEFT JOIN {dbAR.TABLES['ALBUMS']} 
-            ON   {dbAR.TABLES['TRACKS']}.{dbAR.KEYS['ALBUMS']} = {dbAR.TABLES['ALBUMS']}.{dbAR.KEYS['ALBUMS']} 
-            WHERE release_date >= '{start}' AND release_date < '{stop}'
-        """
-    )
-    values, bins = stats.hist(df, track_attribute, bins, density)
-    if density:
-        total = sum(values)
-        values = [round(x/total, 4) for x in values]
-    return values, bins
+def _load(track_attributes: list, start_y: int, stop_y: int, chunksize: int = CHUNK_SIZE):
+    """ yields, in chunks of chunksize rows, the given tracks' columns and their release year, for the tracks released
+    in [start_y, stop_y), from the release facts. Integer columns are compact; REAL ones stay float64, as they are
+    compared to exact edges. """
+    columns = ', '.join(dict.fromkeys(track_attributes))
+    return DBAR.to_dataframe(f"""
+        SELECT year, {columns} FROM {dbAR.TABLES['FACTS']}
+        WHERE
+            epoch_day >= {stats.epoch_day(str(start_y))} AND
+            epoch_day <  {stats.epoch_day(str(stop_y))}  AND
+            track_id IS NOT NULL
+    """, dtypes=dbAR.DTYPES['INTS'], chunksize=chunksize)
+
+
+def _generate_data(bins: dict, start_y: int, stop_y: int, chunksize: int = CHUNK_SIZE) -> dict:
+    """ calculates yearly histograms of tracks' attributes, both as counts and as rounded densities, in a single pass
+    over the tracks.
+    :param bins: track attribute: numpy's histogram bins pairs. A list of edges is shared by every year, and the tracks
+        are binned chunk by chunk. Anything else ('auto', an amount of bins) is resolved by numpy for each year, which
+        needs every value of the attribute at once.
+    :param start_y: starting year (inclusive)
+    :param stop_y: ending year (exclusive)
+    :param chunksize: the amount of tracks loaded at once.
+    :return: track attribute: {year: (counts, densities, used bins)} pairs.
+    """
+    n_years = stop_y - start_y
+    edges = {k: np.asarray(v) for (k, v) in bins.items() if isinstance(v, list)}
+    counts = {k: np.zeros(n_years * (len(v) - 1), dtype=int) for (k, v) in edges.items()}
+    values = {k: [] for k in bins if k not in edges}
+    for df in _load(list(bins), start_y, stop_y, chunksize):
+        years = df['year'].to_numpy(dtype=int) - start_y
+        for attribute in bins:
+            column = df[attribute].to_numpy(dtype=float, na_value=np.nan)
+            keep = ~np.isnan(column) & (years >= 0) & (years < n_years)
+            if attribute in values:
+                values[attribute].append((column[keep], years[keep]))
+                continue
+            n_bins = len(edges[attribute]) - 1
+            index = np.searchsorted(edges[attribute], column[keep], side='right') - 1
+            index[column[keep] == edges[attribute][-1]] = n_bins - 1  # the last bin is closed: [a, b].
+            inside = (index >= 0) & (index < n_bins)
+            counts[attribute] += np.bincount(
+                years[keep][inside] * n_bins + index[inside], minlength=n_years * n_bins
+            )
+
+    res = {}
+    for attribute in bins:
+        if attribute in edges:
+            n_bins = len(edges[attribute]) - 1
+            yearly = [
+                (counts[attribute][i * n_bins:(i + 1) * n_bins], edges[attribute]) for i in range(n_years)
+            ]
+        else:
+            column = np.concatenate([x[0] for x in values[attribute]] or [np.empty(0)])
+            years = np.concatenate([x[1] for x in values[attribute]] or [np.empty(0, dtype=int)])
+            yearly = [np.histogram(column[years == i], bins=bins[attribute]) for i in range(n_years)]
+        res[attribute] = {}
+        for i, (count, used_bins) in enumerate(yearly):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                density = (count / np.diff(used_bins).astype(float) / count.sum()).tolist()
+            total = sum(density)
+            res[attribute][start_y + i] = (count.tolist(), [round(x/total, 4) for x in density], used_bins.tolist())
+    return res
@@ -0,0 +1,94 @@
+""" IndexCheck.py is a module for checking that every builder query reads its tables through indexes. It runs each
+builder's data generation while tracing the statements sent to the databases, then looks at their query plans.
+Run as a module: 'python -m builder.builders.IndexCheck'. """
+
+import re
+import sys
+import warnings
+
+import builder.handlers.Database as db
+import builder.handlers.ArtistasDB as dbAR
+import builder.handlers.AnalisisDB as dbAN
+import builder.paths as paths
+
+import builder.builders.DatasetBuilder as datasetB
+import builder.builders.GenresBuilder as genresB
+import builder.builders.HistogramBuilder as histogramB
+import builder.builders.PopularityBuilder as popularityB
+import builder.builders.ReleaseSeriesBuilder as releaseSB
+import builder.builders.TonalitySeries as tonalitySB
+import builder.builders.FridaySeriesBuilder as fridaySB
+import builder.builders.invitedArtistsBuilder as invitedSB
+
+
+# --- globals ---
+DATABASES = [paths.artistas_db, paths.analisis_db, paths.invited_db]
+_SELECT = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+_INTERNAL = re.compile(r'sqlite_master|sqlite_schema|pragma_', re.IGNORECASE)
+
+
+# --- functions ---
+def check(verbose: bool = True) -> (dict, dict):
+    """ runs every builder's queries and checks their plans.
+    :param verbose: if true, prints the plan of every offending query.
+    :return: offending statement: full table scans pairs, empty if every query uses an index, and failed builder:
+        error pairs, empty if every builder ran. The check passes only if both are empty.
+    """
+    traced = []
+    handlers = {path: db.Database(path) for path in DATABASES}
+    for path, handler in handlers.items():
+        handler.trace(lambda statement, path=path: traced.append((path, statement)))
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            failed = _run_builders()
+    finally:
+        for handler in handlers.values():
+            handler.trace(None)
+
+    offending = {}
+    for path, statement in dict.fromkeys(traced):
+        if not _SELECT.match(statement) or _INTERNAL.search(statement):
+            continue
+        scans = handlers[path].full_scans(statement)
+        if scans:
+            offending[statement] = scans
+            if verbose:
+                print(f"{path}: full table scan {scans} in:\n{statement.strip()}\n")
+    if verbose:
+        print(f"checked {len(set(traced))} statements: {len(offending)} without index, {len(failed)} of "
+              f"{len(BUILDERS)} builders failed.")
+    return offending, failed
+
+
+def _run_builders() -> dict:
+    """ runs each builder's data generation. A builder that fails is reported, the queries it ran are still checked.
+    :return: failed builder: error pairs.
+    """
+    failed = {}
+    for name, generate in BUILDERS.items():
+        try:
+            generate()
+        except Exception as e:
+            print(f"{name} failed: {type(e).__name__}: {e}")
+            failed[name] = e
+    return failed
+
+
+BUILDERS = {
+    'dataset': lambda: next(datasetB._generate_data(), None),
+    'genres': lambda: genresB._generate_data(),
+    'histogram': lambda: histogramB._generate_data({'energy': histogramB.FEATURE_BINS}, 2018, 2019),
+    'popularity': lambda: popularityB._generate_data([0, 10 ** 3, 10 ** 9]),
+    'release series': lambda: releaseSB._generate_data(),
+    'tonality series': lambda: tonalitySB._generate_data(),
+    'friday series': lambda: fridaySB._generate_data(),
+    'invited series': lambda: invitedSB._generate_data()
+}
+
+
+if __name__ == '__main__':
+    dbAR.ArtistasDB().migrate()
+    dbAN.AnalisisDB().migrate()
+    offending, failed = check()
+    sys.exit(1 if offending or failed else 0)
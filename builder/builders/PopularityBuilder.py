@@ -12,6 +12,7 @@ import builder.paths as paths
 DBAR = dbAR.ArtistasDB()
 DBAN = dbAN.AnalisisDB()
 PATH = paths.generated
+CHUNK_SIZE = 100000  # artists loaded at once.
 
 COLORS = ['#f42d3c', '#e22735', '#d0212d', '#bf1b26', '#ae161f', '#9d1018', '#8d0912', '#7d040a', '#6d0000']
 
@@ -27,26 +28,27 @@ def build(path: str = PATH):
             bins.index(1000000), bins.index(10000000), len(bins) - 1]
     colors = list(np.concatenate([[COLORS[i - 1]] * (idxs[i] - idxs[i - 1]) for i in range(1, 9)]))
 
+    hist, hist_density = _generate_data(bins)
     data = {
         "labels": bins,
         "data": {
-            "hist": _generate_data(bins, density=False)[0],
-            "hist_density": _generate_data(bins)[0],
+            "hist": hist,
+            "hist_density": hist_density,
             "color": colors
         }
     }
     helper.save_json(data, path, 'followersDist')
 
 
-def _generate_data(bins, density: bool = True) -> tuple:
-    df = DBAR.to_dataframe(
-        f"""
-            SELECT * 
-            FROM {dbAR.TABLES['ARTISTS']}
-        """
-    )
-    values, bins = stats.hist(df, 'followers', bins)
-    if density:
-        total = sum(values)
-        values = [round(x/total, 4) for x in values]
-    return values, bins
+def _generate_data(bins: list, chunksize: int = CHUNK_SIZE) -> tuple:
+    """ calculates the followers' histogram, loading only the followers column, chunk by chunk.
+    :param bins: the edges of the histogram.
+    :param chunksize: the amount of artists loaded at once.
+    :return: the counts and their rounded densities.
+    """
+    values = [0] * (len(bins) - 1)
+    chunks = DBAR.to_dataframe(f"SELECT followers FROM {dbAR.TABLES['ARTISTS']}", chunksize=chunksize)
+    for df in chunks:
+        values = [x + y for (x, y) in zip(values, stats.hist(df, 'followers', bins)[0])]
+    total = sum(values)
+    return values, [round(x/total, 4) for x in values]
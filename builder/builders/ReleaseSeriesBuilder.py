@@ -11,24 +11,29 @@ PATH = paths.generated
 
 
 def build(path: str = PATH, start='2013-01-01', stop='2021-12-31', grouping='1M', precision='day') -> None:
+    releases = _generate_data(start, stop, ('album', 'single'), grouping, precision)
     series = {
-        "albumes":  _generate_data(start, stop, 'album', grouping, precision),
-        "singles": _generate_data(start, stop, 'single', grouping, precision),
+        "albumes":  releases['album'],
+        "singles": releases['single'],
         "labels":  stats.date_range(start, stop, grouping)
     }
     helper.save_json(series, path, 'releaseSeries')
 
 
-def _generate_data(start='2000-01-01', stop='2021-12-31', album_type='single', grouping='1M', precision='day'):
+def _generate_data(start='2000-01-01', stop='2021-12-31', album_types=('album', 'single'), grouping='1M',
+                   precision='day') -> dict:
+    """ :return: album_type: monthly release count pairs. Each type's series spans its own release dates. """
+    types = ', '.join(f"'{x}'" for x in album_types)
     command = f"""
-        SELECT release_date FROM {dbAR.TABLES['ALBUMS']}
+        SELECT album_type, epoch_day FROM {dbAR.TABLES['FACTS']}
         WHERE
-            album_type   = '{album_type}' AND
-            release_date >= '{start}'     AND
-            release_date <  '{stop}'      AND
-            release_date_precision = '{precision}';
+            album_type IN ({types}) AND
+            epoch_day >= {stats.epoch_day(start)} AND
+            epoch_day <  {stats.epoch_day(stop)}  AND
+            release_date_precision = '{precision}' AND
+            track_id IS NULL;
     """
-    df = DBAR.to_dataframe(command)
-    stats.to_datetime(df)
-    series = stats.groupby_date(df, grouping=grouping)['release_date'].count()
-    return series.tolist()
+    df = DBAR.to_dataframe(command, dtypes=dbAR.DTYPES['INTS'])
+    stats.from_epoch_days(df)
+    series = stats.date_series(df, {'releases': ('release_date', 'count')}, grouping=grouping, by='album_type')
+    return {x: series[x]['releases'] if x in series else [] for x in album_types}
@@ -30,13 +30,13 @@ def build(path: str = PATH):
 
 def _generate_data(start='2000-01-01', stop='2022', grouping='1Y'):
     df = DBAR.to_dataframe(f"""
-        SELECT release_date, key
-        FROM {dbAR.TABLES['TRACKS']} 
-        INNER JOIN {dbAR.TABLES['ALBUMS']} 
-        ON {dbAR.TABLES['TRACKS']}.{dbAR.KEYS['ALBUMS']} = {dbAR.TABLES['ALBUMS']}.{dbAR.KEYS['ALBUMS']}
-        WHERE release_date >= '{start}' AND release_date < '{stop}';   
-    """)
-    stats.to_datetime(df)
+        SELECT epoch_day, key FROM {dbAR.TABLES['FACTS']}
+        WHERE
+            epoch_day >= {stats.epoch_day(start)} AND
+            epoch_day <  {stats.epoch_day(stop)}  AND
+            track_id IS NOT NULL;
+    """, dtypes=dbAR.DTYPES['INTS'])
+    stats.from_epoch_days(df)
 
     counts = []
     # conseguir cantidades:
@@ -1,15 +1,12 @@
 """ InvitedSeriesBuilder.py is a module for generating a invited-artists release frecuency series json file.
 The interface 'InvitedSeries' is defined in types.d.ts """
-import datetime
 
-import builder.handlers.invitedDB as dbIN
+import builder.handlers.ArtistasDB as dbAR
 import builder.utils.Stats as stats
 import builder.utils.Helper as helper
 import builder.paths as paths
-import sqlite3 as sq
-import pandas as pd
 
-DBIN = dbIN.InvitedDB()
+DBAR = dbAR.ArtistasDB()
 PATH = paths.generated
 
 
@@ -23,24 +20,15 @@ def build(path: str = PATH, start='2013-01-01', stop='2021-12-31', grouping='1M'
 
 
 def _generate_data(start='2013-01-01', stop='2021-12-31', grouping='1M', precision='day'):
-    db = sq.connect(DBIN.db)
-    db.execute(f"ATTACH '{paths.artistas_db}' AS adb")
-    df = pd.read_sql(f"""
-        SELECT release_date, n_invited 
-        FROM invitedArtists 
-        LEFT JOIN adb.albums ON adb.albums.album_id = invitedArtists.album_id
+    df = DBAR.to_dataframe(f"""
+        SELECT epoch_day, n_invited FROM {dbAR.TABLES['FACTS']}
         WHERE
-            release_date >= '{start}' AND
-            release_date <  '{stop}'  AND
-            release_date_precision = '{precision}';
-    """, db)
-    db.close()
-    stats.to_datetime(df)
-    series = stats.groupby_date(df, grouping=grouping)["n_invited"]
-    invited_series = []
-    for group in series:
-        invited_an_artist = 0
-        for date in group[1]:
-            invited_an_artist += date > 0
-        invited_series.append(invited_an_artist / len(group[1]))
-    return invited_series
+            epoch_day >= {stats.epoch_day(start)} AND
+            epoch_day <  {stats.epoch_day(stop)}  AND
+            release_date_precision = '{precision}' AND
+            track_id IS NULL AND
+            n_invited IS NOT NULL;
+    """, dtypes=dbAR.DTYPES['INTS'])
+    stats.from_epoch_days(df)
+    df['invited'] = (df['n_invited'] > 0).fillna(False).astype(bool)
+    return stats.date_series(df, {'invited': ('invited', 'ratio')}, grouping=grouping)['invited']
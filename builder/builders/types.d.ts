@@ -26,6 +26,34 @@ declare interface Dataset {
 }
 
 
+// a columnar version of Dataset[]. See builder/utils/Columnar.py for the file layout. String columns hold indexes into
+// the bundle's string table, and artists / albums own [start, stop) ranges of albums / tracks.
+declare interface DatasetBundle {
+    artist_id: Int32Array,
+    artist_name: Int32Array,
+    artist_album_start: Int32Array,
+    artist_album_stop: Int32Array,
+    artist_features_summary: Float32Array,  // [n, 7, 8]
+    artist_measures_summary: Float32Array,  // [n, 3, 8]
+    artist_key_counts: Float32Array,        // [n, 2, 12]
+    album_id: Int32Array,
+    album_name: Int32Array,
+    album_track_start: Int32Array,
+    album_track_stop: Int32Array,
+    album_features_summary: Float32Array,   // [n, 7, 8]
+    album_measures_summary: Float32Array,   // [n, 3, 8]
+    album_key_counts: Float32Array,         // [n, 2, 12]
+    track_id: Int32Array,
+    track_name: Int32Array,
+    track_x: Float32Array,
+    track_y: Float32Array,
+    track_features: Float32Array,           // [n, 7]
+    track_measures: Float32Array,           // [n, 3]
+    track_key: Int8Array,                   // -1 if missing
+    track_mode: Int8Array                   // -1 if missing
+}
+
+
 declare interface AttributeHistogram {
     labels: (string | number)[]
     data: {
@@ -1,11 +1,15 @@
 """ AnalisisDB serves as a handler for the 'analisis' database schema. """
 
+import os
+import json
+
 import builder.paths as paths
 import builder.handlers.Database as db
 import builder.handlers.ArtistasDB as arDB
 import builder.utils.Helper as helper
 import builder.utils.Stats as stats
 
+import numpy as np
 import pandas as pd
 
 # --- globals ---
@@ -15,6 +19,10 @@ CATEGORIES = ['key', 'mode', 'time_signature']
 TONALITY = ['C', 'C#Db', 'D', 'D#Eb', 'E', 'F', 'F#Gb', 'G', 'G#Ab', 'A', 'A#Bb', 'B']
 MODE = ['minor', 'mayor']
 TIME_SIGNATURE = [1, 2, 3, 4, 5]
+PCA_CHUNK_SIZE = 50000  # tracks per chunk when fitting and projecting the pca.
+PCA_DRIFT = 0.1  # refit once a feature's mean moved, or its std changed, by this fraction of the fitted std.
+SUMMARY_STATS = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']  # as describe() names them.
+ROUNDING_MARGIN = 1e-4  # scaled distance to a rounding boundary within which summaries are computed exactly.
 
 
 # --- enums ---
@@ -22,6 +30,7 @@ TABLES = {
     "ARTISTS": 'artists',
     "ALBUMS": 'albums',
     "PCA_METADATA": 'pca_metadata',
+    "PCA_MODEL": 'pca_model',
     "TRACKS": 'tracks'
 }
 
@@ -29,6 +38,7 @@ KEYS = {
     "ARTISTS": 'artist_id',
     "ALBUMS": 'album_id',
     "PCA_METADATA": None,
+    "PCA_MODEL": 'feature',
     "TRACKS": 'track_id'
 }
 
@@ -278,16 +288,14 @@ ALBUMS = {
 }
 
 TRACKS = {
-    "INDEX": 0,
+    "ARTIST_ID": 0,
+    "ALBUM_ID": 1,
+    "TRACK_ID": 2,
 
-    "ARTIST_ID": 1,
-    "ALBUM_ID": 2,
-    "TRACK_ID": 3,
-    
-    "GPC_X": 4,
-    "GPC_Y": 5,
+    "GPC_X": 3,
+    "GPC_Y": 4,
 
-    "LAST_UPDATED": 6
+    "LAST_UPDATED": 5
 }
 
 PCA_METADATA = {
@@ -297,6 +305,77 @@ PCA_METADATA = {
     "LAST_UPDATED": 2
 }
 
+PCA_MODEL = {  # one row per FEATURES + MEASURES column.
+    "FEATURE": 0,
+    "MEAN": 1,
+    "SCALE": 2,
+    "PCA_MEAN": 3,
+    "COMPONENT_X": 4,
+    "COMPONENT_Y": 5,
+
+    "LAST_UPDATED": 6
+}
+
+
+# --- migrations ---
+TRACKS_INDEX = f"CREATE INDEX IF NOT EXISTS tracks_album_id ON {TABLES['TRACKS']} ({KEYS['ALBUMS']})"
+
+
+
+def _migrate_tracks(cursor) -> None:
+    """ 2: brings back tracks' schema (track_id primary key and last_updated) where create_tracks_pca() used to replace
+    it with a pandas' table, and adds the stored pca fit of the incremental projection. """
+    columns = [x[1] for x in cursor.execute(f"PRAGMA table_info({TABLES['TRACKS']})").fetchall()]
+    if 'index' in columns:
+        cursor.execute(f"ALTER TABLE {TABLES['TRACKS']} RENAME TO _legacy_tracks")
+        cursor.execute(f"""
+            CREATE TABLE {TABLES['TRACKS']} (
+                artist_id TEXT,
+                album_id TEXT,
+                track_id TEXT PRIMARY KEY,
+
+                global_primary_component_x REAL,
+                global_primary_component_y REAL,
+
+                last_updated TEXT,
+
+                FOREIGN KEY (artist_id) REFERENCES artists (artist_id),
+                FOREIGN KEY (album_id) REFERENCES albums (album_id)
+            )
+        """)
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO {TABLES['TRACKS']}
+            SELECT artist_id, album_id, track_id, global_primary_component_x, global_primary_component_y, NULL
+            FROM _legacy_tracks
+        """)
+        cursor.execute("DROP TABLE _legacy_tracks")
+    cursor.execute(TRACKS_INDEX)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS tracks_artist_id ON {TABLES['TRACKS']} ({KEYS['ARTISTS']})")
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABLES['PCA_MODEL']} (
+            feature TEXT PRIMARY KEY,
+            mean REAL,
+            scale REAL,
+            pca_mean REAL,
+            component_x REAL,
+            component_y REAL,
+            last_updated TEXT
+        )
+    """)
+
+
+MIGRATIONS = [
+    # 1: indexes for the builders' access paths.
+    f"""
+    CREATE INDEX IF NOT EXISTS albums_artist_id ON {TABLES['ALBUMS']} ({KEYS['ARTISTS']});
+    {TRACKS_INDEX};
+    """,
+    _migrate_tracks
+]
+
+with open(os.path.join(os.path.dirname(__file__), 'schema.analisis.txt'), 'r', encoding='utf-8') as _file:
+    SCHEMA = _file.read()
+
 
 # --- classes ---
 class AnalisisDB(db.Database):
@@ -306,18 +385,166 @@ class AnalisisDB(db.Database):
         :param database_path: the relative path to the database.
         """
         super().__init__(database_path)
+        self.migrations, self.schema = MIGRATIONS, SCHEMA
         # handlers
         self.linked = arDB.ArtistasDB(linked_path)
-        self.formatter = _Format()
 
     # --- create ---
     def create_entry(self, artist_id: str) -> None:
         """ creates a complete entry for an artist in the database's tables.
         :param artist_id: the spotify artist's id.
         """
+        self.create_entries([artist_id])
+
+    def create_entries(self, artist_ids: list = None) -> None:
+        """ creates the artist and album summary entries of many artists at once: their tracks are loaded with a single
+        query, summarized with grouped aggregations and inserted in a single transaction.
+        :param artist_ids: the spotify artists' ids. Default: every artist with saved albums.
+        """
+        if artist_ids is None:
+            artist_ids = [x[0] for x in self.linked.query(
+                f"SELECT {KEYS['ARTISTS']} FROM {TABLES['ARTISTS']} WHERE saved_albums > 0"
+            )]
+            df = self._tracks()
+            df = df[df[KEYS['ARTISTS']].isin(artist_ids)]
+        elif artist_ids:
+            df = self._tracks(artist_ids)
+        else:
+            return
+        df = df.dropna()
+        if self.verbose:
+            print(f"creating summary entries for {len(artist_ids)} artists and their albums.")
+        timestamp = helper.current_time()
+        artists_rows = _summary_rows(df, [KEYS['ARTISTS']], timestamp, pd.Index(artist_ids, name=KEYS['ARTISTS']))
+        albums_rows = _summary_rows(df, [KEYS['ARTISTS'], KEYS['ALBUMS']], timestamp)
+        self.push_many(
+            [(f"INSERT INTO {TABLES['ARTISTS']} VALUES ({('?, ' * len(ARTISTS))[:-2]})", x) for x in artists_rows] +
+            [(f"INSERT INTO {TABLES['ALBUMS']} VALUES ({('?, ' * len(ALBUMS))[:-2]})", x) for x in albums_rows]
+        )
+
+    def create_tracks_pca(self, refit: bool = False) -> int:
+        """ populates the tracks table with PCA information. Only new tracks, and tracks updated since their projection,
+        are projected with the stored fit and upserted (in place, so that the rows keep their order). The pca is fitted
+        again (out of core, with IncrementalPCA) and every track projected when there is no stored fit, when the tracks'
+        features drifted away from it, or on request.
+        :param refit: if true, fits the pca again regardless of drift.
+        :return: the amount of projected tracks.
+        """
+        self.ensure_migrated()
+        self.attach(self.linked.db, 'adb')
+        started = helper.current_time()
+        fit = self._pca_fit()
+        refit = refit or fit is None or self._pca_drift(fit) > PCA_DRIFT
+        if refit:
+            if self.verbose:
+                print(f"fitting pca for tracks in db.")
+            fit = stats.incremental_pca(lambda: self._pca_tracks(), FEATURES + MEASURES)
+            self._save_pca_fit(fit)
+            tracks = self._pca_tracks()
+        else:
+            tracks = self._pca_tracks(changed_only=True)
         if self.verbose:
-            print(f"fetching {artist_id} from db.")
-        df = self.linked.to_dataframe(f"""
+            print(f"projecting tracks in db.")
+        projected = 0
+        for df in tracks:
+            pca_df = stats.pca_project(df, fit, FEATURES + MEASURES, [KEYS['ARTISTS'], KEYS['ALBUMS'], KEYS['TRACKS']])
+            timestamp = helper.current_time()
+            self.push_many([(f"""
+                INSERT INTO {TABLES['TRACKS']} VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT ({KEYS['TRACKS']}) DO UPDATE SET
+                    artist_id = excluded.artist_id, album_id = excluded.album_id,
+                    global_primary_component_x = excluded.global_primary_component_x,
+                    global_primary_component_y = excluded.global_primary_component_y,
+                    last_updated = excluded.last_updated
+            """, (*x, timestamp)) for x in pca_df.itertuples(index=False, name=None)])
+            projected += len(pca_df)
+        if refit:  # rows that were not projected again belong to deleted or incomplete tracks.
+            self.push([(f"""
+                DELETE FROM {TABLES['TRACKS']} WHERE last_updated IS NULL OR last_updated < ?
+            """, (started,))])
+        else:
+            self.push([f"""
+                DELETE FROM main.{TABLES['TRACKS']}
+                WHERE {KEYS['TRACKS']} NOT IN (SELECT {KEYS['TRACKS']} FROM adb.{TABLES['TRACKS']})
+            """])
+        return projected
+
+    def batch_create(self) -> None:
+        """ creates an artist entry and album entries for each artist with saved albums that has no entry yet. """
+        self.ensure_migrated()
+        linked = self.linked.query(f"SELECT {KEYS['ARTISTS']} FROM {TABLES['ARTISTS']} WHERE saved_albums > 0;")
+        created = {x[0] for x in self.query(f"SELECT {KEYS['ARTISTS']} FROM {TABLES['ARTISTS']}")}
+        missing = [x[0] for x in linked if x[0] is not None and x[0] not in created]
+        if missing:
+            self.create_entries(missing)
+
+    def _pca_tracks(self, changed_only: bool = False):
+        """ yields, in chunks of PCA_CHUNK_SIZE, the ids and pca columns of the tracks without nulls in them.
+        :param changed_only: if true, only the tracks never projected or updated since their projection.
+        """
+        columns = [KEYS['ARTISTS'], KEYS['ALBUMS'], KEYS['TRACKS']] + FEATURES + MEASURES
+        changed = f"""
+            AND (p.{KEYS['TRACKS']} IS NULL OR p.last_updated IS NULL OR t.last_updated > p.last_updated)
+        """ if changed_only else ""
+        last = ''
+        while True:
+            df = self.to_dataframe((f"""
+                SELECT {', '.join(f't.{x}' for x in columns)}
+                FROM adb.{TABLES['TRACKS']} AS t
+                LEFT JOIN main.{TABLES['TRACKS']} AS p ON p.{KEYS['TRACKS']} = t.{KEYS['TRACKS']}
+                WHERE t.{KEYS['TRACKS']} > ? AND {' AND '.join(f't.{x} IS NOT NULL' for x in columns)}
+                {changed}
+                ORDER BY t.{KEYS['TRACKS']}
+                LIMIT ?;
+            """, (last, PCA_CHUNK_SIZE)), dtypes={**arDB.DTYPES['IDS'], **arDB.DTYPES['FEATURES']})
+            if df.empty:
+                return
+            yield df
+            last = df[KEYS['TRACKS']].iloc[-1]
+
+    def _pca_fit(self) -> dict or None:
+        """ :return: the stored pca fit (see Stats.incremental_pca()), or None if there is none. """
+        rows = {x[PCA_MODEL['FEATURE']]: x for x in self.query(f"SELECT * FROM {TABLES['PCA_MODEL']}")}
+        if any(x not in rows for x in FEATURES + MEASURES):
+            return None
+        rows = np.array([rows[x][PCA_MODEL['MEAN']:PCA_MODEL['LAST_UPDATED']] for x in FEATURES + MEASURES], float)
+        return {
+            'mean': rows[:, 0],
+            'scale': rows[:, 1],
+            'pca_mean': rows[:, 2],
+            'components': rows[:, 3:5].T
+        }
+
+    def _save_pca_fit(self, fit: dict) -> None:
+        timestamp = helper.current_time()
+        var = fit['explained_variance_ratio']
+        self.push_many([f"DELETE FROM {TABLES['PCA_MODEL']}"] + [
+            (f"INSERT INTO {TABLES['PCA_MODEL']} VALUES (?, ?, ?, ?, ?, ?, ?)", (
+                feature, fit['mean'][i], fit['scale'][i], fit['pca_mean'][i],
+                fit['components'][0][i], fit['components'][1][i], timestamp
+            ))
+            for (i, feature) in enumerate(FEATURES + MEASURES)
+        ] + [(f"INSERT INTO {TABLES['PCA_METADATA']} VALUES (?, ?, ?)", (var[0], var[1], timestamp))])
+
+    def _pca_drift(self, fit: dict) -> float:
+        """ :return: how far the current tracks' features are from the fitted scaler: the largest change of a feature's
+        mean or std, in fitted stds. """
+        columns = FEATURES + MEASURES
+        row = self.linked.query(f"""
+            SELECT {', '.join(f'avg({x}), avg({x} * {x})' for x in columns)}
+            FROM {TABLES['TRACKS']}
+            WHERE {' AND '.join(f'{x} IS NOT NULL' for x in columns)};
+        """)[0]
+        if row[0] is None:
+            return 0.0
+        mean, square = np.array(row[0::2], float), np.array(row[1::2], float)
+        std = np.sqrt(np.maximum(square - mean ** 2, 0))
+        return float(max(np.max(np.abs(mean - fit['mean']) / fit['scale']), np.max(np.abs(std / fit['scale'] - 1))))
+
+    def _tracks(self, artist_ids: list = None) -> pd.DataFrame:
+        """ :return: the summarized columns of the given (or all) artists' tracks. """
+        where = f"WHERE {TABLES['TRACKS']}.{KEYS['ARTISTS']} IN (SELECT value FROM json_each(?))" if artist_ids else ""
+        command = f"""
             SELECT 
                 {TABLES['TRACKS']}.{KEYS['ARTISTS']}, 
                 {TABLES['TRACKS']}.{KEYS['ALBUMS']}, 
@@ -328,103 +555,53 @@ class AnalisisDB(db.Database):
             FROM {TABLES['TRACKS']} 
             INNER JOIN {TABLES['ARTISTS']} 
             ON {TABLES['TRACKS']}.{KEYS['ARTISTS']} = {TABLES['ARTISTS']}.{KEYS['ARTISTS']}
-            WHERE {TABLES['TRACKS']}.{KEYS['ARTISTS']} = '{artist_id}';
-        """).dropna()
-        self.formatter.set_id(artist_id)
-        if self.verbose:
-            print(f"creating summary entry for {artist_id}.")
-        self._create_artist_entry(df)
-        if self.verbose:
-            print(f"creating summary entry of albums for {artist_id}.")
-        self._create_albums_entry(df)
-
-    def create_tracks_pca(self) -> None:
-        """ calculates and populates the tracks table with PCA information. """
-        if self.verbose:
-            print(f"creating summary entry for tracks in db.")
-        df = self.linked.to_dataframe(f"""
-            SELECT 
-                {KEYS['ARTISTS']}, 
-                {KEYS['ALBUMS']}, 
-                {KEYS['TRACKS']}, 
-                {''.join([x + ', ' for x in FEATURES + MEASURES])[:-2]}
-            FROM {TABLES['TRACKS']}
-        """).dropna()
-        pca_df, var = stats.artistas_pca(df, FEATURES + MEASURES, [KEYS['ARTISTS'], KEYS['ALBUMS'], KEYS['TRACKS']])
-        self.push_df('tracks', pca_df, 'replace')
-        self.push([f"""INSERT INTO {TABLES['PCA_METADATA']} VALUES ({var[0]}, {var[1]}, '{helper.current_time()}')"""])
-
-    def batch_create(self) -> None:
-        """ creates an artist entry and album entries for each artist. """
-        artist_ids = self.linked.to_dataframe(f"""
-            SELECT {KEYS['ARTISTS']} 
-            FROM {TABLES['ARTISTS']} 
-            WHERE saved_albums > 0;
-        """).dropna()[KEYS['ARTISTS']].tolist()
-        for artist_id in artist_ids:
-            if self.query(f"""
-                SELECT {KEYS['ARTISTS']} 
-                FROM {TABLES['ARTISTS']} 
-                WHERE {KEYS['ARTISTS']} = '{artist_id}'
-            """):
-                continue
-            self.create_entry(artist_id)
-
-    def _create_artist_entry(self, df: pd.DataFrame) -> None:
-        summary = df[FEATURES + MEASURES].describe().round(3).to_dict()
-        counts = df[['key', 'mode']].value_counts().to_dict()
-        artist_row = self.formatter.format_summary(summary, counts)
-        insert_artist = [(f"INSERT INTO artists VALUES ({('?, ' * len(ARTISTS))[:-2]})", artist_row)]
-        self.push(insert_artist)
-
-    def _create_albums_entry(self, df: pd.DataFrame) -> None:
-        grouped = df.groupby('album_id')
-        albums_rows = []
-        for album_id, group in grouped:
-            summary = group[FEATURES + MEASURES].describe().round(3).to_dict()
-            counts = group[['key', 'mode']].value_counts().to_dict()
-            albums_rows.append(self.formatter.format_summary(summary, counts, album_id))
-        insert_albums = [(f"INSERT INTO albums VALUES ({('?, ' * len(ALBUMS))[:-2]})", x) for x in albums_rows]
-        self.push(insert_albums)
-
-
-class _Format:
-
-    def __init__(self, artist_id: str = None):
-        self.artist_id = artist_id
-
-    def set_id(self, artist_id: str) -> None:
-        self.artist_id = artist_id
-
-    def format_summary(self, feature_summary: dict, key_count: dict, album_id: str = None) -> tuple:
-        if not self.artist_id:
-            raise NameError('method called with null self.artist_id.')
-
-        row = [self.artist_id]
-        if album_id:
-            row.append(album_id)
-        # generate count columns
-        for j in range(len(MODE)):
-            for i in range(len(TONALITY)):
-                if key_count.get((float(i), float(j))):
-                    row.append(key_count[(float(i), float(j))])
-                else:
-                    row.append(0)
-        # generate summary columns
-        for x in MEASURES + FEATURES:
-            if feature_summary[x].get('mean'):
-                row.extend([
-                    feature_summary[x]['count'],
-                    feature_summary[x]['mean'],
-                    feature_summary[x]['std'],
-                    feature_summary[x]['min'],
-                    feature_summary[x]['25%'],
-                    feature_summary[x]['50%'],
-                    feature_summary[x]['75%'],
-                    feature_summary[x]['max'],
-                ])
-            else:
-                row.extend([None]*8)
-        # timestamp
-        row.append(helper.current_time())
-        return tuple(row)
+            {where};
+        """
+        return self.linked.to_dataframe((command, (json.dumps(list(artist_ids)),)) if artist_ids else command)
+
+
+# --- functions ---
+def _summary_rows(df: pd.DataFrame, by: list, timestamp: str, index: pd.Index = None) -> list:
+    """ summarizes the tracks of each group: the key x mode counts (minor, then major, C to B) and, for each of
+    MEASURES + FEATURES, its count, mean, std, min, quartiles and max rounded to 3 decimals. A summary whose rounded
+    mean is 0 is left null.
+    :param df: the tracks.
+    :param by: the id columns to group by. They lead each row.
+    :param timestamp: the rows' last_updated.
+    :param index: optional ids to summarize, in order. Ids without tracks get zero counts and null summaries.
+    :return: the artists or albums table rows.
+    """
+    if df.empty:  # an empty selection has object columns, which can't be aggregated.
+        df = pd.DataFrame(columns=by + MEASURES + CATEGORIES + FEATURES, dtype=float).astype({x: object for x in by})
+    grouped = df.groupby(by)[MEASURES + FEATURES]
+    summary = pd.concat(
+        [grouped.count(), grouped.mean(), grouped.std(), grouped.min()] +
+        [grouped.quantile(q) for q in (.25, .5, .75)] + [grouped.max()],
+        axis=1, keys=SUMMARY_STATS
+    ).swaplevel(axis=1)[[(x, y) for x in MEASURES + FEATURES for y in SUMMARY_STATS]]
+    # the grouped aggregations sum in a different order than describe(), so a value within float error of a rounding
+    # boundary could round the other way. Those groups are summarized again with describe() itself.
+    scaled = summary.to_numpy(dtype=float) * 10 ** 3
+    risky = summary.index[(np.abs(scaled - np.floor(scaled) - .5) < ROUNDING_MARGIN).any(axis=1)]
+    if len(risky):
+        rows = df.set_index(by).index.isin(risky)
+        summary.loc[risky] = df[rows].groupby(by)[MEASURES + FEATURES].describe().loc[risky, summary.columns]
+    summary = summary.round(3)
+    valid = df['key'].between(0, len(TONALITY) - 1) & df['mode'].between(0, len(MODE) - 1)
+    codes = (df['mode'][valid] * len(TONALITY) + df['key'][valid]).astype(int).rename('code')
+    counts = df[valid].groupby(by + [codes]).size().unstack('code', fill_value=0)
+    counts = counts.reindex(columns=range(len(MODE) * len(TONALITY)), fill_value=0)
+    if index is None:
+        index = summary.index
+    summary = summary.reindex(index)
+    counts = counts.reindex(index, fill_value=0)
+
+    values = summary[MEASURES + FEATURES].to_numpy().reshape(len(index), len(MEASURES + FEATURES), 8).astype(object)
+    values[values[:, :, 1] == 0] = None  # a falsy (rounded) mean nulls its whole summary.
+    values[pd.isna(values[:, :, 1].astype(float))] = None  # ids without tracks.
+    values = values.reshape(len(index), len(MEASURES + FEATURES) * 8).tolist()
+    ids = index.tolist() if len(by) > 1 else [(x,) for x in index.tolist()]
+    return [
+        (*key, *key_counts, *summary_values, timestamp)
+        for (key, key_counts, summary_values) in zip(ids, counts.to_numpy().tolist(), values)
+    ]
@@ -1,12 +1,18 @@
 """ ArtistasDB serves as a handler for the 'artistas' database schema. """
 import os
 import glob
+import json
+import math
+import time
 import sqlite3
+import datetime
+import warnings
 
 import builder.paths as paths
 import builder.handlers.Database as db
 import builder.handlers.SpotifyAPI as api
 import builder.utils.Helper as helper
+import builder.utils.Scheduler as scheduler
 
 
 TABLES = {
@@ -15,7 +21,11 @@ TABLES = {
     "TRACKS": 'tracks',
     "GENRES": 'genres',
     "RELATED": 'related',
-    "LISTENERS": 'listeners'
+    "LISTENERS": 'listeners',
+    "JOBS": 'crawl_jobs',
+    "TAXONOMY": 'genre_taxonomy',
+    "FACTS": 'release_facts',
+    "FACTS_STATE": 'release_facts_state'
 }
 
 KEYS = {
@@ -24,7 +34,11 @@ KEYS = {
     "TRACKS": 'track_id',  # other keys: album_id and artist_id
     "GENRES": 'artist_id',  # other keys: genre
     "RELATED": 'artist_id',  # other keys: other
-    "LISTENERS": 'artist_id'  # other keys: city and country
+    "LISTENERS": 'artist_id',  # other keys: city and country
+    "JOBS": 'artist_id',
+    "TAXONOMY": 'subgenre',  # other keys: genre
+    "FACTS": 'fact_id',  # the track_id, or the album_id on album rows. Other keys: album_id, track_id and artist_id
+    "FACTS_STATE": 'key'
 }
 
 ARTISTS = {
@@ -55,8 +69,14 @@ ALBUMS = {
     "IMG_640X": 9,
     "IMG_320X": 10,
     "IMG_60X": 11,
-    "LAST_UPDATED": 12
+    "LAST_UPDATED": 12,
+    "RELEASE_EPOCH_DAY": 13,  # parsed release date columns. See _release_parts().
+    "RELEASE_YEAR": 14,
+    "RELEASE_MONTH": 15,
+    "RELEASE_WEEKDAY": 16
 }
+RELEASE_COLUMNS = [x.lower() for x in list(ALBUMS)[ALBUMS['RELEASE_EPOCH_DAY']:]]
+EPOCH = datetime.date(1970, 1, 1)
 
 TRACKS = {
     "ARTIST_ID": 0,
@@ -104,6 +124,208 @@ LISTENERS = {
     "LAST_UPDATED": 4
 }
 
+JOBS = {
+    "ARTIST_ID": 0,
+    "STATE": 1,
+    "ATTEMPTS": 2,
+    "ERROR": 3,
+    "LAST_UPDATED": 4
+}
+
+FACTS = {  # one row per album (TRACK_ID null) and one per track. See ArtistasDB.refresh_facts().
+    "FACT_ID": 0,
+    "ALBUM_ID": 1,
+    "TRACK_ID": 2,
+    "ARTIST_ID": 3,
+    "ALBUM_TYPE": 4,
+    "RELEASE_DATE_PRECISION": 5,
+    "EPOCH_DAY": 6,
+    "YEAR": 7,
+    "MONTH": 8,
+    "WEEKDAY": 9,
+    "N_INVITED": 10,
+    "DURATION_MS": 11,
+    "KEY": 12,
+    "MODE": 13,
+    "TIME_SIGNATURE": 14,
+    "TEMPO": 15,
+    "DANCEABILITY": 16,
+    "ENERGY": 17,
+    "VALENCE": 18,
+    "LOUDNESS": 19,
+    "SPEECHINESS": 20,
+    "ACOUSTICNESS": 21,
+    "INSTRUMENTALNESS": 22,
+    "LIVENESS": 23,
+    "LAST_UPDATED": 24
+}
+FACT_TRACK_COLUMNS = [x.lower() for x in list(FACTS)[FACTS['DURATION_MS']:FACTS['LAST_UPDATED']]]
+
+JOB_STATES = ('pending', 'in_progress', 'done', 'failed', 'invalid')  # failed jobs are retried, invalid ones are not.
+MAX_ATTEMPTS = 3
+SLOW_REFRESH = 60 * 60 * 24 * 30  # seconds. Related artists and listeners change slowly: see update_entry().
+FACTS_MARGIN = 60 * 60  # seconds. last_updated is stamped when a row is formatted, a little before it is written: rows
+# stamped this long before the facts' high-water mark are checked again. See ArtistasDB.refresh_facts().
+
+DTYPES = {  # compact dataframe dtypes for the tracks' columns. See Database.to_dataframe().
+    "IDS": {'artist_id': 'category', 'album_id': 'category'},
+    "INTS": {  # nullable, and exact.
+        'key': 'Int8', 'mode': 'Int8', 'time_signature': 'Int8', 'explicit': 'Int8',
+        'disc_number': 'Int16', 'track_number': 'Int16', 'duration_ms': 'Int32',
+        'epoch_day': 'Int32', 'year': 'Int16', 'month': 'Int8', 'weekday': 'Int8', 'n_invited': 'Int16'
+    },
+    "FEATURES": {  # ~7 significant digits: not for values compared against exact thresholds (ie. histogram bins).
+        'danceability': 'float32', 'energy': 'float32', 'valence': 'float32', 'loudness': 'float32',
+        'speechiness': 'float32', 'acousticness': 'float32', 'instrumentalness': 'float32', 'liveness': 'float32',
+        'tempo': 'float32'
+    }
+}
+
+
+def _release_parts(release_date: str, precision: str) -> tuple:
+    """ parses a spotify release date. 'year' and 'month' precision dates are normalized to the first day of their
+    period, so that they fall in any date range that includes their start. Parts the precision does not tell are None:
+    the month of 'year' precision dates, and the weekday of anything but 'day' precision ones.
+    :return: the date's (days since 1970-01-01, year, month, ISO weekday). All None if it does not parse.
+    """
+    try:
+        date = datetime.date.fromisoformat(
+            {'year': f"{release_date[:4]}-01-01", 'month': f"{release_date[:7]}-01"}.get(precision, release_date)
+        )
+    except (TypeError, ValueError):  # missing, or spotify's '0000' placeholder.
+        return None, None, None, None
+    return (date - EPOCH).days, date.year, date.month if precision != 'year' else None, \
+        date.isoweekday() if precision == 'day' else None
+
+
+def _migrate_release_facts(cursor) -> None:
+    """ 4: adds the parsed release date columns to albums and backfills them, and creates the release facts, the
+    builders' denormalized tracks x albums table keyed by epoch day. Filled by ArtistasDB.refresh_facts(). """
+    columns = [x[1] for x in cursor.execute(f"PRAGMA table_info({TABLES['ALBUMS']})").fetchall()]
+    for column in RELEASE_COLUMNS:
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE {TABLES['ALBUMS']} ADD COLUMN {column} INT")
+    rows = cursor.execute(f"""
+        SELECT {KEYS['ALBUMS']}, release_date, release_date_precision FROM {TABLES['ALBUMS']}
+        WHERE release_epoch_day IS NULL
+    """).fetchall()
+    cursor.executemany(f"""
+        UPDATE {TABLES['ALBUMS']} SET {', '.join(f"{x} = ?" for x in RELEASE_COLUMNS)} WHERE {KEYS['ALBUMS']} = ?
+    """, [(*_release_parts(release_date, precision), album_id) for (album_id, release_date, precision) in rows])
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABLES['FACTS']} (
+            fact_id TEXT PRIMARY KEY,
+            album_id TEXT NOT NULL,
+            track_id TEXT,
+            artist_id TEXT,
+            album_type TEXT,
+            release_date_precision TEXT,
+            epoch_day INT,
+            year INT,
+            month INT,
+            weekday INT,
+            n_invited INT,
+            duration_ms INT,
+            key INT,
+            mode INT,
+            time_signature INT,
+            tempo REAL,
+            danceability REAL,
+            energy REAL,
+            valence REAL,
+            loudness REAL,
+            speechiness REAL,
+            acousticness REAL,
+            instrumentalness REAL,
+            liveness REAL,
+            last_updated TEXT
+        )
+    """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS release_facts_epoch_day ON {TABLES['FACTS']} (epoch_day)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS release_facts_album_id ON {TABLES['FACTS']} (album_id)")
+
+
+MIGRATIONS = [
+    # 1: indexes for the builders' and handlers' access paths. The albums ones are covering for the release, friday
+    # and invited series (release_date by type and precision) and drive the tracks joins of histograms and tonality.
+    f"""
+    CREATE INDEX IF NOT EXISTS tracks_album_id_key ON {TABLES['TRACKS']} (album_id, key);
+    CREATE INDEX IF NOT EXISTS tracks_artist_id ON {TABLES['TRACKS']} (artist_id);
+    CREATE INDEX IF NOT EXISTS albums_artist_id ON {TABLES['ALBUMS']} (artist_id);
+    CREATE INDEX IF NOT EXISTS albums_release_date ON {TABLES['ALBUMS']} (release_date, album_id);
+    CREATE INDEX IF NOT EXISTS albums_precision_release_date
+        ON {TABLES['ALBUMS']} (release_date_precision, release_date, album_id);
+    CREATE INDEX IF NOT EXISTS albums_type_precision_release_date
+        ON {TABLES['ALBUMS']} (album_type, release_date_precision, release_date);
+    CREATE INDEX IF NOT EXISTS genres_artist_id ON {TABLES['GENRES']} (artist_id, genre);
+    CREATE INDEX IF NOT EXISTS related_other_artist ON {TABLES['RELATED']} (other_artist);
+    CREATE INDEX IF NOT EXISTS artists_last_updated ON {TABLES['ARTISTS']} (last_updated);
+    """,
+    # 2: crawl job table. See ArtistasDB.batch_create().
+    f"""
+    CREATE TABLE IF NOT EXISTS {TABLES['JOBS']} (
+        artist_id TEXT PRIMARY KEY,
+        state TEXT NOT NULL DEFAULT 'pending',
+        attempts INT NOT NULL DEFAULT 0,
+        error TEXT,
+        last_updated TEXT
+    );
+    CREATE INDEX IF NOT EXISTS crawl_jobs_state ON {TABLES['JOBS']} (state, attempts);
+    """,
+    # 3: subgenre -> parent genre taxonomy, filled by GenresBuilder, and the genres index its join goes through.
+    f"""
+    CREATE TABLE IF NOT EXISTS {TABLES['TAXONOMY']} (
+        subgenre TEXT PRIMARY KEY,
+        genre TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS genres_genre ON {TABLES['GENRES']} (genre, artist_id);
+    """,
+    # 4: parsed release date columns for albums, and the release facts. See _migrate_release_facts().
+    _migrate_release_facts,
+    # 5: one row per artist and genre, so that a repeated genre is skipped ('INSERT OR IGNORE') on insertion.
+    f"""
+    DELETE FROM {TABLES['GENRES']} WHERE rowid NOT IN (
+        SELECT min(rowid) FROM {TABLES['GENRES']} GROUP BY artist_id, genre
+    );
+    DROP INDEX IF EXISTS genres_artist_id;
+    CREATE UNIQUE INDEX IF NOT EXISTS genres_artist_id ON {TABLES['GENRES']} (artist_id, genre);
+    """,
+    # 6: release facts' refresh state (high-water mark and invited artists' signature), and the indexes its range
+    # queries on last_updated go through.
+    f"""
+    CREATE TABLE IF NOT EXISTS {TABLES['FACTS_STATE']} (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    CREATE INDEX IF NOT EXISTS albums_last_updated ON {TABLES['ALBUMS']} (last_updated);
+    CREATE INDEX IF NOT EXISTS tracks_last_updated ON {TABLES['TRACKS']} (last_updated);
+    """
+]
+
+with open(os.path.join(os.path.dirname(__file__), 'schema.artistas.txt'), 'r', encoding='utf-8') as _file:
+    SCHEMA = _file.read()
+
+PRIORITY = {  # weights of the update priority score. See ArtistasDB.stale_artists().
+    "POPULARIDAD": 1.0,  # per popularity point (0-100).
+    "FOLLOWERS": 10.0,  # per order of magnitude of followers.
+    "AGE": 1.0  # per day since the last update.
+}
+
+
+def _insert(table: str, columns: dict, on_conflict: str = None) -> str:
+    """ :return: a '?'-parametrized INSERT statement for all columns of the given table. """
+    conflict = f"OR {on_conflict} " if on_conflict else ''
+    return f"INSERT {conflict}INTO {table} VALUES ({('?, ' * len(columns))[:-2]})"
+
+
+def _transient(error: Exception) -> bool:
+    """ :return: True if a job that failed with error may succeed on a later attempt: the request errors the scheduler
+    retries (network, throttling, 5xxs) or a busy database. Anything else, like an IntegrityError or an unexpected
+    response, would fail again after refetching the whole artist. """
+    if isinstance(error, sqlite3.OperationalError):
+        return 'locked' in str(error) or 'busy' in str(error)
+    return scheduler.is_transient(error)
+
 
 class ArtistasDB(db.Database):
 
@@ -112,10 +334,23 @@ class ArtistasDB(db.Database):
         :param database_path: the relative path to the database.
         """
         super().__init__(database_path)
+        self.migrations, self.schema = MIGRATIONS, SCHEMA
         # handlers
-        self.api = api.GET()  # spotipy
+        self._api = None
         self.formatter = _Format()
 
+    @property
+    def api(self):
+        """ the SpotifyAPI.GET client (spotipy), created on first use: handlers built on import must not open the
+        response cache. """
+        if self._api is None:
+            self._api = api.GET()
+        return self._api
+
+    @api.setter
+    def api(self, client) -> None:
+        self._api = client
+
     # --- create ---
     def create_entry(self, artist_id: str, cache_on_error: bool = True, continue_on_error: bool = True, _values: tuple = None) -> None:
         """ creates a complete entry for an artist in the database's tables.
@@ -130,24 +365,11 @@ class ArtistasDB(db.Database):
         self.formatter.set_id(artist_id)
         try:
             if self.verbose:
-                print(f'creating artist entry for {artist_id}.')
-            self._create_artist_entry(artist_json, albums_json, artist_bio)
-            if self.verbose:
-                print(f'creating album entries for {artist_id}.')
-            self._create_album_entries(albums_json)
-            if self.verbose:
-                print(f'creating track entries for {artist_id}.')
-            self._create_track_entries(albums_json)
-            if self.verbose:
-                print(f'creating genre entries for {artist_id}.')
-            self._create_genres_entries(artist_json)
-            if self.verbose:
-                print(f'creating related entries for {artist_id}.')
-            self._create_related_entries(artist_json, albums_json, related_json)
-            if self.verbose:
-                print(f'creating listener entries for {artist_id}.')
-            self._create_listener_entries(artist_listeners)
-            self._clear_dump(artist_id)
+                print(f'creating entries for {artist_id}.')
+            self.push_many(
+                self.entry_inserts(artist_id, (artist_json, artist_bio, artist_listeners, albums_json, related_json))
+            )
+            self.clear_dump(artist_id)
         except Exception as e:
             if not _values and cache_on_error:  # safe dump
                 dump = {
@@ -164,66 +386,159 @@ class ArtistasDB(db.Database):
             else:
                 raise e
 
-    def batch_create(self, artist_ids: list, cache_on_error: bool = True, continue_on_error: bool = True) -> None:
-        """ creates a complete entry for each given artist in the database's tables.
+    def batch_create(self, artist_ids: list, cache_on_error: bool = True, continue_on_error: bool = True,
+                     max_attempts: int = MAX_ATTEMPTS) -> None:
+        """ creates a complete entry for each given artist in the database's tables. Artists go through the crawl job
+        table: new ones are queued, then jobs are claimed one at a time until none is left, so an interrupted run
+        resumes where it stopped (jobs left in progress are released first).
         :param artist_ids: the list of artists spotify's ids.
         :param cache_on_error: if true, stores a copy of any fetched data on error for later retrial with the retry()
             method.
-        :param continue_on_error: if true, execution is not stopped on sql errors.
+        :param continue_on_error: if true, execution is not stopped on errors. Jobs failed by a transient error are
+            retried until they reach max_attempts, those failed by a data error are marked invalid and not retried.
+        :param max_attempts: how many times a job is tried before it stays failed.
+        """
+        self.release_jobs()
+        self.enqueue_jobs(artist_ids)
+        try:
+            while True:
+                claimed = self.claim_jobs(1, max_attempts)
+                if not claimed:
+                    break
+                artist_id = claimed[0]
+                try:
+                    self.create_entry(artist_id, cache_on_error, continue_on_error=False)
+                except Exception as e:
+                    self.finish_job(artist_id, e)
+                    if not continue_on_error:
+                        raise e
+                else:
+                    self.finish_job(artist_id)
+        finally:
+            self.refresh_facts()
+
+    # --- crawl jobs ---
+    def enqueue_jobs(self, artist_ids: list) -> int:
+        """ queues a pending crawl job for each artist that is neither stored nor queued, as a single set-difference
+        query.
+        :param artist_ids: the spotify artists' ids.
+        :return: the amount of queued jobs.
         """
-        for artist_id in artist_ids:
-            if self.query(f"""
-                SELECT {KEYS["ARTISTS"]} 
-                FROM {TABLES["ARTISTS"]} 
-                WHERE {KEYS['ARTISTS']} = '{artist_id}'
-            """):
-                continue
-            self.create_entry(artist_id, cache_on_error, continue_on_error)
+        with self.session() as cursor:
+            cursor.execute(f"""
+                INSERT OR IGNORE INTO {TABLES['JOBS']} ({KEYS['JOBS']}, state, attempts, last_updated)
+                SELECT DISTINCT value, 'pending', 0, ? FROM json_each(?)
+                WHERE value NOT IN (SELECT {KEYS['ARTISTS']} FROM {TABLES['ARTISTS']})
+            """, (str(helper.current_time()), json.dumps(list(artist_ids))))
+            return cursor.rowcount
+
+    def claim_jobs(self, amount: int = 1, max_attempts: int = MAX_ATTEMPTS) -> list:
+        """ atomically marks up to amount pending (or failed, with attempts left) jobs as in progress, so that
+        concurrent workers never claim the same artist.
+        :param amount: the maximum amount of jobs to claim.
+        :param max_attempts: failed jobs with fewer attempts than this are claimed again.
+        :return: the claimed artists' ids.
+        """
+        with self.session() as cursor:
+            cursor.execute(f"""
+                UPDATE {TABLES['JOBS']} SET state = 'in_progress', attempts = attempts + 1, last_updated = ?
+                WHERE {KEYS['JOBS']} IN (
+                    SELECT {KEYS['JOBS']} FROM {TABLES['JOBS']}
+                    WHERE state = 'pending' OR (state = 'failed' AND attempts < ?)
+                    ORDER BY attempts, rowid
+                    LIMIT ?
+                )
+                RETURNING {KEYS['JOBS']}
+            """, (str(helper.current_time()), max_attempts, amount))
+            return [x[0] for x in cursor.fetchall()]
+
+    def finish_job(self, artist_id: str, error: Exception = None) -> None:
+        """ marks a claimed job as done, or with the given error: as failed if the error is transient (the job will be
+        claimed again), as invalid otherwise. See _transient(). """
+        state = 'done' if error is None else 'failed' if _transient(error) else 'invalid'
+        error = None if error is None else f"{type(error).__name__}: {error}"
+        self.push([(f"""
+            UPDATE {TABLES['JOBS']} SET state = ?, error = ?, last_updated = ? WHERE {KEYS['JOBS']} = ?
+        """, (state, error, str(helper.current_time()), artist_id))])
+
+    def release_jobs(self) -> int:
+        """ returns the jobs left in progress by an interrupted run to the pending state. Must not be called while
+        other workers are running.
+        :return: the amount of released jobs.
+        """
+        with self.session() as cursor:
+            cursor.execute(f"""
+                UPDATE {TABLES['JOBS']} SET state = 'pending', attempts = max(attempts - 1, 0)
+                WHERE state = 'in_progress'
+            """)
+            return cursor.rowcount
+
+    def job_counts(self) -> dict:
+        """ :return: the amount of crawl jobs in each state. """
+        counts = dict(self.query(f"SELECT state, count(*) FROM {TABLES['JOBS']} GROUP BY state"))
+        return {state: counts.get(state, 0) for state in JOB_STATES}
+
+    def entry_inserts(self, artist_id: str, values: tuple) -> list:
+        """ formats a complete entry for an artist, without touching the database. Safe to call from several threads.
+        :param artist_id: the spotify artist's id.
+        :param values: the artist, bio, listeners, albums and related objects, as returned by GET.all().
+        :return: the (statement, row) pairs that create the entry. See push_many().
+        """
+        artist_json, artist_bio, artist_listeners, albums_json, related_json = values
+        formatter = _Format(artist_id)
+        return (
+            self._artist_inserts(artist_json, albums_json, artist_bio, formatter) +
+            self._album_inserts(albums_json, formatter) +
+            self._track_inserts(albums_json, formatter) +
+            self._genres_inserts(artist_json, formatter) +
+            self._related_inserts(artist_json, albums_json, related_json, formatter) +
+            self._listener_inserts(artist_listeners, formatter)
+        )
 
     def _create_artist_entry(self, artist_json: dict, albums_json: dict, bio: str) -> None:
-        rows = self.formatter.format_artist(artist_json, albums_json, bio)
-        insert_artist = [
-            (f"INSERT INTO {TABLES['ARTISTS']} VALUES ({('?, ' * len(ARTISTS))[:-2]})", rows)
-        ]
-        self.push(insert_artist)
+        self.push_many(self._artist_inserts(artist_json, albums_json, bio))
 
     def _create_album_entries(self, albums_json: dict) -> None:
-        rows = self.formatter.format_albums(albums_json)
-        insert_albums = [
-            (f"INSERT INTO {TABLES['ALBUMS']} VALUES ({('?, ' * len(ALBUMS))[:-2]})", x) for x in rows
-        ]
-        self.push(insert_albums)
+        self.push_many(self._album_inserts(albums_json))
 
     def _create_track_entries(self, albums_json: dict) -> None:
-        rows = self.formatter.format_tracks(albums_json)
-        insert_tracks = [
-            (f"INSERT INTO {TABLES['TRACKS']} VALUES ({('?, ' * len(TRACKS))[:-2]})", x) for x in rows
-        ]
-        self.push(insert_tracks)
+        self.push_many(self._track_inserts(albums_json))
 
     def _create_genres_entries(self, artist_json: dict) -> None:
-        rows = self.formatter.format_genre(artist_json)
-        insert_genres = [
-            (f"INSERT INTO {TABLES['GENRES']} VALUES ({('?, ' * len(GENRES))[:-2]})", x) for x in rows
-        ]
-        self.push(insert_genres)
+        self.push_many(self._genres_inserts(artist_json))
 
     def _create_related_entries(self, artist_json: dict, albums_json: dict, related_json: dict) -> None:
-        rows = self.formatter.format_related(artist_json, albums_json, related_json)
-        insert_related = [
-            (f"INSERT INTO {TABLES['RELATED']} VALUES ({('?, ' * len(RELATED))[:-2]})", x) for x in rows
-        ]
-        self.bypassIntegrityErrors = True
-        # duplicate key pairs may be formed from different sources. Detecting them before would be slow.
-        self.push(insert_related)
-        self.bypassIntegrityErrors = False
+        self.push_many(self._related_inserts(artist_json, albums_json, related_json))
 
     def _create_listener_entries(self, listeners: [(str, str, int)]) -> None:
-        rows = self.formatter.format_listeners(listeners)
-        insert_listeners = [
-            (f"INSERT INTO {TABLES['LISTENERS']} VALUES ({('?, ' * len(LISTENERS))[:-2]})", x) for x in rows
-        ]
-        self.push(insert_listeners)
+        self.push_many(self._listener_inserts(listeners))
+
+    def _artist_inserts(self, artist_json: dict, albums_json: dict, bio: str, formatter=None) -> list:
+        row = (formatter or self.formatter).format_artist(artist_json, albums_json, bio)
+        return [(_insert(TABLES['ARTISTS'], ARTISTS), row)]
+
+    def _album_inserts(self, albums_json: dict, formatter=None) -> list:
+        rows = (formatter or self.formatter).format_albums(albums_json)
+        # albums shared by several artists (collaborations) are stored once, by the first artist crawled.
+        return [(_insert(TABLES['ALBUMS'], ALBUMS, 'IGNORE'), x) for x in rows]
+
+    def _track_inserts(self, albums_json: dict, formatter=None) -> list:
+        rows = (formatter or self.formatter).format_tracks(albums_json)
+        # as with albums, a shared album's tracks are already stored.
+        return [(_insert(TABLES['TRACKS'], TRACKS, 'IGNORE'), x) for x in rows]
+
+    def _genres_inserts(self, artist_json: dict, formatter=None) -> list:
+        rows = (formatter or self.formatter).format_genre(artist_json)
+        return [(_insert(TABLES['GENRES'], GENRES, 'IGNORE'), x) for x in rows]
+
+    def _related_inserts(self, artist_json: dict, albums_json: dict, related_json: dict, formatter=None) -> list:
+        rows = (formatter or self.formatter).format_related(artist_json, albums_json, related_json)
+        # duplicate key pairs may be formed from different sources. Detecting them before would be slow.
+        return [(_insert(TABLES['RELATED'], RELATED, 'IGNORE'), x) for x in rows]
+
+    def _listener_inserts(self, listeners: [(str, str, int)], formatter=None) -> list:
+        rows = (formatter or self.formatter).format_listeners(listeners)
+        return [(_insert(TABLES['LISTENERS'], LISTENERS), x) for x in rows]
 
     # --- delete ---
     def delete_entry(self, artist_id: str) -> None:
@@ -233,6 +548,9 @@ class ArtistasDB(db.Database):
         if self.verbose:
             print(f'deleting artist entry for {artist_id}.')
         self._delete_artist_entry(artist_id)
+        if self.verbose:
+            print(f'deleting release facts for {artist_id}.')
+        self._delete_facts_entries(artist_id)
         if self.verbose:
             print(f'deleting album entries for {artist_id}.')
         self._delete_albums_entries(artist_id)
@@ -252,6 +570,13 @@ class ArtistasDB(db.Database):
     def _delete_artist_entry(self, artist_id: str) -> None:
         self.push([f"DELETE FROM {TABLES['ARTISTS']} WHERE {KEYS['ARTISTS']} = '{artist_id}'"])
 
+    def _delete_facts_entries(self, artist_id: str) -> None:  # before the albums, which it goes through.
+        self.push([f"""
+            DELETE FROM {TABLES['FACTS']} WHERE album_id IN (
+                SELECT {KEYS['ALBUMS']} FROM {TABLES['ALBUMS']} WHERE {KEYS['ARTISTS']} = '{artist_id}'
+            )
+        """])
+
     def _delete_albums_entries(self, artist_id: str) -> None:
         self.push([f"DELETE FROM {TABLES['ALBUMS']} WHERE {KEYS['ARTISTS']} = '{artist_id}'"])
 
@@ -268,81 +593,301 @@ class ArtistasDB(db.Database):
         self.push([f"DELETE FROM {TABLES['LISTENERS']} WHERE {KEYS['ARTISTS']} = '{artist_id}'"])
 
     # --- update ---
-    def update_entry(self, artist_id: str):
-        """ updates all entries for an artist in the database's tables.
+    def update_entry(self, artist_id: str) -> None:
+        """ incrementally updates an artist's entries, in a single transaction. See update_inserts().
+        :param artist_id: the spotify artist's id.
+        """
+        self.push_many(self.update_inserts(artist_id))
+
+    def update_inserts(self, artist_id: str) -> list:
+        """ fetches and formats an incremental update of an artist's entries. Only the artist object and the album
+        listing are requested; the tracks (and their features) are only requested for albums that are not stored yet.
+        Related artists and listeners are requested again once their stored rows are older than SLOW_REFRESH (listeners
+        are kept if the scrapper finds none). Changed artist, album, genre, related and listener rows are upserted, and
+        albums gone from a complete listing are deleted with their tracks. The bio is kept as stored.
         :param artist_id: the spotify artist's id.
+        :return: the (statement, row) pairs that update the entry. See push_many().
         """
-        artist_json, artist_bio, artist_listeners, albums_json, related_json = self.api.all(artist_id)
+        self.ensure_migrated()
+        related = self._slow_refresh(TABLES['RELATED'], artist_id, "AND relationship = 'related'")
+        listeners = self._slow_refresh(TABLES['LISTENERS'], artist_id)
+        related_json = self.api.pool.submit(self.api.artist_related, artist_id) if related else None
+        artist_listeners = self.api.pool.submit(self.api.artist_listeners, artist_id) if listeners else None
+        artist_json = self.api.artist(artist_id)
+        albums_json = self.api.albums(artist_id, get_tracks=False)
         self.formatter.set_id(artist_id)
+        stored_albums = {
+            x[ALBUMS['ALBUM_ID']]: x
+            for x in self.query((f"SELECT * FROM {TABLES['ALBUMS']} WHERE {KEYS['ARTISTS']} = ?", (artist_id,)))
+        }
+        # albums shared with other artists (collaborations) may be stored under one of them. They are not new.
+        known = {x[0] for x in self.query((f"""
+            SELECT {KEYS['ALBUMS']} FROM {TABLES['ALBUMS']} WHERE {KEYS['ALBUMS']} IN (SELECT value FROM json_each(?))
+        """, (json.dumps([x['id'] for x in albums_json['items']]),)))}
+        new_albums = {'items': [x for x in albums_json['items'] if x['id'] not in known]}
+        if new_albums['items']:
+            for album, json_tracks in zip(new_albums['items'], self.api.albums_tracks(new_albums['items'])):
+                album['tracks'] = json_tracks
+        # a listing with pages that could not be fetched can not tell which albums are gone.
+        gone = sorted(set(stored_albums) - {x['id'] for x in albums_json['items']}) if albums_json['complete'] else []
         if self.verbose:
-            print(f'updating artist entry for {artist_id}')
-        self._update_artist_entry(artist_id, artist_json, albums_json, artist_bio)
-        if self.verbose:
-            print(f'updating albums and tracks entries for {artist_id}')
-        self._update_albums_and_tracks_entries(artist_id, albums_json)
-        if self.verbose:
-            print(f'updating genre entries for {artist_id}')
-        self._update_genres_entries(artist_id, artist_json)
-        if self.verbose:
-            print(f'updating related entries for {artist_id}')
-        self._update_related_entries(artist_id, artist_json, albums_json, related_json)
-        if self.verbose:
-            print(f'updating related entries for {artist_id}')
-        self._update_listeners_entries(artist_id, artist_listeners)
-
-    def batch_update(self, artist_ids: list, older_than: int = 60 * 60 * 24) -> None:
-        """ updates all entries for the given artists in the database's tables.
-        :param artist_ids: the spotify artists' ids.
+            print(f'updating {artist_id}: {len(new_albums["items"])} new albums, {len(gone)} gone.')
+        return (
+            self._artist_updates(artist_id, artist_json, albums_json) +
+            self._album_deletes(gone) +
+            self._album_updates(albums_json, stored_albums, known) +
+            self._track_inserts(new_albums) +
+            self._genres_updates(artist_id, artist_json) +
+            self._related_updates(artist_id, artist_json, new_albums, related_json and related_json.result()) +
+            self._listener_updates(artist_id, artist_listeners and artist_listeners.result())
+        )
+
+    def stale_artists(self, older_than: int = 60 * 60 * 24, artist_ids: list = None, limit: int = None,
+                      exclude: list = ()) -> list:
+        """ finds the artists last updated more than older_than seconds ago, most valuable first, with a single query:
+        a range on the indexed last_updated column, ordered by the update priority score and cut at limit. The score
+        adds, weighted by PRIORITY, the artist's popularity, its followers' order of magnitude and the days since its
+        last update.
+        :param older_than: staleness threshold in seconds. Default = 86400 (a day)
+        :param artist_ids: optional restriction on the artists to consider. Default: all of them.
+        :param limit: optional maximum amount of artists to return.
+        :param exclude: artists to leave out, eg. those already tried in this run.
+        :return: the stale artists' ids, most valuable first.
+        """
+        now = helper.current_time()
+        restrict, params = "", [str(now - datetime.timedelta(seconds=older_than))]
+        if artist_ids is not None:
+            restrict += f" AND {KEYS['ARTISTS']} IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(list(artist_ids)))
+        if exclude:
+            restrict += f" AND {KEYS['ARTISTS']} NOT IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(list(exclude)))
+        params += [PRIORITY['POPULARIDAD'], PRIORITY['FOLLOWERS'], PRIORITY['AGE'], str(now)]
+        self._ensure_log10()
+        return [x[0] for x in self.query((f"""
+            SELECT {KEYS['ARTISTS']}
+            FROM {TABLES['ARTISTS']}
+            WHERE last_updated < ?{restrict}
+            ORDER BY
+                ? * coalesce(popularidad, 0) + ? * log10(1 + coalesce(followers, 0)) +
+                ? * (julianday(?) - julianday(last_updated)) DESC,
+                {KEYS['ARTISTS']}
+            LIMIT ?
+        """, (*params, -1 if limit is None else limit)))]
+
+    def batch_update(self, artist_ids: list = None, older_than: int = 60 * 60 * 24, batch_size: int = 100,
+                     max_seconds: float = None, max_requests: int = None) -> int:
+        """ incrementally updates the stale entries among the given artists, most valuable first, until none is left
+        or the time or request budget runs out. Each batch takes the batch_size most valuable stale artists, fetches
+        their updates and writes them in a single transaction. If that transaction fails, the batch is written artist
+        by artist, and those that fail again stay stale for the next run.
+        :param artist_ids: the spotify artists' ids. Default: all artists in the database.
         :param older_than: update entries only older than the given seconds. Default = 86400 (a day)
+        :param batch_size: artists per batch and transaction. Progress is reported after each batch.
+        :param max_seconds: optional time budget for the run.
+        :param max_requests: optional budget of requests sent for the run (counted by the shared request scheduler).
+        :return: the amount of updated artists.
         """
-        for (index, artist_id) in enumerate(artist_ids):
-            current = self.query(f"""
-                  SELECT last_updated
-                  FROM   {TABLES["ARTISTS"]} 
-                  WHERE  {KEYS['ARTISTS']} = '{artist_id}'
-              """)[0]
-            if helper.seconds_from_now(current) > older_than:
-                self.update_entry(artist_id)
-
-    def update_all(self) -> None:
-        """ updates all entries in the database. """
-        artists = [x[0] for x in self.query(f"SELECT {KEYS['ARTISTS']} FROM {TABLES['ARTISTS']}")]
-        self.batch_update(artists)
-
-    def _update_artist_entry(self, artist_id: str, artist_json: dict, albums_json: dict, artist_bio: str) -> None:
-        self._delete_artist_entry(artist_id)
-        self._create_artist_entry(artist_json, albums_json, artist_bio)
-
-    def _update_albums_and_tracks_entries(self, artist_id: str, albums_json: dict) -> None:
-        total_albums = self.query(f"""
-            SELECT total_albums 
-            FROM {TABLES["ARTISTS"]} 
-            WHERE {KEYS['ARTISTS']} = '{artist_id}'
-        """)[0]
-        if total_albums != albums_json['total']:
-            new_albums = {'items': []}
-            for album in albums_json['items']:
-                if not self.query(f"""
-                    SELECT {KEYS['ALBUMS']} 
-                    FROM {TABLES['ALBUMS']} 
-                    WHERE {KEYS['ALBUMS']}='{album['id']}'
-                """):
-                    new_albums['items'].append(album)
-            if new_albums:
-                self._create_album_entries(new_albums)
-                self._create_track_entries(new_albums)
-
-    def _update_genres_entries(self, artist_id: str, artist_json: dict) -> None:
-        self._delete_genres_entries(artist_id)
-        self._create_genres_entries(artist_json)
+        self.ensure_migrated()
+        start, sent = time.monotonic(), scheduler.SCHEDULER.stats()['requests']
+        updated, tried, failed, exhausted = 0, [], [], False
+        try:
+            while not exhausted:
+                # artists tried in this run are left out: with a small older_than, they may still be stale.
+                batch = self.stale_artists(older_than, artist_ids, batch_size, tried)
+                if not batch:
+                    break
+                tried.extend(batch)
+                commands = {}
+                for artist_id in batch:
+                    elapsed, requests = time.monotonic() - start, scheduler.SCHEDULER.stats()['requests'] - sent
+                    if (max_seconds is not None and elapsed >= max_seconds) or \
+                            (max_requests is not None and requests >= max_requests):
+                        print(f"budget exhausted: updated {updated + len(commands)} stale artists in {elapsed:.0f}s "
+                              f"and {requests} requests.")
+                        exhausted = True
+                        break
+                    try:
+                        commands[artist_id] = self.update_inserts(artist_id)
+                    except Exception as e:  # keep going, the artist stays stale and is retried next run.
+                        warnings.warn(f"could not update {artist_id}: {e}")
+                        failed.append(artist_id)
+                updated += self._push_batch(commands, failed)
+                if self.verbose:
+                    print(f"updated {updated} stale artists, {len(failed)} failed.")
+        finally:
+            self.refresh_facts()
+        return updated
+
+    def update_all(self, **budget) -> int:
+        """ updates all stale entries in the database. See batch_update() for the budget parameters.
+        :return: the amount of updated artists.
+        """
+        return self.batch_update(None, **budget)
+
+    def _artist_updates(self, artist_id: str, artist_json: dict, albums_json: dict) -> list:
+        bio = self.query((f"SELECT bio FROM {TABLES['ARTISTS']} WHERE {KEYS['ARTISTS']} = ?", (artist_id,)))
+        row = self.formatter.format_artist(artist_json, albums_json, bio[0][0] if bio else '')
+        return [(_insert(TABLES['ARTISTS'], ARTISTS, 'REPLACE'), row)]
+
+    def _album_updates(self, albums_json: dict, stored_albums: dict, known: set) -> list:
+        """ the artist's own changed albums are replaced and new ones inserted. Albums stored under another artist
+        (collaborations, see _album_inserts()) are left as they are.
+        :param stored_albums: album_id: row pairs of the artist's own albums.
+        :param known: the listed albums' ids that are stored, under any artist.
+        """
+        rows = self.formatter.format_albums(albums_json)
+        last, album_id = ALBUMS['LAST_UPDATED'], ALBUMS['ALBUM_ID']
+        return [
+            (_insert(TABLES['ALBUMS'], ALBUMS, 'REPLACE' if x[album_id] in stored_albums else 'IGNORE'), x)
+            for x in rows
+            if (x[album_id] in stored_albums or x[album_id] not in known) and
+            stored_albums.get(x[album_id], ())[:last] != x[:last]
+        ]
 
-    def _update_related_entries(self, artist_id: str, artist_json: dict, albums_json: dict, related_json: dict) -> None:
-        self._delete_related_entries(artist_id)
-        self._create_related_entries(artist_json, albums_json, related_json)
+    def _push_batch(self, commands: dict, failed: list) -> int:
+        """ writes the updates of a batch of artists in a single transaction, or artist by artist if it fails.
+        :param commands: artist_id: update commands pairs. See update_inserts().
+        :param failed: where to add the artists whose update could not be written.
+        :return: the amount of written artists.
+        """
+        try:
+            with self.session():  # each artist's commands keep their order: deletes before the inserts they clear.
+                for artist_commands in commands.values():
+                    self.push_many(artist_commands)
+            return len(commands)
+        except sqlite3.Error:
+            written = 0
+            for artist_id, artist_commands in commands.items():
+                try:
+                    self.push_many(artist_commands)
+                    written += 1
+                except sqlite3.Error as e:
+                    warnings.warn(f"could not update {artist_id}: {e}")
+                    failed.append(artist_id)
+            return written
+
+    def _ensure_log10(self) -> None:
+        """ registers log10() on the connection, for sqlite builds without the math functions. """
+        try:
+            self.query("SELECT log10(1)")
+        except sqlite3.OperationalError:
+            self.connection.create_function('log10', 1, math.log10, deterministic=True)
+
+    def _album_deletes(self, album_ids: list) -> list:
+        return [
+            (f"DELETE FROM {TABLES[table]} WHERE {KEYS['ALBUMS']} = ?", (x,))
+            for table in ('FACTS', 'TRACKS', 'ALBUMS') for x in album_ids
+        ]
 
-    def _update_listeners_entries(self, artist_id: str, listeners: [(str, str, int)]) -> None:
-        self._delete_listeners_entries(artist_id)
-        self._create_listener_entries(listeners)
+    def _related_updates(self, artist_id: str, artist_json: dict, new_albums: dict, related_json: dict) -> list:
+        """ co-authors of new albums are added. If related_json is given, the 'related' rows are replaced. """
+        deletes = [] if related_json is None else [(
+            f"DELETE FROM {TABLES['RELATED']} WHERE {KEYS['RELATED']} = ? AND relationship = 'related'", (artist_id,)
+        )]
+        rows = self.formatter.format_related(artist_json, new_albums, related_json or {'artists': []})
+        return deletes + [(_insert(TABLES['RELATED'], RELATED, 'IGNORE'), x) for x in rows]
+
+    def _listener_updates(self, artist_id: str, listeners: list) -> list:
+        if not listeners:  # not requested, or the scrapper found none.
+            return []
+        return [
+            (f"DELETE FROM {TABLES['LISTENERS']} WHERE {KEYS['LISTENERS']} = ?", (artist_id,))
+        ] + self._listener_inserts(listeners)
+
+    def _slow_refresh(self, table: str, artist_id: str, restrict: str = '') -> bool:
+        """ :return: True if the artist's rows in table are missing or older than SLOW_REFRESH. """
+        last_updated = self.query((
+            f"SELECT max(last_updated) FROM {table} WHERE {KEYS['ARTISTS']} = ? {restrict}", (artist_id,)
+        ))[0][0]
+        return last_updated is None or helper.seconds_from_now(last_updated) > SLOW_REFRESH
+
+    def _genres_updates(self, artist_id: str, artist_json: dict) -> list:
+        stored = {x[0] for x in self.query((
+            f"SELECT genre FROM {TABLES['GENRES']} WHERE {KEYS['GENRES']} = ?", (artist_id,)
+        ))}
+        rows = self.formatter.format_genre(artist_json)
+        genres = {x[GENRES['GENRE']] for x in rows}
+        return [
+            (f"DELETE FROM {TABLES['GENRES']} WHERE {KEYS['GENRES']} = ? AND genre = ?", (artist_id, x))
+            for x in sorted(stored - genres)
+        ] + [(_insert(TABLES['GENRES'], GENRES, 'IGNORE'), x) for x in rows if x[GENRES['GENRE']] not in stored]
+
+    # --- release facts ---
+    def refresh_facts(self, invited_path: str = paths.invited_db, full: bool = False) -> int:
+        """ brings the release facts table up to date with albums and tracks. Called after every ingestion (see
+        batch_create(), batch_update() and Crawler.crawl()), not by the builders. Only albums and tracks stamped after
+        the previous refresh's high-water mark (less FACTS_MARGIN) are looked at, through their last_updated indexes,
+        and the albums among them that are new, changed or have new or changed tracks are rebuilt. Deleted albums take
+        their facts with them (see delete_entry() and update_entry()). Album rows' n_invited is recomputed whenever the
+        invited artists table changes. Release dates come from the albums' parsed columns (see _release_parts()).
+        :param invited_path: the invited artists database to take album rows' n_invited from, if it exists.
+        :param full: if true, every album is rebuilt. Also done on the first refresh.
+        :return: the amount of rebuilt albums.
+        """
+        invited = os.path.exists(invited_path)
+        if invited:
+            self.attach(invited_path, 'inv')
+            invited = bool(self.query("SELECT 1 FROM inv.sqlite_master WHERE type = 'table' AND name = 'invitedArtists'"))
+        facts, state, albums, tracks = TABLES['FACTS'], TABLES['FACTS_STATE'], TABLES['ALBUMS'], TABLES['TRACKS']
+        features = ', '.join(f"t.{x}" for x in FACT_TRACK_COLUMNS)
+        date = ', '.join(f"a.{x}" for x in RELEASE_COLUMNS)
+        with self.session() as cursor:
+            stored = dict(cursor.execute(f"SELECT key, value FROM {state}").fetchall())
+            mark = cursor.execute(f"""
+                SELECT max(m) FROM (
+                    SELECT max(last_updated) m FROM {albums} UNION ALL SELECT max(last_updated) FROM {tracks}
+                )
+            """).fetchone()[0]
+            if full or 'last_updated' not in stored:
+                cursor.execute(f"DELETE FROM {facts}")
+                changed = [x[0] for x in cursor.execute(f"SELECT {KEYS['ALBUMS']} FROM {albums}").fetchall()]
+            else:
+                since = str(datetime.datetime.fromisoformat(stored['last_updated']) -
+                            datetime.timedelta(seconds=FACTS_MARGIN))
+                changed = [x[0] for x in cursor.execute(f"""
+                    SELECT a.album_id FROM {albums} a
+                    LEFT JOIN {facts} f ON f.fact_id = a.album_id
+                    WHERE a.last_updated > ? AND (f.fact_id IS NULL OR f.last_updated IS NOT a.last_updated)
+                    UNION
+                    SELECT t.album_id FROM {tracks} t
+                    LEFT JOIN {facts} f ON f.fact_id = t.track_id
+                    WHERE t.last_updated > ? AND (f.fact_id IS NULL OR f.last_updated IS NOT t.last_updated)
+                """, (since, since)).fetchall()]
+            changed = json.dumps(changed)
+            cursor.execute(f"DELETE FROM {facts} WHERE album_id IN (SELECT value FROM json_each(?))", (changed,))
+            cursor.execute(f"""
+                INSERT INTO {facts}
+                SELECT a.album_id, a.album_id, NULL, a.artist_id, a.album_type, a.release_date_precision, {date},
+                    {'i.n_invited' if invited else 'NULL'}, {', '.join(['NULL'] * len(FACT_TRACK_COLUMNS))},
+                    a.last_updated
+                FROM {albums} a
+                {'LEFT JOIN inv.invitedArtists i ON i.album_id = a.album_id' if invited else ''}
+                WHERE a.album_id IN (SELECT value FROM json_each(?))
+            """, (changed,))
+            cursor.execute(f"""
+                INSERT OR REPLACE INTO {facts}
+                SELECT t.track_id, t.album_id, t.track_id, t.artist_id, a.album_type, a.release_date_precision, {date},
+                    NULL, {features}, t.last_updated
+                FROM {tracks} t
+                INNER JOIN {albums} a ON a.album_id = t.album_id
+                WHERE t.album_id IN (SELECT value FROM json_each(?))
+            """, (changed,))
+            signature = '' if not invited else '|'.join(map(str, cursor.execute(
+                "SELECT count(*), total(n_invited), max(rowid) FROM inv.invitedArtists"
+            ).fetchone()))
+            if signature != stored.get('invited', ''):  # invited artists are counted after the albums are stored.
+                cursor.execute(f"""
+                    UPDATE {facts} SET n_invited = {f'''(
+                        SELECT n_invited FROM inv.invitedArtists i WHERE i.album_id = {facts}.album_id
+                    )''' if invited else 'NULL'}
+                    WHERE track_id IS NULL
+                """)
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO {state} VALUES (?, ?)",
+                [('invited', signature)] + ([('last_updated', str(mark))] if mark is not None else [])
+            )
+        return len(json.loads(changed))
 
     def retry(self):
         f"""create_entry() variables are cached in {paths.logs} on error, as to avoid uneeded requests to the spotify 
@@ -361,7 +906,7 @@ class ArtistasDB(db.Database):
         """ deletes stored dump files for the given artist id.
         :param artist_id: the artist_id for which to delete the dump file. If none, clears all dump files.
         """
-        dumps = glob.glob(f"{paths.logs}/push_error_dump{artist_id if artist_id else '*'}.json")
+        dumps = glob.glob(f"{paths.logs}/push_error_dump_{artist_id if artist_id else '*'}.json")
         for d in dumps:
             os.remove(d)
 
@@ -411,6 +956,7 @@ class _Format:
             images = images + [None] * (3 - len(images))
             album_row.extend(images[:3])
             album_row.append(helper.current_time())
+            album_row.extend(_release_parts(album['release_date'], album['release_date_precision']))
             albums_rows.append(tuple(album_row))
 
         return tuple(albums_rows)
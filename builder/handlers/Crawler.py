@@ -0,0 +1,121 @@
+""" Crawler.py is a multi-threaded ingestion mode for the 'artistas' database. Fetch workers request and format artists
+in parallel, while the calling thread is the only one to write to SQLite: it claims crawl jobs, pushes the workers'
+results as they arrive and reports progress. """
+
+import time
+import queue
+import signal
+import threading
+
+import builder.handlers.ArtistasDB as dbAR
+import builder.utils.Scheduler as scheduler
+
+
+# --- globals ---
+WORKERS = 4
+REPORT_EVERY = 10.0  # seconds between progress reports.
+
+
+# --- classes ---
+class Crawler:
+
+    def __init__(self, database: dbAR.ArtistasDB = None, workers: int = WORKERS,
+                 max_attempts: int = dbAR.MAX_ATTEMPTS, report_every: float = REPORT_EVERY):
+        """ a crawler that feeds an ArtistasDB through its crawl job table.
+        :param database: the handler to write to, and whose api is used to fetch. Default: a new ArtistasDB.
+        :param workers: the amount of fetch threads.
+        :param max_attempts: how many times a job is tried before it stays failed.
+        :param report_every: seconds between progress reports. None disables them.
+        """
+        self.database = database if database is not None else dbAR.ArtistasDB()
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.report_every = report_every
+        self.stopping = threading.Event()
+
+    def crawl(self, artist_ids: list = ()) -> dict:
+        """ queues the given artists and crawls every pending job. Must be called from the main thread. On SIGINT,
+        no new jobs are claimed, in-flight ones are written as they finish and the call returns. A second SIGINT
+        interrupts immediately; jobs left in progress are released on the next run.
+        :param artist_ids: the spotify artists' ids to queue, besides the already pending ones.
+        :return: the amount of crawl jobs in each state.
+        """
+        self.stopping.clear()
+        self.database.release_jobs()
+        self.database.enqueue_jobs(artist_ids)
+        tasks, results = queue.Queue(), queue.Queue()
+        threads = [threading.Thread(target=self._fetch, args=(tasks, results), daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        previous = signal.signal(signal.SIGINT, self._stop)
+        progress = {'done': 0, 'failed': 0, 'start': time.monotonic(), 'requests': _requests(), 'report': 0.0}
+        in_flight = 0
+        try:
+            while True:
+                if not self.stopping.is_set() and in_flight < self.workers:
+                    for artist_id in self.database.claim_jobs(self.workers - in_flight, self.max_attempts):
+                        tasks.put(artist_id)
+                        in_flight += 1
+                if in_flight == 0:
+                    break
+                try:
+                    artist_id, commands, error = results.get(timeout=0.5)
+                except queue.Empty:
+                    self._report(progress, in_flight)
+                    continue
+                in_flight -= 1
+                self._write(artist_id, commands, error, progress)
+                self._report(progress, in_flight)
+        finally:
+            signal.signal(signal.SIGINT, previous)
+            for _ in threads:
+                tasks.put(None)
+        self._report(progress, in_flight, force=True)
+        self.database.refresh_facts()
+        return self.database.job_counts()
+
+    def stop(self) -> None:
+        """ asks a running crawl to stop after its in-flight jobs. Safe to call from any thread. """
+        self.stopping.set()
+
+    def _stop(self, signum, frame) -> None:
+        print("stopping: waiting for in-flight artists. Press Ctrl+C again to interrupt.")
+        self.stop()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    def _fetch(self, tasks: queue.Queue, results: queue.Queue) -> None:
+        while True:
+            artist_id = tasks.get()
+            if artist_id is None:
+                return
+            try:
+                values = self.database.api.all(artist_id)
+                results.put((artist_id, self.database.entry_inserts(artist_id, values), None))
+            except Exception as e:
+                results.put((artist_id, None, e))
+
+    def _write(self, artist_id: str, commands: list, error: Exception, progress: dict) -> None:
+        if error is None:
+            try:
+                self.database.push_many(commands)
+            except Exception as e:
+                error = e
+        self.database.finish_job(artist_id, error)
+        progress['done' if error is None else 'failed'] += 1
+        if error is not None and self.database.verbose:
+            print(f"failed {artist_id}: {error}")
+
+    def _report(self, progress: dict, in_flight: int, force: bool = False) -> None:
+        now = time.monotonic()
+        if self.report_every is None or (not force and now - progress['report'] < self.report_every):
+            return
+        progress['report'] = now
+        elapsed = max(now - progress['start'], 1e-9)
+        print(f"{progress['done']} artists done, {progress['failed']} failed, {in_flight} in flight | "
+              f"{progress['done'] / elapsed * 60:.1f} artists/min, "
+              f"{(_requests() - progress['requests']) / elapsed:.1f} requests/s")
+
+
+# --- functions ---
+def _requests() -> int:
+    return scheduler.SCHEDULER.stats()['requests']
@@ -1,21 +1,269 @@
 """ Database.py serves as a base interface for sqlite communication and casting to and from pandas' dataframes. """
 
 from typing import Iterable
+from contextlib import contextmanager
+import threading
+import os
+import re
 import sqlite3 as sq
 import pandas as pd
 
 
+# --- globals ---
+PRAGMAS = [  # order matters: page_size only applies before the db switches to WAL / is first written.
+    ("page_size", 4096),
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -64000),  # negative values are KiB, ie. ~64MB per connection.
+    ("temp_store", "MEMORY"),
+    ("mmap_size", 268435456),
+    ("busy_timeout", 30000)
+]
+READ_ONLY_PRAGMAS = ["cache_size", "temp_store", "mmap_size", "busy_timeout"]
+_INSERT = re.compile(r'^\s*INSERT\s+INTO', re.IGNORECASE)
+_CREATE_TABLE = re.compile(r'CREATE\s+TABLE\s+(?!IF\s+NOT\s+EXISTS)', re.IGNORECASE)
+_WHERE = re.compile(r'\bWHERE\b', re.IGNORECASE)
+_PARENTHESES = re.compile(r'\([^()]*\)')
+
+
+# --- classes ---
+class _ConnectionPool:
+
+    def __init__(self):
+        """ keeps one long-lived sqlite connection per (thread, database) pair, shared by every handler. """
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def get(self, database_path: str, read_only: bool = False) -> sq.Connection:
+        """ :return: the calling thread's connection to database_path. Opened and tuned on first use. """
+        connections = self._connections_of_thread()
+        connection = connections.get((database_path, read_only))
+        if connection is None:
+            if read_only:
+                connection = sq.connect(f"{_uri(database_path)}?mode=ro", uri=True, check_same_thread=False)
+            else:
+                connection = sq.connect(database_path, check_same_thread=False)
+            for pragma, value in PRAGMAS:
+                if not read_only or pragma in READ_ONLY_PRAGMAS:
+                    connection.execute(f"PRAGMA {pragma} = {value}")
+            connections[(database_path, read_only)] = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def enter(self, database_path: str) -> int:
+        depths = self._depths_of_thread()
+        depths[database_path] = depths.get(database_path, 0) + 1
+        return depths[database_path]
+
+    def exit(self, database_path: str) -> int:
+        depths = self._depths_of_thread()
+        depths[database_path] -= 1
+        return depths[database_path]
+
+    def close(self, database_path: str = None) -> None:
+        """ closes the calling thread's connections.
+        :param database_path: if given, only closes the connection to this database.
+        """
+        connections = self._connections_of_thread()
+        for key in list(connections.keys()):
+            if database_path is None or key[0] == database_path:
+                connection = connections.pop(key)
+                connection.close()
+                with self._lock:
+                    self._connections.remove(connection)
+
+    def close_all(self) -> None:
+        """ closes every connection opened by the pool, on any thread. Meant for process shutdown. """
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def reset(self) -> None:
+        """ forgets every connection without closing them. Used in forked processes, which must not reuse the
+        parent's sqlite handles. """
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def _connections_of_thread(self) -> dict:
+        if not hasattr(self._local, 'connections'):
+            self._local.connections = {}
+            self._local.depths = {}
+        return self._local.connections
+
+    def _depths_of_thread(self) -> dict:
+        self._connections_of_thread()
+        return self._local.depths
+
+
+POOL = _ConnectionPool()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=POOL.reset)
+
+
+def _uri(database_path: str) -> str:
+    return 'file:' + os.path.abspath(database_path).replace('?', '%3f').replace('#', '%23')
+
+
+def _top_level(statement: str) -> str:
+    """ :return: the statement without its parenthesized parts (subqueries, CTEs, function arguments). """
+    while True:
+        stripped = _PARENTHESES.sub(' ', statement)
+        if stripped == statement:
+            return statement
+        statement = stripped
+
+
+def _astype(df: pd.DataFrame, dtypes: dict = None) -> pd.DataFrame:
+    if not dtypes:
+        return df
+    return df.astype({k: v for (k, v) in dtypes.items() if k in df.columns})
+
+
 class Database:
 
-    def __init__(self, database_path: str):
+    def __init__(self, database_path: str, read_only: bool = False):
         """ a base interface for SQLite communications and casting to and from pandas' dataframe.
         :param database_path: the relative path to the database.
+        :param read_only: if true, the database is opened in read-only mode. Safe to share between processes.
         """
         self.db = database_path
+        self.read_only = read_only
+        # schema, see migrate(). Subclasses set their own.
+        self.migrations = []
+        self.schema = None
+        self.migrated = False
         # flags
         self.bypassIntegrityErrors = False
         self.verbose = False
 
+    @property
+    def connection(self) -> sq.Connection:
+        """ the calling thread's pooled connection to the database. """
+        return POOL.get(self.db, self.read_only)
+
+    @contextmanager
+    def session(self):
+        """ context manager for a transaction on the pooled connection. Commits on exit and rolls back on error.
+        Nested sessions join the outermost one, which is the only one to commit. The handler's pending migrations are
+        run before its first session.
+        :return: a cursor for the session.
+        """
+        self.ensure_migrated()
+        connection = self.connection
+        POOL.enter(self.db)
+        cursor = connection.cursor()
+        try:
+            yield cursor
+        except BaseException:
+            if POOL.exit(self.db) == 0:
+                if self.verbose:
+                    print(f"rolling back.")
+                connection.rollback()
+            raise
+        else:
+            if POOL.exit(self.db) == 0:
+                if self.verbose:
+                    print(f"commiting.")
+                connection.commit()
+        finally:
+            cursor.close()
+
+    def close(self) -> None:
+        """ closes the calling thread's pooled connection to the database. """
+        POOL.close(self.db)
+
+    def attach(self, database_path: str, alias: str) -> None:
+        """ attaches another database to the pooled connection, if not already attached.
+        :param database_path: the relative path to the database to attach.
+        :param alias: the schema name to attach it as.
+        """
+        attached = [x[1] for x in self.connection.execute("PRAGMA database_list").fetchall()]
+        if alias not in attached:
+            if self.read_only:
+                database_path = f"{_uri(database_path)}?mode=ro"
+            self.connection.execute("ATTACH DATABASE ? AS ?", (database_path, alias))
+
+    def migrate(self, migrations: list = None, schema: str = None) -> int:
+        """ brings the database up to date, tracking its version with PRAGMA user_version. Each pending migration runs
+        in its own transaction, together with the version bump. Migrations must be idempotent (IF NOT EXISTS, or
+        callables that check before changing), so that a database created from the latest schema can go through them.
+        Handlers do not migrate on construction, as the builders create theirs on import: entry points call this
+        directly (see main.py), and writes call it through ensure_migrated().
+        :param migrations: in order, ';'-separated SQL scripts or callables that receive a cursor. migrations[i] takes
+            the database from version i to i + 1. Default: the handler's own.
+        :param schema: optional latest schema script, run (as CREATE TABLE IF NOT EXISTS) before the first migration.
+            Default: the handler's own.
+        :return: the database's version.
+        """
+        if migrations is None:
+            migrations, schema = self.migrations, self.schema if schema is None else schema
+        version = self.query("PRAGMA user_version")[0][0]
+        if version == 0 and schema:
+            self.connection.executescript(_CREATE_TABLE.sub('CREATE TABLE IF NOT EXISTS ', schema))
+        for number in range(version + 1, len(migrations) + 1):
+            connection = self.connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                if connection.execute("PRAGMA user_version").fetchone()[0] >= number:  # done by another process.
+                    connection.rollback()
+                    continue
+                if self.verbose:
+                    print(f"migrating {self.db} to version {number}.")
+                migration, cursor = migrations[number - 1], connection.cursor()
+                if callable(migration):
+                    migration(cursor)
+                else:
+                    for statement in migration.split(';'):
+                        if statement.strip():
+                            cursor.execute(statement)
+                cursor.execute(f"PRAGMA user_version = {number}")
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+        self.migrated = True
+        return max(version, len(migrations))
+
+    def ensure_migrated(self) -> None:
+        """ runs the handler's pending migrations, once per handler. Read-only handlers are never migrated. """
+        if not self.migrated and self.migrations and not self.read_only:
+            self.migrate()
+
+    def explain(self, command: (str, Iterable) or str) -> list:
+        """ :return: the steps of the query plan of a SQLite statement, as EXPLAIN QUERY PLAN details. """
+        statement, params = command if isinstance(command, tuple) else (command, ())
+        return [x[3] for x in self.connection.execute(f"EXPLAIN QUERY PLAN {statement}", params).fetchall()]
+
+    def full_scans(self, command: (str, Iterable) or str) -> list:
+        """ checks that a query reads its tables through indexes.
+        :param command: a SQLite select statement.
+        :return: the plan steps that scan a whole table without an index. The outermost loop (the first top level
+            step of the plan) is allowed if the top level query has no WHERE clause, as it has to read the whole table
+            anyway. Subqueries, inner loops of joins and filtered outer loops are not.
+        """
+        statement, params = command if isinstance(command, tuple) else (command, ())
+        plan = self.connection.execute(f"EXPLAIN QUERY PLAN {statement}", params).fetchall()
+        outermost = next((x[0] for x in plan if x[1] == 0), None)
+        filtered = _WHERE.search(_top_level(statement))
+        scans = []
+        for (step_id, parent, _, step) in plan:
+            if not step.startswith('SCAN ') or 'INDEX' in step or 'VIRTUAL TABLE' in step or \
+                    step.startswith('SCAN (') or step == 'SCAN CONSTANT ROW':
+                continue
+            if step_id == outermost and not filtered:
+                continue
+            scans.append(step)
+        return scans
+
+    def trace(self, callback) -> None:
+        """ calls callback with every statement run on the calling thread's pooled connection. None to stop. """
+        self.connection.set_trace_callback(callback)
+
     def bypass_integrity_errors(self, state: bool):
         """ sets handling of SQL integrity errors.
         :param state: True for bypass, False for raise.
@@ -30,25 +278,42 @@ class Database:
         """ executes and commits a series of SQLite statements.
         :param commands: a series of SQL statements or (statement, '?'-replacements) pairs.
         """
-        db = sq.connect(self.db)
-        cursor = db.cursor()
+        with self.session() as cursor:
+            for command in commands:
+                if self.verbose:
+                    print(f"pushing: {command}")
+                try:
+                    if isinstance(command, tuple):
+                        cursor.execute(command[0], command[1])
+                    else:
+                        cursor.execute(command)
+                except sq.IntegrityError as error:
+                    if self.bypassIntegrityErrors:
+                        continue
+                    else:
+                        raise error
+
+    def push_many(self, commands: [(str, Iterable) or str]) -> None:
+        """ executes and commits a series of SQLite statements in bulk, as a single transaction. Rows are grouped by
+        statement and sent through executemany(). If integrity errors are bypassed, conflicting rows of INSERT
+        statements are skipped by SQLite itself ('INSERT OR IGNORE') instead of falling back to row-by-row execution.
+        :param commands: a series of SQL statements or (statement, '?'-replacements) pairs.
+        """
+        grouped = {}
         for command in commands:
-            if self.verbose:
-                print(f"pushing: {command}")
-            try:
-                if isinstance(command, tuple):
-                    cursor.execute(command[0], command[1])
-                else:
-                    cursor.execute(command)
-            except sq.IntegrityError as error:
+            statement, row = command if isinstance(command, tuple) else (command, None)
+            grouped.setdefault(statement, []).append(row)
+        with self.session() as cursor:
+            for statement, rows in grouped.items():
                 if self.bypassIntegrityErrors:
-                    continue
+                    statement = _INSERT.sub('INSERT OR IGNORE INTO', statement, count=1)
+                if self.verbose:
+                    print(f"pushing {len(rows)} rows: {statement}")
+                if rows[0] is None:
+                    for _ in rows:
+                        cursor.execute(statement)
                 else:
-                    raise error
-        if self.verbose:
-            print(f"commiting.")
-        db.commit()
-        db.close()
+                    cursor.executemany(statement, rows)
 
     def push_from(self, path: str) -> None:
         """ executes and commits a series of SQLite statements from a file.
@@ -68,15 +333,15 @@ class Database:
         """
         if self.verbose:
             print(f"quering: {command}")
-        db = sq.connect(self.db)
-        cursor = db.cursor()
-        if isinstance(command, tuple):
-            cursor.execute(command[0], command[1])
-        else:
-            cursor.execute(command)
-        result = cursor.fetchall()
-        db.close()
-        return result
+        cursor = self.connection.cursor()
+        try:
+            if isinstance(command, tuple):
+                cursor.execute(command[0], command[1])
+            else:
+                cursor.execute(command)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
 
     def push_df(self, table_name: str, df: pd.DataFrame, if_exists: str = 'append') -> None:
         """ stores a dataframe in the database. Simple wrapper for df.to_sql() method.
@@ -85,15 +350,18 @@ class Database:
         :param if_exists: df.to_sql() if_exists param wrapper. Possible: 'fail', 'replace', 'append'.
             Default = 'append'.
         """
-        db = sq.connect(self.db)
-        df.to_sql(table_name, db, if_exists=if_exists)
-        db.close()
+        with self.session():
+            df.to_sql(table_name, self.connection, if_exists=if_exists)
 
-    def to_dataframe(self, select_command: str) -> pd.DataFrame:
+    def to_dataframe(self, select_command: (str, Iterable) or str, dtypes: dict = None,
+                     chunksize: int = None) -> pd.DataFrame or Iterable:
         """ transforms a database selection into a pandas' dataframe.
-        :param select_command: an SQLite select command.
+        :param select_command: an SQLite select command, or a (command, '?'-replacements) pair.
+        :param dtypes: optional column: dtype pairs, applied to the selected columns among them.
+        :param chunksize: if set, an iterator of dataframes of up to chunksize rows is returned instead, so that large
+            selections can be processed in bounded memory.
         """
-        db = sq.connect(self.db)
-        df = pd.read_sql(select_command, db)
-        db.close()
-        return df
+        command, params = select_command if isinstance(select_command, tuple) else (select_command, None)
+        if chunksize is None:
+            return _astype(pd.read_sql(command, self.connection, params=params), dtypes)
+        return (_astype(x, dtypes) for x in pd.read_sql(command, self.connection, params=params, chunksize=chunksize))
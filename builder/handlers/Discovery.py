@@ -0,0 +1,124 @@
+""" Discovery.py grows the 'artistas' database by walking the artists graph. Starting from stored artists, it follows
+the 'related', 'co-authors' and 'appears-on' edges breadth-first, keeps the unknown artists whose genres pass a filter,
+and creates them in batches. Created artists bring their own edges, which form the next level of the walk. """
+
+import json
+
+import builder.handlers.ArtistasDB as dbAR
+
+
+# --- globals ---
+GENRES = ('argentin',)  # an artist passes the filter if any of its genres contains any of these.
+DEPTH = 2
+BATCH_SIZE = 100
+
+
+# --- classes ---
+class Discovery:
+
+    def __init__(self, database: dbAR.ArtistasDB = None, crawler=None, genres: tuple = GENRES, depth: int = DEPTH,
+                 batch_size: int = BATCH_SIZE):
+        """ a breadth-first artist discovery over an ArtistasDB.
+        :param database: the handler to read edges from and to grow. Default: a new ArtistasDB.
+        :param crawler: optional Crawler (see Crawler.py) to create artists with. Default: database.batch_create().
+        :param genres: genre substrings to filter new artists by. Empty for no filter.
+        :param depth: how many edges away from the seeds to look.
+        :param batch_size: how many accepted artists are created at once.
+        """
+        self.database = database if database is not None else dbAR.ArtistasDB()
+        self.crawler = crawler
+        self.genres = tuple(genres)
+        self.depth = depth
+        self.batch_size = batch_size
+        self.failed = {}  # artist_id: error, for the frontier artists whose related artists couldn't be requested.
+
+    def run(self, seeds: list = None) -> list:
+        """ walks the artists graph and creates the accepted artists.
+        :param seeds: the artists to start from. Default: every stored artist.
+        :return: the ids of the created artists, in discovery order. Artists whose related artists couldn't be
+            requested are left in self.failed.
+        """
+        self.failed = {}
+        if seeds is None:
+            seeds = [x[0] for x in self.database.query(
+                f"SELECT {dbAR.KEYS['ARTISTS']} FROM {dbAR.TABLES['ARTISTS']}"
+            )]
+        seen = set(seeds) | self._stored()
+        frontier, created = list(dict.fromkeys(seeds)), []
+        for level in range(1, self.depth + 1):
+            candidates = [x for x in self._neighbours(frontier) if x not in seen]
+            seen.update(candidates)
+            accepted = self._filter(candidates)
+            if self.database.verbose:
+                print(f"depth {level}: {len(candidates)} new artists, {len(accepted)} accepted.")
+            for index in range(0, len(accepted), self.batch_size):
+                self._create(accepted[index:index + self.batch_size])
+            stored = self._stored(accepted)
+            frontier = [x for x in accepted if x in stored]
+            created.extend(frontier)
+            if not frontier:
+                break
+        return created
+
+    def _neighbours(self, frontier: list) -> list:
+        """ :return: the artists one edge away from the frontier. Stored edges are used where they exist, otherwise
+        the related artists are requested. An artist whose request fails is left out, see _fail(). """
+        rows = self.database.query((f"""
+            SELECT {dbAR.KEYS['RELATED']}, other_artist FROM {dbAR.TABLES['RELATED']}
+            WHERE {dbAR.KEYS['RELATED']} IN (SELECT value FROM json_each(?))
+        """, (json.dumps(frontier),)))
+        edges = {}
+        for artist_id, other in rows:
+            edges.setdefault(artist_id, []).append(other)
+        api = self.database.api
+        missing = [x for x in frontier if x not in edges]
+        for artist_id, (related_json, error) in zip(missing, api._map(self._related, missing)):
+            if error is not None:
+                self._fail(artist_id, error)
+                continue
+            edges[artist_id] = [x['id'] for x in related_json['artists']]
+        return list(dict.fromkeys(other for artist_id in frontier for other in edges.get(artist_id, [])))
+
+    def _related(self, artist_id: str) -> tuple:
+        """ :return: the artist's related object and None, or None and the error its request failed with. """
+        try:
+            return self.database.api.artist_related(artist_id), None
+        except Exception as e:
+            return None, e
+
+    def _fail(self, artist_id: str, error: Exception) -> None:
+        """ records a failed related artists request in self.failed and as the artist's crawl job: failed if the error
+        is transient, invalid otherwise (see ArtistasDB.finish_job()). """
+        self.failed[artist_id] = error
+        self.database.push([(f"""
+            INSERT OR IGNORE INTO {dbAR.TABLES['JOBS']} ({dbAR.KEYS['JOBS']}, state, attempts) VALUES (?, 'pending', 0)
+        """, (artist_id,))])
+        self.database.finish_job(artist_id, error)
+        if self.database.verbose:
+            print(f"failed {artist_id}: {error}")
+
+    def _filter(self, candidates: list) -> list:
+        """ :return: the candidates with a genre that matches the genre filter. """
+        if not self.genres:
+            return candidates
+        return [
+            artist_id for (artist_id, json_artist) in zip(candidates, self.database.api.artists(candidates))
+            if json_artist and any(g in genre for genre in json_artist['genres'] for g in self.genres)
+        ]
+
+    def _create(self, artist_ids: list) -> None:
+        if self.crawler is not None:
+            self.crawler.crawl(artist_ids)
+        else:
+            self.database.batch_create(artist_ids)
+
+    def _stored(self, artist_ids: list = None) -> set:
+        """ :return: the ids of the given (or all) artists that are stored. """
+        if artist_ids is None:
+            query = f"SELECT {dbAR.KEYS['ARTISTS']} FROM {dbAR.TABLES['ARTISTS']}"
+        else:
+            query = (f"""
+                SELECT {dbAR.KEYS['ARTISTS']} FROM {dbAR.TABLES['ARTISTS']}
+                WHERE {dbAR.KEYS['ARTISTS']} IN (SELECT value FROM json_each(?))
+            """, (json.dumps(artist_ids),))
+        return {x[0] for x in self.database.query(query)}
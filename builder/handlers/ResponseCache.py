@@ -0,0 +1,162 @@
+""" ResponseCache.py is a persistent cache for spotify's web api responses, keyed by endpoint and params. Entries expire
+after a per-endpoint TTL, and the least recently used ones are evicted once the cache grows past its size cap. """
+
+import json
+import time
+import zlib
+import threading
+
+import builder.paths as paths
+import builder.handlers.Database as db
+
+
+# --- globals ---
+DAY = 60 * 60 * 24
+TTLS = {  # endpoint: seconds a response stays valid. Endpoints not listed are never cached.
+    'artist': DAY,
+    'artist_albums': DAY,
+    'artist_related_artists': 7 * DAY,
+    'artist_top_tracks': DAY,
+    'album_tracks': 30 * DAY,
+    'audio_features': 365 * DAY,  # computed once per track, does not change.
+}
+MAX_BYTES = 512 * 1024 * 1024
+EVICT_TO = 0.9  # once over MAX_BYTES, evict down to this fraction of it.
+
+schema = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    endpoint TEXT NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+"""
+
+
+# --- classes ---
+class ResponseCache(db.Database):
+
+    def __init__(self, database_path: str = paths.response_cache, ttls: dict = None, max_bytes: int = MAX_BYTES):
+        """ a handler for the response cache database.
+        :param database_path: the relative path to the database.
+        :param ttls: endpoint: seconds pairs. Default: TTLS.
+        :param max_bytes: size cap for the stored responses.
+        """
+        super().__init__(database_path)
+        self.ttls = TTLS if ttls is None else ttls
+        self.max_bytes = max_bytes
+        self.connection.executescript(schema)
+        self.lock = threading.Lock()
+        self.size = self.query("SELECT coalesce(sum(size), 0) FROM responses;")[0][0]
+        self.counters = {}
+        self.evictions = 0
+
+    def cacheable(self, endpoint: str) -> bool:
+        """ :return: True if responses of endpoint are cached. """
+        return bool(self.ttls.get(endpoint))
+
+    def get(self, endpoint: str, params) -> object:
+        """ :return: the cached response for endpoint and params, or None if missing or expired. """
+        return self.get_many(endpoint, [params])[0]
+
+    def get_many(self, endpoint: str, params_list: list) -> list:
+        """ looks up many responses of the same endpoint with a single query.
+        :param endpoint: the endpoint's name.
+        :param params_list: json-serializable params, one for each response.
+        :return: the cached responses, aligned with params_list. None where missing or expired.
+        """
+        if not self.cacheable(endpoint) or not params_list:
+            return [None] * len(params_list)
+        keys = [_key(endpoint, x) for x in params_list]
+        now = time.time()
+        rows = dict(self.query((
+            "SELECT key, body FROM responses WHERE key IN (SELECT value FROM json_each(?)) AND created > ?;",
+            (json.dumps(keys), now - self.ttls[endpoint])
+        )))
+        if rows:
+            self.push_many([("UPDATE responses SET last_used = ? WHERE key = ?;", (now, k)) for k in rows])
+        self._count(endpoint, 'hits', len(rows))
+        self._count(endpoint, 'misses', len(keys) - len(rows))
+        return [json.loads(zlib.decompress(rows[k])) if k in rows else None for k in keys]
+
+    def put(self, endpoint: str, params, response) -> None:
+        """ stores the response for endpoint and params. """
+        self.put_many(endpoint, [params], [response])
+
+    def put_many(self, endpoint: str, params_list: list, responses: list) -> None:
+        """ stores many responses of the same endpoint in a single transaction. None responses are not stored.
+        :param endpoint: the endpoint's name.
+        :param params_list: json-serializable params, one for each response.
+        :param responses: json-serializable responses, aligned with params_list.
+        """
+        if not self.cacheable(endpoint):
+            return
+        now = time.time()
+        rows = []
+        for params, response in zip(params_list, responses):
+            if response is not None:
+                body = zlib.compress(json.dumps(response, separators=(',', ':')).encode('utf-8'))
+                rows.append((_key(endpoint, params), endpoint, body, len(body), now, now))
+        if not rows:
+            return
+        with self.session() as cursor:
+            keys = json.dumps([x[0] for x in rows])
+            replaced = cursor.execute(
+                "SELECT coalesce(sum(size), 0) FROM responses WHERE key IN (SELECT value FROM json_each(?));", (keys,)
+            ).fetchone()[0]
+            cursor.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?);", rows)
+        self._count(endpoint, 'stores', len(rows))
+        with self.lock:
+            self.size += sum(x[3] for x in rows) - replaced
+            over = self.size > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self) -> None:
+        """ deletes expired responses, then the least recently used ones until the cache is under its size cap. """
+        now = time.time()
+        with self.session() as cursor:
+            for endpoint, ttl in self.ttls.items():
+                if ttl:
+                    cursor.execute("DELETE FROM responses WHERE endpoint = ? AND created <= ?;", (endpoint, now - ttl))
+            cursor.execute("""
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, sum(size) OVER (ORDER BY last_used DESC, key) AS kept FROM responses
+                    ) WHERE kept > ?
+                );
+            """, (int(self.max_bytes * EVICT_TO),))
+            evicted = cursor.rowcount
+            size = cursor.execute("SELECT coalesce(sum(size), 0) FROM responses;").fetchone()[0]
+        with self.lock:
+            self.size = size
+            self.evictions += evicted
+
+    def clear(self, endpoint: str = None) -> None:
+        """ deletes every cached response, or only those of an endpoint. """
+        self.push([("DELETE FROM responses WHERE endpoint = ? OR ? IS NULL;", (endpoint, endpoint))])
+        with self.lock:
+            self.size = self.query("SELECT coalesce(sum(size), 0) FROM responses;")[0][0]
+
+    def stats(self) -> dict:
+        """ :return: hits, misses and stores, in total and by endpoint, plus evictions and the stored bytes. """
+        with self.lock:
+            by_endpoint = {k: dict(v) for (k, v) in self.counters.items()}
+            total = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': self.evictions, 'bytes': self.size}
+        for counters in by_endpoint.values():
+            for name, value in counters.items():
+                total[name] += value
+        return {**total, 'endpoints': by_endpoint}
+
+    def _count(self, endpoint: str, counter: str, amount: int) -> None:
+        with self.lock:
+            counters = self.counters.setdefault(endpoint, {'hits': 0, 'misses': 0, 'stores': 0})
+            counters[counter] += amount
+
+
+# --- functions ---
+def _key(endpoint: str, params) -> str:
+    return f"{endpoint}:{json.dumps(params, sort_keys=True, separators=(',', ':'))}"
@@ -2,30 +2,60 @@
 web scrapping. Note that the scrapping-related functions may break if spotify modifies the source webpages' structure.
 """
 
-import credentials
+import builder.paths as paths
 import builder.utils.Helper as helper
+import builder.utils.Scheduler as scheduler
+import builder.handlers.ResponseCache as responseCache
 
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
 import spotipy.exceptions
+import requests
 
 import re
 import json
 import warnings
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# --- globals ---
+MAX_CONCURRENT_REQUESTS = 8
+# shared by every GET instance and thread. Held only while a request is on the wire, not while it waits or backs off.
+_IN_FLIGHT = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+FEATURES_BATCH = 100  # max ids per audio-features request.
+ARTISTS_BATCH = 50  # max ids per several-artists request.
 
 
 # --- classes ---
 class GET:
 
-    def __init__(self, credentials_dict: dict = credentials.credentials):
+    def __init__(self, credentials_dict: dict = None, max_workers: int = MAX_CONCURRENT_REQUESTS,
+                 spotify: spotipy.Spotify = None, cache_path: str = paths.response_cache, scraper=None):
         """ defines a series of getters for spotify's web api and web pages. \n
         :param credentials_dict: contains the CLIENT_ID and CLIENT_SECRET keys for spotify's api authentication.
+            Default: the unversioned credentials.py module's, imported only if no spotify client is given.
+        :param max_workers: how many requests this instance may run in parallel. All instances together are further
+            bounded by MAX_CONCURRENT_REQUESTS.
+        :param spotify: optional pre-built client, eg. a SpotifyStub for offline runs.
+        :param cache_path: the relative path to the response cache database. None disables the cache.
+        :param scraper: optional page getter, (url, limit) -> BeautifulSoup, eg. SpotifyStub.html. Default:
+            Helper.get_html.
         """
-        auth_manager = SpotifyClientCredentials(
-            client_id=credentials_dict['CLIENT_ID'],
-            client_secret=credentials_dict['CLIENT_SECRET']
-        )
-        self.spotify = spotipy.Spotify(auth_manager=auth_manager)
+        if spotify is None:
+            if credentials_dict is None:
+                import credentials
+                credentials_dict = credentials.credentials
+            auth_manager = SpotifyClientCredentials(
+                client_id=credentials_dict['CLIENT_ID'],
+                client_secret=credentials_dict['CLIENT_SECRET']
+            )
+            # a plain session, without spotipy's own retries: retries and 429s are handled by the shared scheduler.
+            spotify = spotipy.Spotify(auth_manager=auth_manager, requests_session=requests.Session())
+        self.spotify = spotify
+        self.scraper = helper.get_html if scraper is None else scraper
+        self.pool = ThreadPoolExecutor(max_workers)
+        self.cache = None if cache_path is None else responseCache.ResponseCache(cache_path)
         # flags:
         self.verbose = False
 
@@ -34,30 +64,35 @@ class GET:
         self.verbose = state if state else not self.verbose
 
     def albums(self, artist_id: str, types: tuple = ('album', 'single'), get_tracks: bool = True) -> dict:
-        """ GET wrapper for spotipy's artist_albums() method.
+        """ GET wrapper for spotipy's artist_albums() method. Album pages are fetched in parallel.
         :param artist_id: the spotify artist's id
         :param types: what kind of albums to retrieve. Possible types are 'album', 'single' and 'compilation'.
             Default = ('album', 'single')
         :param get_tracks: should a "tracks":~spotify's tracks object~ key-value pair be added to each album?
-        :return: all album objects for the artist_id that satisfy the given types restriction.
+        :return: all album objects for the artist_id that satisfy the given types restriction. A 'complete' key tells
+            whether every page of the listing was fetched.
         """
         if self.verbose:
             print(f'getting albums for {artist_id}.')
 
-        json_albums = helper.try_request(lambda: self.spotify.artist_albums(artist_id))
+        json_albums = self._request(lambda: self.spotify.artist_albums(artist_id), 'artist_albums', [artist_id, 0])
         # Separate filter as artist_albums()'s album_type parameter does not allow for multiple type constraints.
         json_albums['items'] = [x for x in json_albums['items'] if x['album_type'] in types]
         # get the rest of the albums.
-        for offset in range(20, json_albums['total'], 20):
-            try:
-                more_albums = helper.try_request(lambda: self.spotify.artist_albums(artist_id, offset=offset))['items']
-                json_albums['items'].extend([x for x in more_albums if x['album_type'] in types])
-            except spotipy.exceptions.SpotifyException:  # most likely 404 error
-                continue
+        more_pages = self._map(
+            lambda offset: self._page(
+                lambda: self.spotify.artist_albums(artist_id, offset=offset), 'artist_albums', [artist_id, offset]
+            ),
+            range(20, json_albums['total'], 20)
+        )
+        for more_albums in more_pages:
+            if more_albums:
+                json_albums['items'].extend([x for x in more_albums['items'] if x['album_type'] in types])
+        json_albums['complete'] = all(more_pages)  # False if a page could not be fetched.
         # get the album's tracks
         if get_tracks:
-            for album in json_albums['items']:
-                album['tracks'] = self.tracks(album['id'])
+            for album, json_tracks in zip(json_albums['items'], self.albums_tracks(json_albums['items'])):
+                album['tracks'] = json_tracks
 
         return json_albums
 
@@ -68,36 +103,68 @@ class GET:
             track?
         :return: all track objects for the given album_id.
         """
+        return self.albums_tracks([{'id': album_id}], get_features)[0]
+
+    def albums_tracks(self, albums: list, get_features: bool = True) -> list:
+        """ GET wrapper for spotipy's album_tracks() method, for many albums at once. The first page of every album,
+        the remaining pages and the tracks' features are each fetched in parallel.
+        :param albums: spotify album objects, or at least {'id': album_id} dicts.
+        :param get_features: should a "features":~spotify's audio-analysis object~ key-value pair be added to each
+            track?
+        :return: all track objects for each album, in the same order.
+        """
         if self.verbose:
-            print(f'getting tracks for: {album_id}.')
+            print(f'getting tracks for: {[x["id"] for x in albums]}.')
 
-        json_tracks = helper.try_request(lambda: self.spotify.album_tracks(album_id))
-        total = json_tracks['total']
-        for offset in range(50, total, 50):
-            try:
-                more_tracks = helper.try_request(lambda: self.spotify.album_tracks(album_id, offset=offset))["items"]
-                json_tracks["items"].extend(more_tracks)
-            except spotipy.exceptions.SpotifyException:  # most likely 404 error
-                continue
+        albums_tracks = self._map(
+            lambda album: self._request(
+                lambda: self.spotify.album_tracks(album['id']), 'album_tracks', [album['id'], 0]
+            ), albums
+        )
+        more = [
+            (json_tracks, album['id'], offset)
+            for album, json_tracks in zip(albums, albums_tracks)
+            for offset in range(50, json_tracks['total'], 50)
+        ]
+        more_pages = self._map(
+            lambda x: self._page(lambda: self.spotify.album_tracks(x[1], offset=x[2]), 'album_tracks', [x[1], x[2]]),
+            more
+        )
+        for (json_tracks, _, _), more_tracks in zip(more, more_pages):
+            if more_tracks:
+                json_tracks["items"].extend(more_tracks["items"])
         # get the album's features
         if get_features:
-            for track in json_tracks['items']:
-                track['features'] = self.track_features(track['id'])
+            items = [track for json_tracks in albums_tracks for track in json_tracks['items']]
+            for track, features in zip(items, self.tracks_features([x['id'] for x in items])):
+                track['features'] = features
 
-        return json_tracks
+        return albums_tracks
 
-    def track_features(self, track_id: str) -> dict:
+    def track_features(self, track_id: str) -> list:
         """ GET wrapper for spotipy's audio_features() method. \n
         :param track_id: the spotify track's id.
-        :return: the audio features object for the given track_id.
+        :return: a one-element list with the audio features object for the given track_id, or None if unavailable.
+        """
+        return self.tracks_features([track_id])[0]
+
+    def tracks_features(self, track_ids: list) -> list:
+        """ GET wrapper for spotipy's audio_features() method, for many tracks. Cached features are looked up first.
+        The rest are sent in batches of FEATURES_BATCH, the most the endpoint accepts, fetched in parallel. \n
+        :param track_ids: the spotify tracks' ids.
+        :return: for each track_id, in order, a one-element list with its audio features object (or None if
+            unavailable). Ie. the same shape as track_features().
         """
         if self.verbose:
-            print(f'getting track features for {track_id}.')
-        try:
-            audio_features = helper.try_request(lambda: self.spotify.audio_features(track_id))
-            return audio_features
-        except spotipy.exceptions.SpotifyException:  # no audio features for this track.
-            return {}
+            print(f'getting track features for {len(track_ids)} tracks.')
+        features = self.cache.get_many('audio_features', track_ids) if self.cache else [None] * len(track_ids)
+        missing = [x for (x, cached) in zip(track_ids, features) if cached is None]
+        batches = [missing[i:i + FEATURES_BATCH] for i in range(0, len(missing), FEATURES_BATCH)]
+        fetched = [x for batch in self._map(self._features_batch, batches) for x in batch]
+        if self.cache:
+            self.cache.put_many('audio_features', missing, fetched)
+        fetched = iter(fetched)
+        return [[next(fetched) if x is None else x] for x in features]
 
     def artist(self, artist_id: str) -> dict:
         """ GET wrapper for spotipy's artist() method. \n
@@ -107,9 +174,29 @@ class GET:
         if self.verbose:
             print(f'getting artist {artist_id}.')
 
-        json_artist = helper.try_request(lambda: self.spotify.artist(artist_id))
+        json_artist = self._request(lambda: self.spotify.artist(artist_id), 'artist', artist_id)
         return json_artist
 
+    def artists(self, artist_ids: list) -> list:
+        """ GET wrapper for spotipy's artists() method. Cached artists are looked up first, the rest are sent in
+        batches of ARTISTS_BATCH, fetched in parallel. \n
+        :param artist_ids: the spotify artists' ids.
+        :return: the artist objects, in order. None for unknown ids.
+        """
+        if self.verbose:
+            print(f'getting {len(artist_ids)} artists.')
+        json_artists = self.cache.get_many('artist', artist_ids) if self.cache else [None] * len(artist_ids)
+        missing = [x for (x, cached) in zip(artist_ids, json_artists) if cached is None]
+        batches = [missing[i:i + ARTISTS_BATCH] for i in range(0, len(missing), ARTISTS_BATCH)]
+        fetched = [
+            x for batch in self._map(lambda b: self._request(lambda: self.spotify.artists(b), 'artists'), batches)
+            for x in batch['artists']
+        ]
+        if self.cache:
+            self.cache.put_many('artist', missing, fetched)
+        fetched = iter(fetched)
+        return [next(fetched) if x is None else x for x in json_artists]
+
     def artist_entity(self, artist_id: str) -> dict:  # TODO: fix
         """ scrapping method for spotify's 'entity' object. BROKEN. \n
         :param artist_id: the spotify artist's id.
@@ -119,7 +206,7 @@ class GET:
             print(f'getting artist entity for {artist_id}.')
 
         address = f'https://open.spotify.com/artist/{artist_id}'
-        html = helper.try_request(lambda: helper.get_html(address))
+        html = self._html(address)
         script = html.find('script', text=lambda x: x and 'Spotify.Entity' in x)
         search = re.search(r"Entity\s*=\s*(.*?};)\s*\n", str(script), flags=re.DOTALL)
         json_artist_entity = None if not search else json.loads(search[1][:-1])
@@ -138,7 +225,7 @@ class GET:
             print(f'getting artist listeners for {artist_id}')
 
         address = f'https://open.spotify.com/artist/{artist_id}'
-        html = helper.try_request(lambda: helper.get_html(address))
+        html = self._html(address)
         div_class = "view more-by horizontal-list"
         try:
             text = html.findAll(class_=div_class)[0].text
@@ -193,7 +280,9 @@ class GET:
         if self.verbose:
             print(f'getting related artists for {artist_id}.')
 
-        json_related = helper.try_request(lambda: self.spotify.artist_related_artists(artist_id))
+        json_related = self._request(
+            lambda: self.spotify.artist_related_artists(artist_id), 'artist_related_artists', artist_id
+        )
         return json_related
 
     def artist_top_tracks(self, artist_id: str) -> dict:
@@ -204,17 +293,66 @@ class GET:
         if self.verbose:
             print(f'getting top tracks for {artist_id}.')
 
-        json_top_tracks = helper.try_request(lambda: self.spotify.artist_top_tracks(artist_id))
+        json_top_tracks = self._request(
+            lambda: self.spotify.artist_top_tracks(artist_id), 'artist_top_tracks', artist_id
+        )
         return json_top_tracks
 
     def all(self, artist_id: str) -> [dict, str, list, dict, dict]:
-        """ getter for all methods. \n
+        """ getter for all methods. The artist, bio, listeners and related requests run in parallel with the albums
+        crawl. \n
         :param artist_id: the spotify artist's id.
         :return: the artist's object, bio, listeners, albums and related artists.
         """
-        artist_json = self.artist(artist_id)
-        artist_bio = self.artist_bio(artist_id)
-        artist_listeners = self.artist_listeners(artist_id)
+        artist_json = self.pool.submit(self.artist, artist_id)
+        artist_bio = self.pool.submit(self.artist_bio, artist_id)
+        artist_listeners = self.pool.submit(self.artist_listeners, artist_id)
+        related_json = self.pool.submit(self.artist_related, artist_id)
         albums_json = self.albums(artist_id)
-        related_json = self.artist_related(artist_id)
-        return artist_json, artist_bio, artist_listeners, albums_json, related_json
+        return artist_json.result(), artist_bio.result(), artist_listeners.result(), albums_json, related_json.result()
+
+    # --- engine ---
+    def _request(self, request, endpoint: str = 'default', params=None):
+        """ runs a request under the global concurrency limit, paced and retried by the shared scheduler. If params
+        are given, the response is looked up in and stored to the response cache. """
+        cached = params is not None and self.cache and self.cache.cacheable(endpoint)
+        if cached:
+            response = self.cache.get(endpoint, params)
+            if response is not None:
+                return response
+        response = helper.try_request(request, endpoint, _IN_FLIGHT)
+        if cached:
+            self.cache.put(endpoint, params, response)
+        return response
+
+    def _html(self, address: str):
+        """ scraps a page under the global concurrency limit. The scraper goes through the shared scheduler itself. """
+        return self.scraper(address, _IN_FLIGHT)
+
+    def _page(self, request, endpoint: str = 'default', params=None):
+        """ runs a request for an extra page. :return: None if the page is not available. """
+        try:
+            return self._request(request, endpoint, params)
+        except spotipy.exceptions.SpotifyException:  # most likely 404 error
+            return None
+
+    def _features_batch(self, track_ids: list) -> list:
+        """ gets the audio features of up to FEATURES_BATCH tracks. A failed batch is split in halves and retried, so
+        that a single bad id only loses its own features.
+        :return: the tracks' audio features objects, or None for those without. """
+        try:
+            features = self._request(lambda: self.spotify.audio_features(track_ids), 'audio_features')
+        except spotipy.exceptions.SpotifyException as e:  # eg. a 400 for a bad id, or no features for the tracks.
+            if len(track_ids) == 1 or scheduler.is_transient(e):  # the scheduler already retried transient errors.
+                return [None] * len(track_ids)
+            half = len(track_ids) // 2
+            return self._features_batch(track_ids[:half]) + self._features_batch(track_ids[half:])
+        return features if features else [None] * len(track_ids)
+
+    def _map(self, fn, items) -> list:
+        """ applies fn to every item in parallel, keeping the order. Must not be called from inside the pool, unless
+        there is a single item. """
+        items = list(items)
+        if len(items) <= 1:
+            return [fn(x) for x in items]
+        return list(self.pool.map(fn, items))
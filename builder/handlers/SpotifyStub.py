@@ -0,0 +1,197 @@
+""" SpotifyStub.py is an offline stand-in for spotipy.Spotify and for the scrapped artist pages. It answers every
+endpoint SpotifyAPI.GET uses with generated, deterministic objects after a simulated latency, so the crawl pipeline can
+be measured and tested without credentials, quota or network. Use it as:
+    stub = SpotifyStub()
+    api = GET(spotify=stub, scraper=stub.html, cache_path=None)
+"""
+
+import builder.utils.Scheduler as scheduler
+
+from bs4 import BeautifulSoup as BS
+
+import json
+import time
+import random
+import zlib
+import threading
+
+
+# --- globals ---
+ALBUMS_PAGE = 20  # items per artist_albums() page, as spotify's default.
+TRACKS_PAGE = 50  # items per album_tracks() page, as spotify's default.
+ALBUM_TYPES = ('album', 'single')
+CITIES = ('Buenos Aires', 'Córdoba', 'Rosario', 'Mendoza', 'La Plata')  # no digits: the scrapper drops them.
+FEATURES = {  # feature: (min, max). Integer features use integer bounds.
+    'key': (0, 11),
+    'mode': (0, 1),
+    'time_signature': (3, 7),
+    'tempo': (60.0, 200.0),
+    'danceability': (0.0, 1.0),
+    'energy': (0.0, 1.0),
+    'valence': (0.0, 1.0),
+    'loudness': (-30.0, 0.0),
+    'speechiness': (0.0, 1.0),
+    'acousticness': (0.0, 1.0),
+    'instrumentalness': (0.0, 1.0),
+    'liveness': (0.0, 1.0),
+}
+
+
+# --- classes ---
+class SpotifyStub:
+
+    def __init__(self, latency: float = 0.05, albums: int = 30, tracks: int = 12, related: int = 20,
+                 shared_albums: int = 0, missing_features: float = 0.05, seed: int = 0):
+        """ a spotipy-like client that generates its answers. Each artist id maps to the same catalog on every run.
+        :param latency: seconds every request takes, to simulate the network round trip.
+        :param albums: albums per artist.
+        :param tracks: tracks per album.
+        :param related: related artists per artist.
+        :param shared_albums: how many of each artist's albums are the same, shared, albums. Mimics collaborations,
+            where different artists list the same album and tracks.
+        :param missing_features: share of tracks without audio features.
+        :param seed: changes every generated value.
+        """
+        self.latency = latency
+        self.albums = albums
+        self.tracks = tracks
+        self.related = related
+        self.shared_albums = shared_albums
+        self.missing_features = missing_features
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.requests = {}
+
+    # --- spotipy interface ---
+    def artist(self, artist_id: str) -> dict:
+        self._call('artist')
+        return self._artist(artist_id)
+
+    def artists(self, artist_ids: list) -> dict:
+        self._call('artists')
+        return {'artists': [self._artist(x) for x in artist_ids]}
+
+    def artist_albums(self, artist_id: str, offset: int = 0, limit: int = ALBUMS_PAGE) -> dict:
+        self._call('artist_albums')
+        ids = self._album_ids(artist_id)
+        items = [self._album(album_id, artist_id) for album_id in ids[offset:offset + limit]]
+        return {'items': items, 'total': len(ids), 'offset': offset, 'limit': limit}
+
+    def album_tracks(self, album_id: str, offset: int = 0, limit: int = TRACKS_PAGE) -> dict:
+        self._call('album_tracks')
+        ids = [f'{album_id}-tr{i:03d}' for i in range(self.tracks)]
+        items = [self._track(track_id, i + offset) for (i, track_id) in enumerate(ids[offset:offset + limit])]
+        return {'items': items, 'total': len(ids), 'offset': offset, 'limit': limit}
+
+    def audio_features(self, track_ids: list) -> list:
+        self._call('audio_features')
+        return [self._features(x) for x in track_ids]
+
+    def artist_related_artists(self, artist_id: str) -> dict:
+        self._call('artist_related_artists')
+        rng = self._rng(artist_id, 'related')
+        return {'artists': [self._artist(f'ar{rng.randrange(10 ** 6):06d}') for _ in range(self.related)]}
+
+    def artist_top_tracks(self, artist_id: str) -> dict:
+        self._call('artist_top_tracks')
+        album_id = self._album_ids(artist_id)[0]
+        return {'tracks': [self._track(f'{album_id}-tr{i:03d}', i) for i in range(min(10, self.tracks))]}
+
+    # --- scrapping interface ---
+    def html(self, url: str, limit=None) -> BS:
+        """ the artist page for the given url, with its entity script and listeners list. Goes through the shared
+        scheduler's 'html' endpoint with the given limit, like Helper.get_html. """
+        def request():
+            self._call('html')
+            return page
+
+        artist_id = url.rstrip('/').split('/')[-1]
+        rng = self._rng(artist_id, 'html')
+        entity = {'artist': {'profile': {
+            'biography': {'text': f'bio for {artist_id}.'},
+            'externalLinks': {'items': []},
+        }}}
+        listeners = ''.join(f'{city}, AR{rng.randrange(1, 10 ** 5)}LISTENERS' for city in CITIES)
+        page = (
+            f'<html><body><script>Spotify.Entity = {json.dumps(entity)};\n</script>'
+            f'<div class="view more-by horizontal-list">Where people listen{listeners}</div></body></html>'
+        )
+        return BS(scheduler.SCHEDULER.run(request, 'html', limit), 'html.parser')
+
+    # --- stats ---
+    def stats(self) -> dict:
+        """ :return: the amount of requests answered, by endpoint. """
+        with self.lock:
+            return dict(self.requests)
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            self.requests = {}
+
+    # --- generators ---
+    def _call(self, endpoint: str) -> None:
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _rng(self, *keys) -> random.Random:
+        return random.Random(zlib.crc32(':'.join(map(str, (self.seed, *keys))).encode()))
+
+    def _artist(self, artist_id: str) -> dict:
+        rng = self._rng(artist_id, 'artist')
+        return {
+            'id': artist_id,
+            'name': f'artist {artist_id}',
+            'popularity': rng.randrange(101),
+            'followers': {'total': int(10 ** rng.uniform(1, 7))},
+            'genres': [f'genre {rng.randrange(50)}' for _ in range(rng.randrange(4))],
+            'external_urls': {'spotify': f'https://open.spotify.com/artist/{artist_id}'},
+            'images': [{'url': f'https://i.scdn.co/image/{artist_id}-{size}'} for size in (640, 320, 60)],
+        }
+
+    def _album_ids(self, artist_id: str) -> list:
+        shared = [f'shared-al{i:03d}' for i in range(min(self.shared_albums, self.albums))]
+        return shared + [f'{artist_id}-al{i:03d}' for i in range(self.albums - len(shared))]
+
+    def _album(self, album_id: str, artist_id: str) -> dict:
+        rng = self._rng(album_id, 'album')
+        album_type = rng.choice(ALBUM_TYPES)
+        precision = rng.choice(('day', 'day', 'day', 'month', 'year'))
+        release_date = f'{rng.randrange(1960, 2022)}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}'
+        release_date = release_date[:{'day': 10, 'month': 7, 'year': 4}[precision]]
+        return {
+            'id': album_id,
+            'name': f'album {album_id}',
+            'album_group': 'appears_on' if album_id.startswith('shared') else album_type,
+            'album_type': album_type,
+            'release_date': release_date,
+            'release_date_precision': precision,
+            'total_tracks': self.tracks,
+            'artists': [{'id': artist_id}],
+            'external_urls': {'spotify': f'https://open.spotify.com/album/{album_id}'},
+            'images': [{'url': f'https://i.scdn.co/image/{album_id}-{size}'} for size in (640, 320, 60)],
+        }
+
+    def _track(self, track_id: str, index: int) -> dict:
+        rng = self._rng(track_id, 'track')
+        return {
+            'id': track_id,
+            'name': f'track {track_id}',
+            'disc_number': 1,
+            'track_number': index + 1,
+            'explicit': rng.random() < 0.1,
+            'duration_ms': rng.randrange(60000, 420000),
+            'artists': [{'id': track_id.split('-')[0]}],
+            'external_urls': {'spotify': f'https://open.spotify.com/track/{track_id}'},
+        }
+
+    def _features(self, track_id: str) -> dict or None:
+        rng = self._rng(track_id, 'features')
+        if rng.random() < self.missing_features:
+            return None
+        features = {
+            name: rng.randint(low, high) if isinstance(low, int) else round(rng.uniform(low, high), 3)
+            for (name, (low, high)) in FEATURES.items()
+        }
+        return {'id': track_id, **features}
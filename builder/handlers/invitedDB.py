@@ -1,6 +1,7 @@
 import pprint
 
 import builder.handlers.Database as db
+import builder.handlers.ArtistasDB as dbAR
 import builder.paths as paths
 import builder.handlers.SpotifyAPI as api
 
@@ -40,3 +41,4 @@ class InvitedDB(db.Database):
             self.create_entry(*ids)
         self.bypass_integrity_errors(False)
         self.toggle_verbose(False)
+        dbAR.ArtistasDB().refresh_facts(self.db)  # the album facts' n_invited.
@@ -17,6 +17,11 @@ import builder.builders.FridaySeriesBuilder as fridaySB
 import builder.builders.invitedArtistsBuilder as invitedSB
 
 if __name__ == '__main__':
+    # schema migrations run here, never on import. See Database.migrate().
+    dbAR.ArtistasDB().migrate()
+    dbAN.AnalisisDB().migrate()
+    # release facts are refreshed after every ingestion. This catches up databases written before they existed.
+    dbAR.ArtistasDB().refresh_facts()
     histogramB.build_duration()
     pass
 
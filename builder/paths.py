@@ -1,6 +1,7 @@
 artistas_db = 'database/artistas.db'
 analisis_db = 'database/analisis.db'
 invited_db = 'database/invited.db'
+response_cache = 'database/cache.db'
 artistas_json = 'database/artistas.json'
 generated = 'database/generated'
 artistas_dataset = generated + '/datasets'
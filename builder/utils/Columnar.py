@@ -0,0 +1,95 @@
+""" Columnar.py reads and writes 'bundle' files: a set of named, typed-array-friendly numpy columns plus a string table,
+stored back to back so that a browser can map each column to a TypedArray without parsing.
+
+layout (little-endian):
+    magic b'SPCB' | version: uint32 | header length: uint32 | header: utf-8 json | columns, each aligned to 8 bytes.
+the header holds, for each column, its dtype, shape and byte offset from the start of the file. The string table is
+stored as two columns: '_strings' (the utf-8 bytes of every string, concatenated) and '_string_offsets' (uint32, one
+more than the amount of strings). Columns reference strings by their index in the table.
+"""
+
+import json
+import struct
+
+import numpy as np
+
+# --- globals ---
+MAGIC = b'SPCB'
+VERSION = 1
+ALIGN = 8
+DTYPES = ['float32', 'float64', 'int8', 'uint8', 'int16', 'int32', 'uint32']
+
+
+# --- functions ---
+def write_bundle(path: str, filename: str, columns: dict, strings: list = None, meta: dict = None) -> int:
+    """ stores a set of columns as a bundle file.
+    :param path: the relative folder path (no '/' ending).
+    :param filename: the name for the file to create, without extension.
+    :param columns: name: numpy array pairs. Only DTYPES are allowed.
+    :param strings: optional string table.
+    :param meta: optional json-serializable metadata.
+    :return: the size in bytes of the written file.
+    """
+    columns = dict(columns)
+    encoded = [x.encode('utf-8') for x in (strings or [])]
+    columns['_strings'] = np.frombuffer(b''.join(encoded), dtype='uint8')
+    columns['_string_offsets'] = np.concatenate([[0], np.cumsum([len(x) for x in encoded])]).astype('uint32')
+
+    columns = {k: np.ascontiguousarray(v, dtype=np.asarray(v).dtype.newbyteorder('<')) for (k, v) in columns.items()}
+    relative, size = {}, 0
+    for name, column in columns.items():
+        if column.dtype.name not in DTYPES:
+            raise TypeError(f"column '{name}' has unsupported dtype {column.dtype.name}. Possible: {DTYPES}.")
+        relative[name] = size
+        size += _aligned(column.nbytes)
+    start = 0
+    while True:  # column offsets are absolute, so the header length depends on where the columns start.
+        header = {
+            "columns": {
+                name: {"dtype": column.dtype.name, "shape": list(column.shape), "offset": start + relative[name]}
+                for (name, column) in columns.items()
+            },
+            "meta": meta or {}
+        }
+        raw_header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        needed = _aligned(len(MAGIC) + 8 + len(raw_header))
+        if needed <= start:
+            raw_header += b' ' * (start - len(MAGIC) - 8 - len(raw_header))
+            break
+        start = needed
+
+    with open(f'{path}/{filename}.bin', 'wb') as file:
+        file.write(MAGIC + struct.pack('<II', VERSION, len(raw_header)) + raw_header)
+        for column in columns.values():
+            data = column.tobytes()
+            file.write(data + b'\0' * (_aligned(len(data)) - len(data)))
+    return start + size
+
+
+def read_bundle(path: str) -> (dict, list, dict):
+    """ loads a bundle file.
+    :param path: the relative path to the file.
+    :return: the columns (as read-only numpy arrays), the string table and the metadata.
+    """
+    with open(path, 'rb') as file:
+        content = file.read()
+    if content[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a bundle file.")
+    version, header_length = struct.unpack_from('<II', content, len(MAGIC))
+    if version != VERSION:
+        raise ValueError(f"unsupported bundle version {version}.")
+    header = json.loads(content[len(MAGIC) + 8:len(MAGIC) + 8 + header_length])
+    columns = {}
+    for name, column in header["columns"].items():
+        dtype = np.dtype(column["dtype"]).newbyteorder('<')
+        count = int(np.prod(column["shape"]))
+        columns[name] = np.frombuffer(content, dtype=dtype, count=count, offset=column["offset"]) \
+            .reshape(column["shape"])
+    blob = columns.pop('_strings').tobytes()
+    offsets = columns.pop('_string_offsets')
+    strings = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+    return columns, strings, header["meta"]
+
+
+def _aligned(size: int) -> int:
+    return -(-size // ALIGN) * ALIGN
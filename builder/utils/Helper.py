@@ -1,8 +1,16 @@
 import requests
 import json
+import gzip
 from bs4 import BeautifulSoup as BS
 import datetime
 
+import builder.utils.Scheduler as scheduler
+
+try:
+    import brotli
+except ImportError:  # optional. Only needed for '.br' json output.
+    brotli = None
+
 
 # --- globals ---
 CSVFMT = ' ; '
@@ -61,16 +69,54 @@ def load_json(path: str) -> dict:
     """loads a json into a dict.
     :param path: the relative path to the json file.
     """
-    return json.load(open(path), encoding='utf-8')
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
 
 
-def save_json(data: dict, path: str, filename: str) -> None:
+def save_json(data: dict, path: str, filename: str,
+              compact: bool = False, precision: int = None, compress: tuple = ()) -> dict:
     """stores a json in the given path.
     :param data: the object to save.
     :param path: the relative folder path (no '/' ending).
     :param filename: the name for the file to create.
+    :param compact: if true, the json is minified instead of indented.
+    :param precision: if given, floats are rounded to this many decimals.
+    :param compress: precompressed siblings to write next to the json. Possible: 'gz', 'br' (requires brotli).
+    :return: the size in bytes of each written file, by extension.
     """
-    json.dump(data, open(f'{path}/{filename}.json', "w", encoding='utf-8'), indent=4)
+    if precision is not None:
+        data = round_floats(data, precision)
+    text = json.dumps(data, separators=(',', ':')) if compact else json.dumps(data, indent=4)
+    content = text.encode('utf-8')
+    files = {'.json': content}
+    for extension in compress:
+        if extension == 'gz':
+            files['.json.gz'] = gzip.compress(content, compresslevel=9, mtime=0)
+        elif extension == 'br':
+            if brotli is None:
+                raise ImportError("'br' compression requires the brotli package.")
+            files['.json.br'] = brotli.compress(content, quality=11)
+        else:
+            raise ValueError(f"unknown compression '{extension}'. Possible: 'gz', 'br'.")
+    for extension, content in files.items():
+        with open(f'{path}/{filename}{extension}', 'wb') as file:
+            file.write(content)
+    return {extension: len(content) for extension, content in files.items()}
+
+
+def round_floats(data, precision: int):
+    """ rounds every float inside nested dicts and lists.
+    :param data: the object to round.
+    :param precision: the amount of decimals to keep.
+    :return: a rounded copy of data.
+    """
+    if isinstance(data, float):
+        return round(data, precision)
+    if isinstance(data, dict):
+        return {k: round_floats(v, precision) for (k, v) in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [round_floats(x, precision) for x in data]
+    return data
 
 
 def delete_key(dictionary: dict, key: str, parent: str) -> dict:
@@ -98,25 +144,30 @@ def delete_key(dictionary: dict, key: str, parent: str) -> dict:
 
 
 # --- funciones HTML ---
-def get_html(url: str) -> BS:
-    """requests html from the given url.
+def get_html(url: str, limit=None) -> BS:
+    """requests html from the given url, through the shared request scheduler.
     :param url: the request address.
+    :param limit: optional context manager held only during the request. See Scheduler.run().
     :returns a beautiful soup object."""
-    req = requests.get(url)
+    def request():
+        response = requests.get(url, timeout=10)
+        if response.status_code in scheduler.RETRY_STATUS:
+            response.raise_for_status()
+        return response
+
+    req = scheduler.SCHEDULER.run(request, 'html', limit)
     return BS(req.content, 'html.parser')
 
 
-def try_request(request, tries: int = 10):
-    """simple ConnectionError handling for requests.
+def try_request(request, endpoint: str = 'default', limit=None):
+    """runs a request through the shared request scheduler: rate limited, and retried with backoff on connection
+    errors, 429s and 5xxs. See Scheduler.py.
     :param request: the request function to execute.
-    :param tries: the maximum amount of trials.
+    :param endpoint: the name used for per-endpoint rates and counters.
+    :param limit: optional context manager held only during the request, eg. a concurrency semaphore.
+    :raise: the request's last error, once it is not retryable or tries run out.
     """
-    for i in range(tries):
-        try:
-            return request()
-        except ConnectionError as e:
-            print(f"{e}\n retrying.")
-            continue
+    return scheduler.SCHEDULER.run(request, endpoint, limit)
 
 
 # --- funciones datetime ---
@@ -0,0 +1,176 @@
+""" Scheduler.py paces and retries outgoing requests, so that long crawls stay close to the maximum throughput spotify
+allows without getting banned or failing silently. Every request goes through a global token bucket and, if its
+endpoint has one, through a per-endpoint bucket. Failed requests are retried with exponential backoff and full jitter,
+and a 429 answer pauses every caller for as long as its Retry-After header asks.
+"""
+
+import time
+import random
+import threading
+import contextlib
+
+import requests
+
+try:
+    from spotipy.exceptions import SpotifyException
+except ImportError:  # optional. Only needed to recognize spotipy's errors.
+    SpotifyException = None
+
+
+# --- globals ---
+RATE = 10.0  # requests per second, for all endpoints together.
+BURST = 20  # requests that may be sent at once after a quiet period.
+ENDPOINT_RATES = {  # endpoint: (requests per second, burst). Endpoints not listed are only bound by RATE.
+    # shares of RATE, so that a crawl's many track pages can not starve the artist and album requests.
+    'artist': (2.0, 4),
+    'artists': (1.0, 2),
+    'artist_albums': (2.0, 4),
+    'album_tracks': (5.0, 10),
+    'audio_features': (2.0, 4),
+    'artist_related_artists': (1.0, 2),
+    'artist_top_tracks': (1.0, 2),
+    'html': (2.0, 4),
+}
+TRIES = 8
+BACKOFF = 0.5  # seconds before the first retry. Doubles with each retry, up to MAX_BACKOFF.
+MAX_BACKOFF = 60.0
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+# --- classes ---
+class TokenBucket:
+
+    def __init__(self, rate: float, burst: int):
+        """ a thread-safe token bucket. Tokens are reserved in advance, so callers queue up in arrival order.
+        :param rate: tokens added per second.
+        :param burst: maximum amount of stored tokens.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """ takes a token. :return: how many seconds the caller must wait before using it. """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class Scheduler:
+
+    def __init__(self, rate: float = RATE, burst: int = BURST, endpoint_rates: dict = None, tries: int = TRIES,
+                 backoff: float = BACKOFF, max_backoff: float = MAX_BACKOFF):
+        """ a request scheduler shared by every thread.
+        :param rate: global requests per second.
+        :param burst: global burst size.
+        :param endpoint_rates: endpoint: (requests per second, burst) pairs. Default: ENDPOINT_RATES.
+        :param tries: maximum attempts per request.
+        :param backoff: seconds before the first retry.
+        :param max_backoff: upper bound for a single backoff.
+        """
+        self.bucket = TokenBucket(rate, burst)
+        self.endpoint_buckets = {
+            endpoint: TokenBucket(*limits)
+            for (endpoint, limits) in (ENDPOINT_RATES if endpoint_rates is None else endpoint_rates).items()
+        }
+        self.tries = tries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.reset_stats()
+
+    def run(self, request, endpoint: str = 'default', limit=None):
+        """ runs a request when the buckets allow it, retrying it on connection errors, 429s and 5xxs.
+        :param request: the request function to execute.
+        :param endpoint: the name used for per-endpoint rates and counters.
+        :param limit: optional context manager, eg. a semaphore, held only while the request itself runs: never
+            during the throttling and backoff sleeps.
+        :return: the request's result.
+        :raise: the request's last error, once it is not retryable or tries run out.
+        """
+        for attempt in range(self.tries):
+            self._wait(endpoint)
+            self._count(endpoint, 'requests')
+            try:
+                with limit or contextlib.nullcontext():
+                    return request()
+            except Exception as error:
+                retry_after = _retry_after(error)
+                if retry_after is None or attempt == self.tries - 1:
+                    self._count(endpoint, 'failures')
+                    raise
+                self._count(endpoint, 'retries')
+                if retry_after:  # the server asked everyone to slow down.
+                    with self.lock:
+                        self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+                else:
+                    self._sleep(endpoint, random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    def stats(self) -> dict:
+        """ :return: the counters: requests sent, retries, failures and seconds spent throttled, in total and by
+        endpoint. """
+        with self.lock:
+            by_endpoint = {k: dict(v) for (k, v) in self.counters.items()}
+        total = {'requests': 0, 'retries': 0, 'failures': 0, 'throttled': 0.0}
+        for counters in by_endpoint.values():
+            for name, value in counters.items():
+                total[name] += value
+        return {**total, 'endpoints': by_endpoint}
+
+    def reset_stats(self) -> None:
+        """ sets every counter back to zero. """
+        with self.lock:
+            self.counters = {}
+
+    def _wait(self, endpoint: str) -> None:
+        wait = max(self.bucket.reserve(), self.paused_until - time.monotonic())
+        if endpoint in self.endpoint_buckets:
+            wait = max(wait, self.endpoint_buckets[endpoint].reserve())
+        self._sleep(endpoint, wait)
+
+    def _sleep(self, endpoint: str, seconds: float) -> None:
+        if seconds > 0:
+            self._count(endpoint, 'throttled', seconds)
+            time.sleep(seconds)
+
+    def _count(self, endpoint: str, counter: str, amount: float = 1) -> None:
+        with self.lock:
+            counters = self.counters.setdefault(
+                endpoint, {'requests': 0, 'retries': 0, 'failures': 0, 'throttled': 0.0}
+            )
+            counters[counter] += amount
+
+
+# --- functions ---
+def is_transient(error: Exception) -> bool:
+    """ :return: True if error may not happen again on a later try: connection errors, timeouts, 429s and 5xxs. """
+    return _retry_after(error) is not None
+
+
+def _retry_after(error: Exception) -> float or None:
+    """ :return: None if error is not worth retrying. Otherwise the seconds asked by a Retry-After header, or 0. """
+    if isinstance(error, (ConnectionError, TimeoutError, requests.ConnectionError, requests.Timeout)):
+        return 0.0
+    if SpotifyException is not None and isinstance(error, SpotifyException):
+        status, headers = error.http_status, error.headers
+    elif isinstance(error, requests.HTTPError) and error.response is not None:
+        status, headers = error.response.status_code, error.response.headers
+    else:
+        return None
+    if status not in RETRY_STATUS:
+        return None
+    try:
+        return float((headers or {}).get('Retry-After', 0))
+    except ValueError:  # an http-date instead of seconds.
+        return 0.0
+
+
+# --- shared instance ---
+SCHEDULER = Scheduler()
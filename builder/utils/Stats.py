@@ -1,7 +1,8 @@
 import pandas as pd
 import numpy as np
+from pandas.tseries.frequencies import to_offset
 from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import PCA
+from sklearn.decomposition import PCA, IncrementalPCA
 
 
 def artistas_pca(df: pd.DataFrame, features_cols: list, id_cols: list) -> (pd.DataFrame, [float]):
@@ -25,6 +26,54 @@ def artistas_pca(df: pd.DataFrame, features_cols: list, id_cols: list) -> (pd.Da
     return final_df, pca.explained_variance_ratio_
 
 
+def incremental_pca(chunks, features_cols: list, n_components: int = 2) -> dict:
+    """ fits a standard scaler and a pca out of core, one chunk of rows at a time.
+    :param chunks: a function that returns a new iterable of dataframes on every call. It is called twice: once to fit
+        the scaler and once to fit the pca.
+    :param features_cols: the columns to use for the pca.
+    :param n_components: the amount of principal components.
+    :return: the fit, as numpy arrays: the scaler's 'mean' and 'scale', the pca's 'pca_mean' and 'components' (one row
+        per component), and the 'explained_variance_ratio' of each component.
+    """
+    scaler = StandardScaler()
+    for df in chunks():
+        scaler.partial_fit(df.loc[:, features_cols].values)
+    pca = IncrementalPCA(n_components=n_components)
+    pending = None  # every partial fit needs at least n_components rows: a short trailing chunk joins the previous one.
+    for df in chunks():
+        x = scaler.transform(df.loc[:, features_cols].values)
+        if pending is not None and len(x) >= n_components:
+            pca.partial_fit(pending)
+            pending = None
+        pending = x if pending is None else np.concatenate([pending, x])
+    if pending is not None:
+        pca.partial_fit(pending)
+    return {
+        'mean': scaler.mean_,
+        'scale': scaler.scale_,
+        'pca_mean': pca.mean_,
+        'components': pca.components_,
+        'explained_variance_ratio': pca.explained_variance_ratio_
+    }
+
+
+def pca_project(df: pd.DataFrame, fit: dict, features_cols: list, id_cols: list) -> pd.DataFrame:
+    """ projects rows on a k=2 fit from incremental_pca(). Creates a results df, like artistas_pca().
+    :param df: the original df.
+    :param fit: the scaler and pca arrays.
+    :param features_cols: the columns to use for the pca, in the fit's order.
+    :param id_cols: the unique identifier columns.
+    :return: resulting df.
+    """
+    x = (df.loc[:, features_cols].values - fit['mean']) / fit['scale']
+    principal_df = pd.DataFrame(
+        data=(x - fit['pca_mean']) @ fit['components'].T,
+        columns=['global_primary_component_x', 'global_primary_component_y'],
+        index=df.index
+    ).round(2)
+    return pd.concat([df.loc[:, id_cols], principal_df], axis=1)
+
+
 def hist(df: pd.DataFrame, column: str, bins: int or str or list = 'auto', density: bool = False) -> tuple:
     """ calculates an histogram from the given parameters.
     :param df: the base dataframe.
@@ -48,6 +97,31 @@ def to_datetime(dataframe, date_column='release_date', date_format='%Y-%m-%d') -
     dataframe.set_index(date_column)
 
 
+def epoch_day(date: str) -> int:
+    """ :return: the days since 1970-01-01 of a 'YYYY', 'YYYY-MM' or 'YYYY-MM-DD' date, taken as the first day of its
+    period (see ArtistasDB's release date columns). """
+    return (pd.Timestamp(date) - pd.Timestamp(0)).days
+
+
+def from_epoch_days(dataframe, date_column='release_date', epoch_column='epoch_day') -> None:
+    """ sets a datetime column from a column of days since 1970-01-01.
+    :param dataframe: the base dataframe.
+    :param date_column: the column to set.
+    :param epoch_column: the column of epoch days.
+    """
+    dataframe[date_column] = pd.to_datetime(dataframe[epoch_column].astype('int64'), unit='D')
+
+
+def _frequency(grouping: str) -> str:
+    """ :return: the grouping as a frequency the installed pandas takes. Month and year end frequencies are 'ME' and
+    'YE' since pandas 2.2, and 'M' and 'Y' are rejected since pandas 3. """
+    try:
+        to_offset(grouping)
+        return grouping
+    except ValueError:
+        return f'{grouping}E' if grouping[-1:] in ('M', 'Y') else grouping
+
+
 def date_range(start, stop, grouping='1M', strformat=None) -> [str]:
     """ wrapper for pandas' date_range().strftime().tolist()
     :param start: the starting date
@@ -63,7 +137,7 @@ def date_range(start, stop, grouping='1M', strformat=None) -> [str]:
             strformat = "%Y"
         else:
             raise ValueError("no strformat deduced for grouping type. Set param. strformat directly.")
-    return pd.date_range(start, stop, freq=f'{grouping}').strftime(strformat).tolist()
+    return pd.date_range(start, stop, freq=_frequency(grouping)).strftime(strformat).tolist()
 
 
 def normalize_date_range(dataframe, start, stop, grouping='1M') -> pd.DataFrame:
@@ -73,7 +147,7 @@ def normalize_date_range(dataframe, start, stop, grouping='1M') -> pd.DataFrame:
     :param stop: the end date
     :param grouping: the interval between dates, following datetime conventions.
     """
-    idx = pd.date_range(start, stop, freq=f'{grouping}')
+    idx = pd.date_range(start, stop, freq=_frequency(grouping))
     dataframe.index = pd.DatetimeIndex(dataframe.index)
     return dataframe.reindex(idx, fill_value=0)
 
@@ -85,4 +159,33 @@ def groupby_date(dataframe, date_column='release_date', grouping='1M') -> pd.Dat
     :param grouping: the frequency between dates, following datetime conventions.
     :return: the grouped dates.
     """
-    return dataframe.groupby(pd.Grouper(key=date_column, freq=f'{grouping}'))
+    return dataframe.groupby(pd.Grouper(key=date_column, freq=_frequency(grouping)))
+
+
+def date_series(dataframe, aggregations: dict, date_column='release_date', grouping='1M', by: str = None) -> dict:
+    """ calculates several date series from a single grouping of a df.
+    :param dataframe: the base dataframe, with date_column as datetimes.
+    :param aggregations: series name: (column, aggregation) pairs. Aggregations: 'count', the column's non-null values
+        in each group, and 'ratio', the column's sum over the group's size (ie. the fraction of true values; 0.0 for
+        dates without rows). Ratio columns must be plain bools or numbers, without missing values.
+    :param date_column: the column to group by.
+    :param grouping: the frequency between dates, following datetime conventions.
+    :param by: optional column to split the series by. Each of its values gets its own series, over its own dates.
+    :return: series name: list pairs. If by is set, by value: {series name: list} pairs.
+    """
+    if by is not None:
+        return {
+            key: date_series(group, aggregations, date_column, grouping)
+            for (key, group) in dataframe.groupby(by, sort=False)
+        }
+    groups = groupby_date(dataframe, date_column, grouping)
+    series = {}
+    for name, (column, aggregation) in aggregations.items():
+        if aggregation == 'count':
+            series[name] = groups[column].count().tolist()
+        elif aggregation == 'ratio':
+            ratio = groups[column].sum().astype('float64') / groups[column].size().astype('float64')
+            series[name] = ratio.fillna(0.0).tolist()  # a group without rows has no true values.
+        else:
+            raise ValueError(f"unknown aggregation '{aggregation}'.")
+    return series
@@ -0,0 +1,48 @@
+""" shared fixtures. Every test runs inside its own temporary directory, so the handlers' relative database paths
+(see builder/paths.py) point at fresh databases. """
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import builder.handlers.Database as db
+import builder.handlers.ArtistasDB as dbAR
+import builder.handlers.SpotifyAPI as api
+import builder.handlers.SpotifyStub as spotifyStub
+import builder.utils.Scheduler as scheduler
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """ a temporary working directory with an empty 'database' folder. Pooled connections are closed afterwards. """
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('database')
+    os.makedirs('builder/logs')
+    yield tmp_path
+    db.POOL.close_all()
+
+
+@pytest.fixture(autouse=True)
+def unpaced(monkeypatch):
+    """ a scheduler without rate limits nor backoff, so offline requests run at full speed. """
+    monkeypatch.setattr(scheduler, 'SCHEDULER', scheduler.Scheduler(
+        rate=10 ** 6, burst=10 ** 6, endpoint_rates={}, backoff=0
+    ))
+
+
+@pytest.fixture
+def stub():
+    return spotifyStub.SpotifyStub(latency=0, albums=3, tracks=4, related=3)
+
+
+@pytest.fixture
+def artistas(stub):
+    """ a migrated ArtistasDB, crawling from the stub. """
+    handler = dbAR.ArtistasDB()
+    handler.api = api.GET(spotify=stub, scraper=stub.html, cache_path=None, max_workers=2)
+    handler.migrate()
+    yield handler
+    handler.api.pool.shutdown()
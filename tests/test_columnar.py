@@ -0,0 +1,59 @@
+import json
+import os
+import struct
+
+import numpy as np
+import pytest
+
+import builder.utils.Columnar as columnar
+
+
+def test_round_trip(workdir):
+    columns = {x: np.arange(-3, 4).astype(x) for x in columnar.DTYPES if not x.startswith('u')}
+    columns.update({
+        'uint8': np.array([0, 255], dtype='uint8'),
+        'uint32': np.array([2 ** 32 - 1], dtype='uint32'),
+        'pca': np.array([[0.5, -1.25], [3.0, 1e-3]], dtype='float32'),
+        'empty': np.array([], dtype='int32'),
+        'big_endian': np.array([1.5, 2.5], dtype='>f8'),
+    })
+    strings = ['artista', 'canción', '', 'ñandú 🎵']
+    size = columnar.write_bundle('.', 'bundle', columns, strings, {'version': 'test'})
+    assert size == os.path.getsize('bundle.bin')
+
+    read, read_strings, meta = columnar.read_bundle('bundle.bin')
+    assert list(read) == list(columns)
+    for name, column in columns.items():
+        assert read[name].shape == column.shape
+        assert read[name].dtype == column.dtype.newbyteorder('<')
+        np.testing.assert_array_equal(read[name], column)
+    assert read_strings == strings
+    assert meta == {'version': 'test'}
+
+
+def test_layout(workdir):
+    columnar.write_bundle('.', 'bundle', {'a': np.ones(3, dtype='int8'), 'b': np.ones(5, dtype='float64')})
+    with open('bundle.bin', 'rb') as file:
+        content = file.read()
+    assert content[:4] == columnar.MAGIC
+    version, length = struct.unpack_from('<II', content, 4)
+    header = json.loads(content[12:12 + length])
+    offsets = [x['offset'] for x in header['columns'].values()]
+    assert all(x % columnar.ALIGN == 0 for x in offsets)
+    assert offsets[0] >= 12 + length
+    assert np.frombuffer(content, '<f8', 5, header['columns']['b']['offset']).tolist() == [1.0] * 5
+
+
+def test_without_strings(workdir):
+    columnar.write_bundle('.', 'bundle', {'a': np.zeros(2, dtype='float32')})
+    columns, strings, meta = columnar.read_bundle('bundle.bin')
+    assert list(columns) == ['a'] and strings == [] and meta == {}
+
+
+def test_invalid(workdir):
+    with pytest.raises(TypeError):
+        columnar.write_bundle('.', 'bundle', {'a': np.zeros(2, dtype='int64')})
+    with open('other.bin', 'wb') as file:
+        file.write(b'JSON{}')
+    with pytest.raises(ValueError):
+        columnar.read_bundle('other.bin')
@@ -0,0 +1,59 @@
+import random
+import threading
+import time
+
+import builder.handlers.SpotifyAPI as api
+import builder.handlers.SpotifyStub as spotifyStub
+
+
+class CountingStub(spotifyStub.SpotifyStub):
+    """ records the most requests it ever answered at once. """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.running, self.most = 0, 0
+
+    def _call(self, endpoint: str) -> None:
+        with self.lock:
+            self.running += 1
+            self.most = max(self.most, self.running)
+        try:
+            super()._call(endpoint)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def test_map_keeps_the_order():
+    client = api.GET(spotify=spotifyStub.SpotifyStub(latency=0), cache_path=None, max_workers=8)
+    rng = random.Random(0)
+    delays = [rng.uniform(0, 0.01) for _ in range(50)]
+    assert client._map(lambda i: time.sleep(delays[i]) or i, range(50)) == list(range(50))
+    client.pool.shutdown()
+
+
+def test_pages_and_batches_keep_the_order():
+    stub = spotifyStub.SpotifyStub(latency=0.001, albums=75, tracks=3, missing_features=0)
+    client = api.GET(spotify=stub, cache_path=None, max_workers=8)
+    albums = client.albums('ar000001', types=('album', 'single', 'appears_on'), get_tracks=False)
+    assert [x['id'] for x in albums['items']] == stub._album_ids('ar000001')
+    assert albums['complete']
+    track_ids = [f'al-tr{i:03d}' for i in range(450)]
+    assert [x[0]['id'] for x in client.tracks_features(track_ids)] == track_ids
+    client.pool.shutdown()
+
+
+def test_in_flight_limit_is_shared(monkeypatch):
+    monkeypatch.setattr(api, '_IN_FLIGHT', threading.BoundedSemaphore(3))
+    stub = CountingStub(latency=0.01, missing_features=0)
+    clients = [api.GET(spotify=stub, cache_path=None, max_workers=8) for _ in range(2)]
+    track_ids = [f'al-tr{i:04d}' for i in range(1600)]  # 16 batches per client.
+    threads = [threading.Thread(target=x.tracks_features, args=(track_ids,)) for x in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for client in clients:
+        client.pool.shutdown()
+    assert stub.stats()['audio_features'] == 32
+    assert stub.most == 3
@@ -0,0 +1,71 @@
+import threading
+
+import requests
+import spotipy
+
+import builder.handlers.Crawler as crawler
+
+ARTISTS = [f'ar{i:06d}' for i in range(1, 7)]
+
+
+def threads(handler, stub, monkeypatch) -> dict:
+    """ :return: the threads that fetched artists and wrote to the database, recorded as the crawl runs. """
+    seen = {'fetch': set(), 'write': set()}
+
+    def recorded(key: str, fn):
+        def wrapper(*args, **kwargs):
+            seen[key].add(threading.current_thread())
+            return fn(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(stub, 'artist', recorded('fetch', stub.artist))
+    for method in ('push', 'push_many'):
+        monkeypatch.setattr(handler, method, recorded('write', getattr(handler, method)))
+    return seen
+
+
+def test_single_writer(artistas, stub, monkeypatch):
+    seen = threads(artistas, stub, monkeypatch)
+    counts = crawler.Crawler(artistas, workers=3, report_every=None).crawl(ARTISTS)
+    assert counts['done'] == len(ARTISTS)
+    assert seen['write'] == {threading.main_thread()}
+    assert threading.main_thread() not in seen['fetch'] and len(seen['fetch']) > 1
+    assert sorted(x[0] for x in artistas.query("SELECT artist_id FROM artists")) == ARTISTS
+
+
+def test_failed_jobs(artistas, stub, monkeypatch):
+    artist = stub.artist
+
+    def failing(artist_id):
+        if artist_id == 'ar000002':
+            raise spotipy.exceptions.SpotifyException(404, -1, 'not found')
+        if artist_id == 'ar000003':
+            raise requests.ConnectionError('offline')
+        return artist(artist_id)
+
+    monkeypatch.setattr(stub, 'artist', failing)
+    counts = crawler.Crawler(artistas, workers=2, max_attempts=2, report_every=None).crawl(ARTISTS)
+    assert counts == {'pending': 0, 'in_progress': 0, 'done': 4, 'failed': 1, 'invalid': 1}
+    assert artistas.query("SELECT artist_id, attempts FROM crawl_jobs WHERE state != 'done' ORDER BY artist_id") == [
+        ('ar000002', 1), ('ar000003', 2)
+    ]
+
+    monkeypatch.setattr(stub, 'artist', artist)  # back online.
+    counts = crawler.Crawler(artistas, workers=2, max_attempts=3, report_every=None).crawl()
+    assert counts['done'] == 5 and counts['invalid'] == 1
+
+
+def test_stop_writes_the_in_flight_jobs(artistas, stub, monkeypatch):
+    crawl = crawler.Crawler(artistas, workers=2, report_every=None)
+    artist = stub.artist
+    monkeypatch.setattr(stub, 'artist', lambda artist_id: (crawl.stop(), artist(artist_id))[1])
+    counts = crawl.crawl(ARTISTS)
+    assert counts['done'] == 2 and counts['pending'] == len(ARTISTS) - 2
+
+    monkeypatch.setattr(stub, 'artist', artist)
+    assert crawl.crawl()['done'] == len(ARTISTS)
+
+
+def test_progress_report(artistas, capsys):
+    crawler.Crawler(artistas, workers=2, report_every=0).crawl(ARTISTS[:2])
+    assert '2 artists done, 0 failed, 0 in flight' in capsys.readouterr().out
@@ -0,0 +1,98 @@
+import glob
+import gzip
+import json
+import os
+
+import pytest
+
+import builder.handlers.AnalisisDB as dbAN
+import builder.utils.Helper as helper
+import builder.builders.DatasetBuilder as datasetB
+
+ARTISTS = ['ar000001', 'ar000002', 'ar000003', 'ar000004']
+
+
+@pytest.fixture
+def corpus(artistas):
+    """ summaries and pca coordinates for ARTISTS, crawled from the stub. """
+    artistas.batch_create(ARTISTS)
+    analisis = dbAN.AnalisisDB()
+    analisis.create_entries()
+    analisis.create_tracks_pca()
+    return artistas
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    """ the dataset files written through helper.save_json(), by name. """
+    written = []
+    save_json = helper.save_json
+    monkeypatch.setattr(helper, 'save_json', lambda data, path, filename, *args, **kwargs: (
+        written.append(filename), save_json(data, path, filename, *args, **kwargs)
+    )[1])
+    return written
+
+
+def files(path: str) -> dict:
+    """ :return: file name: content pairs of the files in path. """
+    contents = {}
+    for file in sorted(glob.glob(f'{path}/*')):
+        with open(file, 'rb') as f:
+            contents[os.path.basename(file)] = f.read()
+    return contents
+
+
+def build(path: str, **kwargs) -> dict:
+    os.makedirs(path, exist_ok=True)
+    datasetB.batch_build(path, index_path='.', **kwargs)
+    return files(path)
+
+
+def test_pooled_build_matches_the_single_process_one(corpus):
+    single = build('single')
+    assert sorted(single) == sorted(f'{x}.json' for x in ARTISTS)
+    assert build('pooled', workers=2) == single
+    for artist_id in ARTISTS:  # and each artist built on its own.
+        os.makedirs('one', exist_ok=True)
+        datasetB.build(artist_id, 'one')
+        assert files('one')[f'{artist_id}.json'] == single[f'{artist_id}.json']
+
+
+def test_compact_output(corpus):
+    full = build('full')
+    compact = build('compact', compact=True, precision=3, compress=('gz',))
+    assert sorted(compact) == sorted([f'{x}.json' for x in ARTISTS] + [f'{x}.json.gz' for x in ARTISTS])
+    for artist_id in ARTISTS:
+        text = compact[f'{artist_id}.json']
+        assert b'\n' not in text and b': ' not in text
+        assert gzip.decompress(compact[f'{artist_id}.json.gz']) == text
+        assert json.loads(text) == helper.round_floats(json.loads(full[f'{artist_id}.json']), 3)
+
+
+def test_incremental_build(corpus, writes):
+    build('datasets', incremental=True)
+    assert sorted(writes) == sorted(ARTISTS + ['datasets.manifest', 'artistas2'])
+    before = files('datasets')
+
+    writes.clear()
+    build('datasets', incremental=True)  # nothing changed.
+    assert sorted(writes) == ['artistas2', 'datasets.manifest']
+
+    writes.clear()
+    now = str(helper.current_time())
+    corpus.push([
+        ("UPDATE artists SET artist_name = 'renamed', last_updated = ? WHERE artist_id = 'ar000001'", (now,)),
+        ("UPDATE artists SET last_updated = ? WHERE artist_id = 'ar000002'", (now,)),  # touched, but unchanged.
+    ])
+    corpus.delete_entry('ar000003')
+    after = build('datasets', incremental=True)
+    assert sorted(writes) == ['ar000001', 'artistas2', 'datasets.manifest']
+    assert sorted(after) == ['ar000001.json', 'ar000002.json', 'ar000004.json']
+    assert json.loads(after['ar000001.json'])['artist_name'] == 'renamed'
+    assert after['ar000002.json'] == before['ar000002.json']
+    assert after['ar000004.json'] == before['ar000004.json']
+    assert sorted(helper.load_json('artistas2.json')) == ['ar000001', 'ar000002', 'ar000004']
+
+    writes.clear()
+    build('datasets', incremental=True, compact=True)  # new options rebuild everything.
+    assert sorted(writes) == ['ar000001', 'ar000002', 'ar000004', 'artistas2', 'datasets.manifest']
@@ -0,0 +1,52 @@
+import pytest
+import spotipy
+
+import builder.handlers.Crawler as crawler
+import builder.handlers.Discovery as discovery
+
+
+def edges(handler, artist_ids) -> set:
+    """ :return: the stored artists one edge away from artist_ids. """
+    return {x[1] for x in handler.query("SELECT artist_id, other_artist FROM related") if x[0] in set(artist_ids)}
+
+
+def stored(handler) -> set:
+    return {x[0] for x in handler.query("SELECT artist_id FROM artists")}
+
+
+@pytest.mark.parametrize('with_crawler', (False, True))
+def test_breadth_first_levels(artistas, with_crawler):
+    artistas.batch_create(['ar000001'])
+    first = edges(artistas, ['ar000001']) - {'ar000001'}
+    crawl = crawler.Crawler(artistas, workers=2, report_every=None) if with_crawler else None
+    created = discovery.Discovery(artistas, crawler=crawl, genres=(), depth=2, batch_size=4).run()
+
+    assert set(created[:len(first)]) == first
+    second = edges(artistas, first) - first - {'ar000001'}
+    assert set(created[len(first):]) == second and len(created) == len(set(created))
+    assert stored(artistas) == {'ar000001'} | first | second  # and nothing three edges away.
+
+
+def test_genre_filter(artistas, stub):
+    artistas.batch_create(['ar000001'])
+    candidates = edges(artistas, ['ar000001']) - {'ar000001'}
+    accepted = {x for x in candidates if any('genre 40' in genre for genre in stub._artist(x)['genres'])}
+    assert accepted and accepted != candidates
+    assert set(discovery.Discovery(artistas, genres=('genre 40',), depth=1).run()) == accepted
+    assert stored(artistas) == {'ar000001'} | accepted
+
+
+def test_a_failed_lookup_does_not_end_the_walk(artistas, stub, monkeypatch):
+    related = stub.artist_related_artists
+
+    def failing(artist_id):
+        if artist_id == 'ar000001':
+            raise spotipy.exceptions.SpotifyException(404, -1, 'not found')
+        return related(artist_id)
+
+    monkeypatch.setattr(stub, 'artist_related_artists', failing)
+    walk = discovery.Discovery(artistas, genres=(), depth=1)
+    created = walk.run(['ar000001', 'ar000002'])  # unstored seeds: their related artists are requested.
+    assert created == [x['id'] for x in related('ar000002')['artists']]
+    assert list(walk.failed) == ['ar000001']
+    assert artistas.query("SELECT artist_id, state FROM crawl_jobs WHERE state != 'done'") == [('ar000001', 'invalid')]
@@ -0,0 +1,60 @@
+import sqlite3
+
+import builder.handlers.ArtistasDB as dbAR
+import builder.paths as paths
+
+
+def facts(handler, where: str = '1') -> list:
+    return handler.query(f"SELECT fact_id, n_invited FROM {dbAR.TABLES['FACTS']} WHERE {where} ORDER BY fact_id")
+
+
+def invite(rows: list) -> None:
+    connection = sqlite3.connect(paths.invited_db)
+    connection.execute("CREATE TABLE IF NOT EXISTS invitedArtists (album_id TEXT PRIMARY KEY, n_invited REAL)")
+    connection.executemany("INSERT OR REPLACE INTO invitedArtists VALUES (?, ?)", rows)
+    connection.commit()
+    connection.close()
+
+
+def test_facts_follow_ingestion(artistas, stub):
+    artistas.batch_create(['ar000001'])
+    assert len(facts(artistas)) == stub.albums * (1 + stub.tracks)
+    assert artistas.refresh_facts() == 0  # nothing new since the last refresh.
+
+
+def test_only_new_albums_are_rebuilt(artistas, stub):
+    artistas.batch_create(['ar000001'])
+    stub.albums = 4
+    assert artistas.batch_update(older_than=-1) == 1
+    assert artistas.refresh_facts() == 0  # batch_update refreshed them already.
+    assert len(facts(artistas)) == 4 * (1 + stub.tracks)
+
+
+def test_deleted_albums_drop_their_facts(artistas, stub):
+    artistas.batch_create(['ar000001', 'ar000002'])
+    stub.albums = 2
+    artistas.update_entry('ar000001')
+    assert facts(artistas, "album_id = 'ar000001-al002'") == []
+    artistas.delete_entry('ar000002')
+    assert facts(artistas, "artist_id = 'ar000002'") == []
+    assert len(facts(artistas)) == 2 * (1 + stub.tracks)
+
+
+def test_invited_changes_are_picked_up(artistas, stub):
+    artistas.batch_create(['ar000001'])
+    assert set(x[1] for x in facts(artistas, 'track_id IS NULL')) == {None}
+    invite([('ar000001-al000', 2), ('ar000001-al001', 1)])
+    assert artistas.refresh_facts() == 0
+    assert facts(artistas, 'track_id IS NULL') == [('ar000001-al000', 2), ('ar000001-al001', 1), ('ar000001-al002', None)]
+    invite([('ar000001-al001', 3)])
+    artistas.refresh_facts()
+    assert facts(artistas, "fact_id = 'ar000001-al001'") == [('ar000001-al001', 3)]
+
+
+def test_full_refresh_matches_incremental(artistas, stub):
+    artistas.batch_create(['ar000001', 'ar000002'])
+    stub.albums = 5
+    artistas.batch_update(older_than=-1)
+    incremental = artistas.query(f"SELECT * FROM {dbAR.TABLES['FACTS']} ORDER BY fact_id")
+    artistas.refresh_facts(full=True)
+    assert artistas.query(f"SELECT * FROM {dbAR.TABLES['FACTS']} ORDER BY fact_id") == incremental
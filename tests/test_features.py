@@ -0,0 +1,31 @@
+import spotipy.exceptions
+
+import builder.handlers.SpotifyAPI as api
+import builder.handlers.SpotifyStub as spotifyStub
+
+
+class BadIdStub(spotifyStub.SpotifyStub):
+    """ answers audio_features() with a 400 when any of the requested ids is bad, as spotify does. """
+
+    def __init__(self, bad: set, **kwargs):
+        super().__init__(**kwargs)
+        self.bad = bad
+
+    def audio_features(self, track_ids: list) -> list:
+        if self.bad & set(track_ids):
+            self._call('audio_features')
+            raise spotipy.exceptions.SpotifyException(400, -1, 'invalid request')
+        return super().audio_features(track_ids)
+
+
+def test_a_bad_id_loses_only_its_features():
+    track_ids = [f'al-tr{i:03d}' for i in range(250)]
+    stub = BadIdStub({'al-tr042'}, latency=0, missing_features=0)
+    client = api.GET(spotify=stub, cache_path=None, max_workers=2)
+    features = [x[0] for x in client.tracks_features(track_ids)]
+    client.pool.shutdown()
+    assert len(features) == len(track_ids)
+    assert features[42] is None
+    assert [x['id'] for x in features if x is not None] == track_ids[:42] + track_ids[43:]
+    # the failing batch of 100 is bisected down to the bad id: 8 failed requests, 7 answered ones, and 2 other batches.
+    assert stub.stats()['audio_features'] == 8 + 7 + 2
@@ -0,0 +1,42 @@
+import pytest
+
+import builder.handlers.Database as db
+import builder.builders.IndexCheck as indexCheck
+
+
+@pytest.fixture
+def handler():
+    handler = db.Database('database/test.db')
+    handler.push([
+        "CREATE TABLE a (id TEXT PRIMARY KEY, x INT)",
+        "CREATE TABLE b (id TEXT PRIMARY KEY, a_id TEXT, y INT)",
+        "CREATE INDEX b_a_id ON b (a_id)",
+    ])
+    return handler
+
+
+def test_outermost_loop_without_where(handler):
+    assert handler.full_scans("SELECT * FROM a") == []
+    assert handler.full_scans("SELECT a.id, b.y FROM a INNER JOIN b ON b.a_id = a.id") == []
+
+
+def test_where_in_subquery_keeps_the_outer_loop_exempt(handler):
+    assert handler.full_scans("SELECT id, (SELECT count(*) FROM b WHERE b.a_id = a.id) FROM a") == []
+    assert handler.full_scans("SELECT id FROM a WHERE x IN (SELECT y FROM b)") == ['SCAN a', 'SCAN b']
+
+
+def test_scans_that_are_not_the_outermost_loop(handler):
+    assert handler.full_scans("SELECT * FROM a WHERE x = 1") == ['SCAN a']
+    assert handler.full_scans("SELECT id, (SELECT count(*) FROM b WHERE b.y = a.x) FROM a") == ['SCAN b']
+
+
+def test_failed_builders_fail_the_check(handler, monkeypatch):
+    def fails():
+        handler.query("SELECT * FROM a")
+        raise ValueError('invalid frequency')
+
+    monkeypatch.setattr(indexCheck, 'DATABASES', ['database/test.db'])
+    monkeypatch.setattr(indexCheck, 'BUILDERS', {'ok': lambda: handler.query("SELECT id FROM a"), 'broken': fails})
+    offending, failed = indexCheck.check(verbose=False)
+    assert offending == {}
+    assert list(failed) == ['broken']
@@ -0,0 +1,63 @@
+import requests
+
+import builder.handlers.ArtistasDB as dbAR
+import builder.handlers.Crawler as crawler
+
+
+def jobs(handler) -> dict:
+    return {
+        x[0]: x[1:] for x in handler.query(f"SELECT artist_id, state, attempts FROM {dbAR.TABLES['JOBS']}")
+    }
+
+
+def test_enqueue_skips_stored_and_queued_artists(artistas):
+    artistas.batch_create(['ar000001'])
+    assert artistas.enqueue_jobs(['ar000001', 'ar000002', 'ar000002']) == 1
+    assert artistas.enqueue_jobs(['ar000002']) == 0
+
+
+def test_claims_are_exclusive(artistas):
+    artistas.enqueue_jobs(['ar000001', 'ar000002', 'ar000003'])
+    first, second = artistas.claim_jobs(2), artistas.claim_jobs(2)
+    assert first == ['ar000001', 'ar000002'] and second == ['ar000003']
+    assert artistas.claim_jobs(2) == []
+    assert artistas.job_counts()['in_progress'] == 3
+
+
+def test_interrupted_jobs_resume(artistas):
+    artistas.enqueue_jobs(['ar000001', 'ar000002'])
+    artistas.claim_jobs(2)  # a run that stopped before finishing them.
+    artistas.batch_create([])
+    assert jobs(artistas) == {'ar000001': ('done', 1), 'ar000002': ('done', 1)}
+    assert artistas.query(f"SELECT count(*) FROM {dbAR.TABLES['ARTISTS']}") == [(2,)]
+
+
+def test_transient_errors_are_retried(artistas, stub, monkeypatch):
+    calls = []
+
+    def artist(artist_id):
+        calls.append(artist_id)
+        raise requests.ConnectionError('offline')
+
+    monkeypatch.setattr(stub, 'artist', artist)
+    artistas.batch_create(['ar000001'], max_attempts=2)
+    state, attempts = jobs(artistas)['ar000001']
+    assert (state, attempts) == ('failed', 2)
+    assert artistas.claim_jobs(1, max_attempts=2) == []
+    assert artistas.claim_jobs(1, max_attempts=3) == ['ar000001']
+
+
+def test_data_errors_are_not_retried(artistas, stub):
+    artistas.enqueue_jobs(['ar000001'])
+    # the artist row already exists, eg. pushed by hand: creating the entry again is an IntegrityError.
+    artistas.push_many(artistas.entry_inserts('ar000001', artistas.api.all('ar000001'))[:1])
+    stub.reset_stats()
+    artistas.batch_create([], max_attempts=3)
+    assert jobs(artistas)['ar000001'] == ('invalid', 1)
+    assert stub.stats()['artist'] == 1
+    assert artistas.claim_jobs(1, max_attempts=10) == []
+
+
+def test_crawler_finishes_every_job(artistas, stub):
+    counts = crawler.Crawler(artistas, workers=2, report_every=None).crawl(['ar000001', 'ar000002', 'ar000003'])
+    assert counts['done'] == 3 and counts['failed'] == counts['invalid'] == 0
@@ -0,0 +1,70 @@
+import re
+import sqlite3
+
+import builder.handlers.ArtistasDB as dbAR
+import builder.paths as paths
+
+LEGACY_SCHEMA = re.sub(r"\n    release_\w+ INT,", "", dbAR.SCHEMA)  # albums before the parsed release dates.
+
+
+def indexes(path: str = paths.artistas_db) -> set:
+    with sqlite3.connect(path) as connection:
+        return {x[0] for x in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()}
+
+
+def version(path: str = paths.artistas_db) -> int:
+    with sqlite3.connect(path) as connection:
+        return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def legacy_database(path: str = paths.artistas_db) -> None:
+    """ an unversioned database, as created by the legacy schema, with a repeated genre. """
+    with sqlite3.connect(path) as connection:
+        connection.executescript(LEGACY_SCHEMA)
+        connection.execute("INSERT INTO artists (artist_id, artist_name) VALUES ('ar1', 'artist')")
+        connection.executemany(
+            "INSERT INTO albums (artist_id, album_id, release_date, release_date_precision) VALUES ('ar1', ?, ?, ?)",
+            [('al1', '2020-05-17', 'day'), ('al2', '1999', 'year'), ('al3', '0000', 'year')]
+        )
+        connection.executemany("INSERT INTO genres VALUES ('ar1', ?, NULL)", [('rock',), ('rock',), ('pop',)])
+
+
+def test_fresh_database():
+    handler = dbAR.ArtistasDB()
+    assert handler.migrate() == len(dbAR.MIGRATIONS)
+    assert version() == len(dbAR.MIGRATIONS)
+    assert {'tracks_album_id_key', 'genres_artist_id', 'crawl_jobs_state', 'release_facts_epoch_day',
+            'albums_last_updated', 'tracks_last_updated'} <= indexes()
+    assert dbAR.ArtistasDB().migrate() == len(dbAR.MIGRATIONS)  # already up to date.
+
+
+def test_legacy_database():
+    legacy_database()
+    assert version() == 0
+    handler = dbAR.ArtistasDB()
+    assert handler.migrate() == len(dbAR.MIGRATIONS)
+    assert version() == len(dbAR.MIGRATIONS)
+    assert handler.query(f"""
+        SELECT album_id, {', '.join(dbAR.RELEASE_COLUMNS)} FROM albums ORDER BY album_id
+    """) == [
+        ('al1', *dbAR._release_parts('2020-05-17', 'day')),
+        ('al2', *dbAR._release_parts('1999', 'year')),
+        ('al3', None, None, None, None)
+    ]
+    assert handler.query("SELECT genre FROM genres ORDER BY genre") == [('pop',), ('rock',)]
+    handler.push_many([(dbAR._insert('genres', dbAR.GENRES, 'IGNORE'), ('ar1', 'rock', None))])
+    assert handler.query("SELECT count(*) FROM genres") == [(2,)]
+
+
+def test_partially_migrated_database():
+    legacy_database()
+    assert dbAR.ArtistasDB().migrate(dbAR.MIGRATIONS[:3], LEGACY_SCHEMA) == 3
+    assert version() == 3
+    assert 'albums_last_updated' not in indexes()
+    handler = dbAR.ArtistasDB()
+    assert handler.migrate() == len(dbAR.MIGRATIONS)
+    assert 'albums_last_updated' in indexes()
+    assert handler.query("SELECT release_year FROM albums WHERE album_id = 'al1'") == [(2020,)]
+    columns = [x[1] for x in handler.query("PRAGMA table_info(release_facts)")]
+    assert 'epoch_day' in columns and 'day' not in columns
+    assert 'release_facts_epoch_day' in indexes()
@@ -0,0 +1,74 @@
+import pytest
+
+import builder.handlers.AnalisisDB as dbAN
+import builder.utils.Helper as helper
+
+
+@pytest.fixture
+def analisis(artistas, monkeypatch):
+    """ an AnalisisDB over the stub-crawled artistas database. The drift threshold is raised so that the small catalog
+    keeps its first fit. """
+    monkeypatch.setattr(dbAN, 'PCA_DRIFT', 10 ** 6)
+    artistas.batch_create(['ar000001', 'ar000002', 'ar000003'])
+    return dbAN.AnalisisDB()
+
+
+def projections(handler) -> dict:
+    """ :return: track_id: (rowid, x, y) of the projected tracks. """
+    return {x[0]: x[1:] for x in handler.query("""
+        SELECT track_id, rowid, global_primary_component_x, global_primary_component_y FROM tracks
+    """)}
+
+
+def complete_tracks(artistas, artist_id: str = None) -> list:
+    """ :return: the ids of the tracks with every pca column. """
+    where = ' AND '.join(f"{x} IS NOT NULL" for x in dbAN.FEATURES + dbAN.MEASURES)
+    if artist_id:
+        where += f" AND artist_id = '{artist_id}'"
+    return [x[0] for x in artistas.query(f"SELECT track_id FROM tracks WHERE {where}")]
+
+
+def test_projects_only_new_tracks(artistas, analisis):
+    assert len(complete_tracks(artistas)) > 30
+    assert analisis.create_tracks_pca() == len(complete_tracks(artistas))
+    before = projections(analisis)
+    assert sorted(before) == sorted(complete_tracks(artistas))
+    assert analisis.create_tracks_pca() == 0
+    assert projections(analisis) == before
+
+    artistas.batch_create(['ar000004'])
+    assert analisis.create_tracks_pca() == len(complete_tracks(artistas, 'ar000004'))
+    after = projections(analisis)
+    assert {k: v for (k, v) in after.items() if k in before} == before  # same rows, same values.
+    assert sorted(after) == sorted(complete_tracks(artistas))
+
+
+def test_projects_updated_tracks_in_place(artistas, analisis):
+    analisis.create_tracks_pca()
+    before = projections(analisis)
+    track_id = sorted(before)[0]
+    artistas.push_many([(
+        "UPDATE tracks SET energy = 1 - energy, loudness = loudness / 2, last_updated = ? WHERE track_id = ?",
+        (str(helper.current_time()), track_id)
+    )])
+    assert analisis.create_tracks_pca() == 1
+    after = projections(analisis)
+    assert after[track_id][0] == before[track_id][0]  # upserted in place.
+    assert after[track_id][1:] != before[track_id][1:]
+    assert {k: v for (k, v) in after.items() if k != track_id} == {k: v for (k, v) in before.items() if k != track_id}
+
+
+def test_drops_deleted_tracks(artistas, analisis):
+    analisis.create_tracks_pca()
+    artistas.delete_entry('ar000002')
+    assert analisis.create_tracks_pca() == 0
+    assert sorted(projections(analisis)) == sorted(complete_tracks(artistas))
+    assert not any(x.startswith('ar000002') for x in projections(analisis))
+
+
+def test_refit_keeps_rows_in_place(artistas, analisis):
+    analisis.create_tracks_pca()
+    before = projections(analisis)
+    assert analisis.create_tracks_pca(refit=True) == len(before)
+    after = projections(analisis)
+    assert {k: v[0] for (k, v) in after.items()} == {k: v[0] for (k, v) in before.items()}
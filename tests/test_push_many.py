@@ -0,0 +1,50 @@
+import sqlite3
+
+import pytest
+
+import builder.handlers.ArtistasDB as dbAR
+
+
+def count(handler, table: str) -> int:
+    return handler.query(f"SELECT count(*) FROM {table}")[0][0]
+
+
+def test_push_many_is_one_transaction(artistas):
+    artistas.push_many([
+        (f"INSERT INTO {dbAR.TABLES['JOBS']} (artist_id) VALUES (?)", ('a',)),
+        (f"INSERT INTO {dbAR.TABLES['JOBS']} (artist_id) VALUES (?)", ('b',)),
+    ])
+    with pytest.raises(sqlite3.IntegrityError):
+        artistas.push_many([
+            (f"INSERT INTO {dbAR.TABLES['JOBS']} (artist_id) VALUES (?)", ('c',)),
+            (f"INSERT INTO {dbAR.TABLES['JOBS']} (artist_id) VALUES (?)", ('a',)),
+        ])
+    assert sorted(x[0] for x in artistas.query(f"SELECT artist_id FROM {dbAR.TABLES['JOBS']}")) == ['a', 'b']
+
+
+def test_push_many_bypasses_integrity_errors(artistas):
+    statement = f"INSERT INTO {dbAR.TABLES['JOBS']} (artist_id) VALUES (?)"
+    artistas.push_many([(statement, ('a',))])
+    artistas.bypassIntegrityErrors = True
+    artistas.push_many([(statement, ('a',)), (statement, ('b',))])
+    assert count(artistas, dbAR.TABLES['JOBS']) == 2
+
+
+def test_shared_albums_are_skipped(artistas, stub):
+    stub.shared_albums = 1
+    artistas.batch_create(['ar000001', 'ar000002'])
+
+    assert artistas.job_counts()['done'] == 2
+    assert count(artistas, dbAR.TABLES['ARTISTS']) == 2
+    assert count(artistas, dbAR.TABLES['ALBUMS']) == 5  # the shared album, once.
+    assert count(artistas, dbAR.TABLES['TRACKS']) == 5 * stub.tracks
+    owner = artistas.query(f"SELECT artist_id FROM {dbAR.TABLES['ALBUMS']} WHERE album_id = 'shared-al000'")
+    assert owner == [('ar000001',)]
+
+
+def test_repeated_genres_are_skipped(artistas, stub):
+    artist_json = stub.artist('ar000001')
+    artist_json['genres'] = ['rock', 'rock', 'pop']
+    artistas.formatter.set_id('ar000001')
+    artistas.push_many(artistas._genres_inserts(artist_json))
+    assert sorted(x[0] for x in artistas.query(f"SELECT genre FROM {dbAR.TABLES['GENRES']}")) == ['pop', 'rock']
@@ -0,0 +1,30 @@
+import pytest
+
+import builder.handlers.ArtistasDB as dbAR
+
+
+@pytest.mark.parametrize('release_date, precision, parts', [
+    ('2020-05-17', 'day', (18399, 2020, 5, 7)),
+    ('1970-01-01', 'day', (0, 1970, 1, 4)),
+    ('1969-12-31', 'day', (-1, 1969, 12, 3)),
+    ('2004-02', 'month', (12449, 2004, 2, None)),
+    ('2004-02-29', 'month', (12449, 2004, 2, None)),  # normalized to the first of the month.
+    ('1999', 'year', (10592, 1999, None, None)),
+    ('1999-06-15', 'year', (10592, 1999, None, None)),
+    ('2020-05-17', None, (18399, 2020, 5, None)),
+])
+def test_release_parts(release_date, precision, parts):
+    assert dbAR._release_parts(release_date, precision) == parts
+
+
+@pytest.mark.parametrize('release_date, precision', [
+    ('0000', 'year'),
+    ('0000-00-00', 'day'),
+    ('2020-02-30', 'day'),
+    ('', 'day'),
+    (None, 'day'),
+    (None, 'year'),
+    (None, None),
+])
+def test_unparsed_release_parts(release_date, precision):
+    assert dbAR._release_parts(release_date, precision) == (None, None, None, None)
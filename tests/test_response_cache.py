@@ -0,0 +1,78 @@
+import types
+
+import pytest
+
+import builder.handlers.ResponseCache as responseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ the cache's time.time(), set by hand. """
+    now = [1000.0]
+    monkeypatch.setattr(responseCache, 'time', types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def cache():
+    return responseCache.ResponseCache('database/cache.db', ttls={'artist': 100, 'album_tracks': 1000})
+
+
+def response(i: int) -> dict:
+    return {'id': f'ar{i:06d}', 'padding': 'x' * 1000}
+
+
+def keys(cache) -> list:
+    return sorted(x[0] for x in cache.query("SELECT key FROM responses"))
+
+
+def test_ttl_expiry(cache, clock):
+    cache.put('artist', 'ar1', response(1))
+    cache.put('album_tracks', 'al1', response(2))
+    clock[0] += 99
+    assert cache.get('artist', 'ar1') == response(1)
+    clock[0] += 1
+    assert cache.get('artist', 'ar1') is None  # 100 seconds old.
+    assert cache.get('album_tracks', 'al1') == response(2)
+    cache.evict()
+    assert keys(cache) == ['album_tracks:"al1"']
+    assert cache.stats()['hits'] == 2 and cache.stats()['misses'] == 1
+
+
+def test_none_and_uncached_endpoints_are_not_stored(cache, clock):
+    cache.put_many('artist', ['ar1', 'ar2'], [None, response(2)])
+    cache.put('html', 'ar3', response(3))
+    assert not cache.cacheable('html')
+    assert keys(cache) == ['artist:"ar2"']
+    assert cache.get_many('artist', ['ar1', 'ar2']) == [None, response(2)]
+    assert cache.stats()['stores'] == 1
+
+
+def test_lru_eviction_by_size(cache, clock):
+    for i in range(4):
+        clock[0] += 1
+        cache.put('artist', f'ar{i}', response(i))
+    sizes = [x[0] for x in cache.query("SELECT size FROM responses")]
+    assert min(sizes) > 0.9 * max(sizes)
+    cache.max_bytes = int(4.5 * max(sizes))  # 5 entries don't fit, and 4 are under max_bytes * EVICT_TO.
+
+    clock[0] += 1
+    assert cache.get('artist', 'ar0') is not None  # ar0 is now the most recently used.
+    clock[0] += 1
+    cache.put('artist', 'ar4', response(4))
+    assert keys(cache) == ['artist:"ar0"', 'artist:"ar2"', 'artist:"ar3"', 'artist:"ar4"']
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['bytes'] == cache.query("SELECT sum(size) FROM responses")[0][0]
+
+    clock[0] += 1
+    cache.put_many('artist', ['ar5', 'ar6'], [response(5), response(6)])
+    assert keys(cache) == ['artist:"ar0"', 'artist:"ar4"', 'artist:"ar5"', 'artist:"ar6"']
+    assert cache.stats()['evictions'] == 3
+
+
+def test_size_survives_reopening(cache, clock):
+    cache.put_many('artist', ['ar1', 'ar2'], [response(1), response(2)])
+    cache.put('artist', 'ar1', response(3))  # replaced, not added.
+    size = cache.stats()['bytes']
+    assert size == cache.query("SELECT sum(size) FROM responses")[0][0]
+    assert responseCache.ResponseCache('database/cache.db').stats()['bytes'] == size
@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+import requests
+
+import builder.utils.Scheduler as scheduler
+
+
+def test_limit_is_released_while_backing_off(monkeypatch):
+    limit = threading.BoundedSemaphore(1)
+    held, free = [], []
+
+    def request():
+        held.append(not limit.acquire(blocking=False))
+        if len(held) < 3:
+            raise requests.ConnectionError('offline')
+        return 'ok'
+
+    def sleep(endpoint, seconds):
+        free.append(limit.acquire(blocking=False))
+        limit.release()
+
+    runner = scheduler.Scheduler(rate=10 ** 6, burst=10 ** 6, endpoint_rates={}, backoff=1.0)
+    monkeypatch.setattr(runner, '_sleep', sleep)
+    assert runner.run(request, 'artist', limit) == 'ok'
+    assert held == [True, True, True]
+    assert free and all(free)
+    assert runner.stats()['retries'] == 2
+
+
+def test_data_errors_are_not_retried():
+    runner = scheduler.Scheduler(rate=10 ** 6, burst=10 ** 6, endpoint_rates={}, backoff=0)
+    calls = []
+
+    def request():
+        calls.append(1)
+        raise KeyError('id')
+
+    with pytest.raises(KeyError):
+        runner.run(request)
+    assert len(calls) == 1
+    assert not scheduler.is_transient(KeyError('id'))
+    assert scheduler.is_transient(requests.Timeout())
+
+
+def test_endpoints_have_their_own_budgets():
+    runner = scheduler.Scheduler()
+    for endpoint in ('artist', 'artists', 'artist_albums', 'album_tracks', 'audio_features', 'html'):
+        assert endpoint in runner.endpoint_buckets
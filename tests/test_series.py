@@ -0,0 +1,73 @@
+import datetime
+import json
+import random
+
+import pandas as pd
+import pytest
+
+import builder.handlers.ArtistasDB as dbAR
+import builder.utils.Stats as stats
+import builder.builders.FridaySeriesBuilder as fridaySB
+import builder.builders.ReleaseSeriesBuilder as releaseSB
+
+START, STOP = '2013-01-01', '2021-12-31'
+EMPTY_MONTHS = ('2013-03', '2016-09', '2016-10', '2021-02')
+
+
+@pytest.fixture
+def releases(artistas):
+    """ albums released on random days of every month from START to STOP, except EMPTY_MONTHS. A few have month or
+    year precision, or spotify's '0000' placeholder. """
+    rng, rows = random.Random(0), []
+    for month in pd.date_range(START, STOP, freq='MS'):
+        if month.strftime('%Y-%m') in EMPTY_MONTHS:
+            continue
+        for _ in range(rng.randrange(1, 8)):
+            date = (month + datetime.timedelta(days=rng.randrange(month.days_in_month))).strftime('%Y-%m-%d')
+            precision = rng.choice(('day', 'day', 'day', 'day', 'month', 'year'))
+            date = '0000' if rng.random() < 0.02 else date[:{'day': 10, 'month': 7, 'year': 4}[precision]]
+            rows.append((f'al{len(rows):04d}', rng.choice(('album', 'single')), date, precision))
+    artistas.push_many([(f"""
+        INSERT INTO {dbAR.TABLES['ALBUMS']} (artist_id, album_id, album_type, release_date, release_date_precision,
+            last_updated, {', '.join(dbAR.RELEASE_COLUMNS)})
+        VALUES ('ar1', ?, ?, ?, ?, '2022-01-01 00:00:00', ?, ?, ?, ?)
+    """, (album_id, album_type, date, precision, *dbAR._release_parts(date, precision)))
+        for (album_id, album_type, date, precision) in rows])
+    artistas.refresh_facts()
+    return artistas
+
+
+def old_albums(handler, precision: str = 'day', album_type: str = None) -> pd.DataFrame:
+    """ the albums as the series builders used to read them, straight from the albums table. """
+    df = handler.to_dataframe(f"""
+        SELECT release_date FROM {dbAR.TABLES['ALBUMS']}
+        WHERE
+            {f"album_type = '{album_type}' AND" if album_type else ''}
+            release_date >= '{START}' AND
+            release_date <  '{STOP}'  AND
+            release_date_precision = '{precision}';
+    """)
+    stats.to_datetime(df)
+    return df
+
+
+def test_friday_series_matches_the_per_date_loop(releases, workdir):
+    friday_series = []
+    for group in stats.groupby_date(old_albums(releases))['release_date']:
+        fridays = sum(date.weekday() == 4 for date in group[1])
+        friday_series.append(fridays / len(group[1]) if len(group[1]) else 0.0)  # empty months: no friday releases.
+
+    fridaySB.build('.', START, STOP)
+    with open('fridaySeries.json', 'r', encoding='utf-8') as file:
+        series = json.load(file)
+    assert series['releases'] == friday_series
+    assert len(series['labels']) == len(friday_series)
+    for month in EMPTY_MONTHS:
+        assert series['releases'][series['labels'].index(month)] == 0.0
+
+
+def test_release_series_matches_the_per_type_counts(releases):
+    series = releaseSB._generate_data(START, STOP)
+    for album_type in ('album', 'single'):
+        old = stats.groupby_date(old_albums(releases, album_type=album_type), grouping='1M')['release_date'].count()
+        assert series[album_type] == old.tolist()
@@ -0,0 +1,53 @@
+import datetime
+
+import builder.handlers.ArtistasDB as dbAR
+import builder.utils.Helper as helper
+
+
+def age(handler, artist_id: str, days: float, popularity: int = 0, followers: int = 0) -> None:
+    last_updated = str(helper.current_time() - datetime.timedelta(days=days))
+    handler.push_many([(
+        f"UPDATE {dbAR.TABLES['ARTISTS']} SET last_updated = ?, popularidad = ?, followers = ? WHERE artist_id = ?",
+        (last_updated, popularity, followers, artist_id)
+    )])
+
+
+def test_stale_artists_by_priority(artistas):
+    artistas.batch_create(['ar000001', 'ar000002', 'ar000003', 'ar000004'])
+    age(artistas, 'ar000001', 2, popularity=10)
+    age(artistas, 'ar000002', 2, popularity=10, followers=10 ** 6)  # +60
+    age(artistas, 'ar000003', 90, popularity=10)  # +88 days
+    assert artistas.stale_artists() == ['ar000003', 'ar000002', 'ar000001']
+    assert artistas.stale_artists(limit=2) == ['ar000003', 'ar000002']
+    assert artistas.stale_artists(artist_ids=['ar000001', 'ar000002']) == ['ar000002', 'ar000001']
+    assert artistas.stale_artists(exclude=['ar000003']) == ['ar000002', 'ar000001']
+
+
+def test_batch_update_goes_batch_by_batch(artistas, stub, monkeypatch):
+    artistas.batch_create(['ar000001', 'ar000002', 'ar000003'])
+    for artist_id in ('ar000001', 'ar000002', 'ar000003'):
+        age(artistas, artist_id, 2)
+    pushes = []
+    push_batch = artistas._push_batch
+    monkeypatch.setattr(artistas, '_push_batch', lambda commands, failed: pushes.append(list(commands)) or
+                        push_batch(commands, failed))
+    assert artistas.batch_update(batch_size=2) == 3
+    assert pushes == [['ar000001', 'ar000002'], ['ar000003']]
+    assert artistas.stale_artists() == []
+
+
+def test_batch_update_skips_failures(artistas, stub, monkeypatch):
+    artistas.batch_create(['ar000001', 'ar000002'])
+    for artist_id in ('ar000001', 'ar000002'):
+        age(artistas, artist_id, 2)
+    artist = stub.artist
+    monkeypatch.setattr(stub, 'artist', lambda x: artist(x) if x != 'ar000001' else {})
+    assert artistas.batch_update(batch_size=1) == 1
+    assert artistas.stale_artists() == ['ar000001']
+
+
+def test_batch_update_tries_each_artist_once(artistas, stub):
+    artistas.batch_create(['ar000001', 'ar000002', 'ar000003'])
+    stub.reset_stats()
+    assert artistas.batch_update(older_than=-1, batch_size=2) == 3  # everything stays stale.
+    assert stub.stats()['artist'] == 3
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+import builder.handlers.AnalisisDB as an
+
+
+def tracks(n: int = 1000, albums: int = 100, seed: int = 1) -> pd.DataFrame:
+    """ tracks with 4 decimal features, so that many means and quartiles fall on a rounding boundary. """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'artist_id': [f'ar{i}' for i in rng.integers(0, 5, n)],
+        'album_id': [f'al{i}' for i in rng.integers(0, albums, n)],
+    })
+    for x in an.FEATURES:
+        df[x] = rng.integers(0, 10 ** 4, n) / 10 ** 4
+    df['loudness'] = -rng.integers(0, 60000, n) / 1000
+    df['duration_ms'] = rng.integers(60000, 400000, n)
+    df['tempo'] = rng.integers(60000, 200000, n) / 1000
+    df['key'] = rng.integers(0, len(an.TONALITY), n).astype(float)
+    df['mode'] = rng.integers(0, len(an.MODE), n).astype(float)
+    df['time_signature'] = 4.
+    return df
+
+
+def described(df: pd.DataFrame, by: list) -> dict:
+    """ the summaries as describe() rounds them, group by group. """
+    summaries = {}
+    for key, group in df.groupby(by):
+        summary = group[an.MEASURES + an.FEATURES].describe().round(3).to_dict()
+        summaries[key] = [summary[x][y] for x in an.MEASURES + an.FEATURES for y in an.SUMMARY_STATS]
+    return summaries
+
+
+def test_summaries_round_like_describe():
+    df = tracks()
+    for by in (['artist_id'], ['artist_id', 'album_id']):
+        expected = described(df, by)
+        for row in an._summary_rows(df, by, 'ts'):
+            key = tuple(row[:len(by)])
+            summary = row[len(by) + len(an.MODE) * len(an.TONALITY):-1]
+            assert all(
+                x == y or (x != x and y != y) for (x, y) in zip(expected[key], summary) if y is not None
+            ), key
+
+
+def test_summaries_of_missing_ids():
+    df = tracks(n=50)
+    rows = an._summary_rows(df, ['artist_id'], 'ts', pd.Index(['ar0', 'missing'], name='artist_id'))
+    assert [x[0] for x in rows] == ['ar0', 'missing']
+    assert rows[1][1:-1] == tuple([0] * len(an.MODE) * len(an.TONALITY) + [None] * len(rows[0][25:-1]))
@@ -0,0 +1,70 @@
+import builder.handlers.ArtistasDB as dbAR
+
+
+def rows(handler, query: str) -> list:
+    return handler.query(query)
+
+
+def test_gone_albums_are_deleted_with_their_tracks(artistas, stub):
+    artistas.batch_create(['ar000001'])
+    stub.albums = 2
+    artistas.update_entry('ar000001')
+    assert rows(artistas, f"SELECT album_id FROM {dbAR.TABLES['ALBUMS']} ORDER BY album_id") == [
+        ('ar000001-al000',), ('ar000001-al001',)
+    ]
+    assert rows(artistas, f"SELECT count(*) FROM {dbAR.TABLES['TRACKS']} WHERE album_id = 'ar000001-al002'") == [(0,)]
+    assert rows(artistas, f"SELECT count(*) FROM {dbAR.TABLES['TRACKS']}") == [(2 * stub.tracks,)]
+
+
+def test_new_albums_fetch_only_their_tracks(artistas, stub):
+    artistas.batch_create(['ar000001'])
+    stub.albums = 4
+    stub.reset_stats()
+    artistas.update_entry('ar000001')
+    assert stub.stats()['album_tracks'] == 1
+    assert rows(artistas, f"SELECT count(*) FROM {dbAR.TABLES['TRACKS']}") == [(4 * stub.tracks,)]
+
+
+def test_incomplete_listings_delete_nothing(artistas, stub, monkeypatch):
+    artistas.batch_create(['ar000001'])
+    albums = artistas.api.albums
+
+    def incomplete(*args, **kwargs):
+        json_albums = albums(*args, **kwargs)
+        json_albums['items'], json_albums['complete'] = json_albums['items'][:1], False
+        return json_albums
+
+    monkeypatch.setattr(artistas.api, 'albums', incomplete)
+    artistas.update_entry('ar000001')
+    assert rows(artistas, f"SELECT count(*) FROM {dbAR.TABLES['ALBUMS']}") == [(3,)]
+
+
+def test_related_and_listeners_refresh_slowly(artistas, stub, monkeypatch):
+    artistas.batch_create(['ar000001'])
+    stub.reset_stats()
+    artistas.update_entry('ar000001')
+    assert 'artist_related_artists' not in stub.stats() and 'html' not in stub.stats()
+
+    monkeypatch.setattr(dbAR, 'SLOW_REFRESH', -1)
+    stub.related, stub.seed = 1, 1
+    artistas.update_entry('ar000001')
+    assert stub.stats()['artist_related_artists'] == 1 and stub.stats()['html'] == 1
+    related = rows(artistas, f"SELECT count(*) FROM {dbAR.TABLES['RELATED']} WHERE relationship = 'related'")
+    assert related == [(1,)]
+    assert rows(artistas, f"SELECT count(*) FROM {dbAR.TABLES['LISTENERS']}") == [(5,)]
+
+
+def test_shared_albums_stay_with_their_artist(artistas, stub):
+    stub.shared_albums = 1
+    artistas.batch_create(['ar000001', 'ar000002'])
+    owner = f"SELECT artist_id FROM {dbAR.TABLES['ALBUMS']} WHERE album_id = 'shared-al000'"
+    assert rows(artistas, owner) == [('ar000001',)]
+    for _ in range(2):
+        stub.reset_stats()
+        artistas.update_entry('ar000002')
+        artistas.update_entry('ar000001')
+        assert 'album_tracks' not in stub.stats() and 'audio_features' not in stub.stats()
+        assert rows(artistas, owner) == [('ar000001',)]
+    assert rows(artistas, f"""
+        SELECT DISTINCT artist_id FROM {dbAR.TABLES['TRACKS']} WHERE album_id = 'shared-al000'
+    """) == [('ar000001',)]